@@ -0,0 +1,145 @@
+""" Benchmark the page contour search on the edge masks of synthetic cluttered
+photos, comparing ocr.get_contour_from_mask against the original search
+
+python -m benchmark.contours [--images 10] [--repeats 5] [--size 1024]
+"""
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from benchmark import synthetic
+from ocrcode import ocr
+from ocrcode.pipeline import PipelineConfig
+
+
+def legacy_get_contour_from_mask(
+    mask: np.array, min_area: int, epsilon: int, contour_check: np.array
+) -> np.array:
+    """ the original contour search, kept as the benchmark baseline: every
+    boundary point, drawing every contour and simplifying in findContours
+    order """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    largest_quadrilateral = np.array([[[0, 0]], [[10, 0]], [[0, 10]], [[10, 10]]])
+    largest_area = min_area
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        cv2.drawContours(contour_check, contour, -1, (255, 0, 0), 3)
+        if area > largest_area:
+            perimeter = cv2.arcLength(contour, closed=True)
+            simplified = cv2.approxPolyDP(
+                contour, epsilon=(epsilon * perimeter), closed=True
+            )
+            if len(simplified) == 4:
+                largest_quadrilateral = simplified
+                largest_area = area
+    return largest_quadrilateral
+
+
+def make_masks(images: int, size: int, config: PipelineConfig) -> List[Dict]:
+    """ build the edge masks the pipeline would search for a page
+
+    Args:
+        images (int): number of synthetic photos
+        size (int): longest side of the mask in pixels
+        config (PipelineConfig): preprocessing parameters
+
+    Returns:
+        list(dict): the scaled photo, its mask and its number of contours
+    """
+    masks = []
+    for seed in range(images):
+        photo, _ = synthetic.make_document(4, seed=seed)
+        scaled = ocr.scale_longest_axis(photo, new_size=size)
+        mask = ocr.preprocess_image(
+            scaled,
+            blur=config.processing_blur,
+            threshold_high=config.threshold_high,
+            threshold_low=config.threshold_low,
+            kernel_size=config.kernel_size,
+        )
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        masks.append({"image": scaled, "mask": mask, "contours": len(contours)})
+    return masks
+
+
+def time_search(
+    search: Callable[[Dict], np.array], masks: List[Dict], repeats: int
+) -> Dict[str, float]:
+    """ time a contour search over every mask
+
+    Args:
+        search (callable): runs the search on one entry from make_masks
+        masks (list(dict)): entries from make_masks
+        repeats (int): times each mask is searched
+
+    Returns:
+        dict: contours searched per second and median milliseconds per mask
+    """
+    times = []
+    for entry in masks:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            search(entry)
+            times.append(time.perf_counter() - start)
+    contours = sum(entry["contours"] for entry in masks) * repeats
+    return {
+        "contours_per_second": contours / sum(times),
+        "milliseconds": float(np.median(times)) * 1000,
+    }
+
+
+def main(args: List[str]) -> int:
+    """ run the benchmark and print contours per second before and after
+
+    Args:
+        args (list(str)): command line arguments excluding the program name
+
+    Returns:
+        int: 0 on success, 1 if the searches disagree on any page
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the contour search")
+    parser.add_argument("--images", type=int, default=10, help="Synthetic photos")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per photo")
+    parser.add_argument("--size", type=int, default=1024, help="Mask size")
+    parsed = parser.parse_args(args)
+
+    config = PipelineConfig()
+    masks = make_masks(parsed.images, parsed.size, config)
+
+    def legacy(entry):
+        # the original always drew onto a copy of the photo
+        contour_check = np.copy(entry["image"])
+        return legacy_get_contour_from_mask(
+            entry["mask"], config.min_area, config.epsilon, contour_check
+        )
+
+    def current(entry):
+        return ocr.get_contour_from_mask(
+            entry["mask"], config.min_area, config.epsilon, verbose=False
+        )
+
+    disagreements = sum(
+        not np.array_equal(
+            ocr.order_quadrilateral(legacy(entry)),
+            ocr.order_quadrilateral(current(entry)),
+        )
+        for entry in masks
+    )
+    for name, search in (("legacy", legacy), ("current", current)):
+        report = time_search(search, masks, parsed.repeats)
+        print(
+            f"{name:>8}: {report['contours_per_second']:.0f} contours/s "
+            f"{report['milliseconds']:.2f}ms per mask"
+        )
+    print(f"{disagreements} of {len(masks)} pages found differently")
+    return 1 if disagreements else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,151 @@
+""" Benchmark the ocrcode pipeline stages on synthetic documents and compare
+against stored baselines
+
+python -m benchmark.run_benchmarks [--sizes 1 12 48] [--images 5]
+    [--save-baseline FILE] [--baseline FILE] [--threshold 0.25]
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+from benchmark import synthetic
+from ocrcode.pipeline import DocumentPipeline, PipelineConfig
+
+# photo sizes in megapixels benchmarked by default
+DEFAULT_SIZES = (1, 4, 12, 48)
+# report entries that are not stage latencies in milliseconds
+NOT_LATENCIES = ("images_per_second", "failures")
+
+
+class NullEngine:
+    """ skips OCR so only our own stages are measured """
+
+    def image_to_string(self, image: np.array) -> str:
+        return ""
+
+
+def benchmark_size(
+    pipeline: DocumentPipeline, megapixels: float, images: int, repeats: int
+) -> Dict[str, float]:
+    """ time every pipeline stage on synthetic documents of one size
+
+    Args:
+        pipeline (DocumentPipeline): the pipeline to benchmark
+        megapixels (float): size of the synthetic photos
+        images (int): number of distinct synthetic photos
+        repeats (int): times each photo is processed
+
+    Returns:
+        dict: median latency in milliseconds per stage, plus total latency,
+            throughput in images per second and the number of failed photos
+    """
+    stage_times: Dict[str, List[float]] = {}
+    totals = []
+    failures = 0
+    for seed in range(images):
+        photo, _ = synthetic.make_document(megapixels, seed=seed)
+        for _ in range(repeats):
+            try:
+                result = pipeline.process(photo)
+            except Exception:  # pylint: disable=broad-except
+                # eg no page found, these are reported but not timed
+                failures += 1
+                continue
+            for stage, seconds in result.timings.items():
+                stage_times.setdefault(stage, []).append(seconds * 1000)
+            totals.append(sum(result.timings.values()))
+    report = {stage: float(np.median(times)) for stage, times in stage_times.items()}
+    if totals:
+        report["total"] = float(np.median(totals)) * 1000
+        report["images_per_second"] = 1 / float(np.median(totals))
+    report["failures"] = failures
+    return report
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """ compare stage latencies to a baseline
+
+    Args:
+        results (dict): latencies per size per stage from this run
+        baseline (dict): latencies per size per stage from the baseline
+        threshold (float): allowed fractional slow down, eg 0.25 for 25%
+
+    Returns:
+        list(str): a description of every stage slower than allowed
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, latency in stages.items():
+            if stage in NOT_LATENCIES or stage not in baseline.get(size, {}):
+                continue
+            limit = baseline[size][stage] * (1 + threshold)
+            if latency > limit:
+                regressions.append(
+                    f"{size} {stage}: {latency:.1f}ms against baseline "
+                    f"{baseline[size][stage]:.1f}ms"
+                )
+    return regressions
+
+
+def main(args: List[str]) -> int:
+    """ run the benchmarks, returning a non zero exit code on regression
+
+    Args:
+        args (list(str)): command line arguments excluding the program name
+
+    Returns:
+        int: 0 on success, 1 if any stage regressed beyond the threshold
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the ocrcode stages")
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="Megapixels"
+    )
+    parser.add_argument("--images", type=int, default=3, help="Photos per size")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per photo")
+    parser.add_argument("--baseline", type=str, help="Baseline JSON to compare to")
+    parser.add_argument("--save-baseline", type=str, help="Save results as baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Allowed fractional slow down"
+    )
+    parsed = parser.parse_args(args)
+
+    pipeline = DocumentPipeline(PipelineConfig(), engine=NullEngine())
+    results = {}
+    for megapixels in parsed.sizes:
+        size = f"{megapixels:g}MP"
+        results[size] = benchmark_size(
+            pipeline, megapixels, parsed.images, parsed.repeats
+        )
+        stages = " ".join(
+            f"{stage} {latency:.1f}ms"
+            for stage, latency in results[size].items()
+            if stage not in NOT_LATENCIES
+        )
+        print(
+            f"{size:>6}: {results[size].get('images_per_second', 0):.1f} images/s "
+            f"{results[size]['failures']} failed {stages}"
+        )
+
+    if parsed.save_baseline:
+        with open(parsed.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if parsed.baseline:
+        with open(parsed.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, parsed.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
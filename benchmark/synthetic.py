@@ -0,0 +1,124 @@
+""" Deterministic synthetic document generator for benchmarking. Renders pages
+of text and perspective warps them onto cluttered backgrounds """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import math
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# letters used to build random words
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+# width / height of generated photos
+ASPECT = 4 / 3
+
+
+def render_page(width: int, height: int, rng: np.random.Generator) -> np.array:
+    """ render a white page covered in lines of random words
+
+    Args:
+        width (int): page width in pixels
+        height (int): page height in pixels
+        rng (np.random.Generator): source of randomness
+
+    Returns:
+        np.array: BGR page image
+    """
+    page = np.full((height, width, 3), 245, np.uint8)
+    # scale the font so there are roughly 40 lines on the page
+    line_height = max(height // 40, 8)
+    font_scale = line_height / 40
+    thickness = max(int(font_scale * 2), 1)
+    margin = width // 12
+    for baseline in range(margin + line_height, height - margin, line_height):
+        words = rng.integers(3, 12, size=rng.integers(3, 7))
+        line = " ".join(
+            "".join(rng.choice(list(ALPHABET), size=length)) for length in words
+        )
+        cv2.putText(
+            page,
+            line,
+            (margin, baseline),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            font_scale,
+            (20, 20, 20),
+            thickness,
+            cv2.LINE_AA,
+        )
+    return page
+
+
+def make_background(width: int, height: int, rng: np.random.Generator) -> np.array:
+    """ make a dark cluttered background of noise, shapes and lines
+
+    Args:
+        width (int): background width in pixels
+        height (int): background height in pixels
+        rng (np.random.Generator): source of randomness
+
+    Returns:
+        np.array: BGR background image
+    """
+    # low resolution noise scaled up gives a mottled desk like texture
+    noise = rng.integers(30, 110, size=(height // 32 + 1, width // 32 + 1, 3))
+    background = cv2.resize(
+        noise.astype(np.uint8), (width, height), interpolation=cv2.INTER_LINEAR
+    )
+    size = min(width, height)
+    for _ in range(40):
+        colour = tuple(int(value) for value in rng.integers(0, 160, size=3))
+        centre = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            radius = int(rng.integers(size // 80 + 1, size // 10 + 2))
+            cv2.circle(background, centre, radius, colour, -1)
+        else:
+            # keep lines short so they rarely merge with the page outline
+            end = tuple(
+                int(value) for value in centre + rng.integers(-1, 2, 2) * size // 8
+            )
+            cv2.line(background, centre, end, colour, max(size // 300, 1))
+    return background
+
+
+def make_document(megapixels: float, seed: int = 0) -> Tuple[np.array, np.array]:
+    """ make a photo of a page of text lying at an angle on a cluttered desk.
+    The same megapixels and seed always give the same image
+
+    Args:
+        megapixels (float): size of the generated photo
+        seed (int, optional): random seed. Defaults to 0
+
+    Returns:
+        tuple(np.array, np.array): BGR photo, 4x2 page corners ordered top left,
+            top right, bottom left, bottom right
+    """
+    rng = np.random.default_rng(seed)
+    height = int(math.sqrt(megapixels * 1e6 / ASPECT))
+    width = int(height * ASPECT)
+    background = make_background(width, height, rng)
+    # A4 proportions, filling around 60% of the photo height
+    page_height = int(height * 0.6)
+    page_width = int(page_height / math.sqrt(2))
+    page = render_page(page_width, page_height, rng)
+    # jitter the corners of a centred rectangle to fake a perspective view
+    left, top = (width - page_width) // 2, (height - page_height) // 2
+    corners = np.float32(
+        [
+            [left, top],
+            [left + page_width, top],
+            [left, top + page_height],
+            [left + page_width, top + page_height],
+        ]
+    )
+    corners += rng.uniform(-0.08, 0.08, size=(4, 2)).astype(np.float32) * page_height
+    source = np.float32(
+        [[0, 0], [page_width, 0], [0, page_height], [page_width, page_height]]
+    )
+    transform = cv2.getPerspectiveTransform(source, corners)
+    warped = cv2.warpPerspective(page, transform, (width, height))
+    mask = cv2.warpPerspective(
+        np.full((page_height, page_width), 255, np.uint8), transform, (width, height)
+    )
+    photo = np.where(mask[:, :, None] > 0, warped, background)
+    return photo, corners
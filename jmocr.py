@@ -1,15 +1,32 @@
 """ This is the core script for the document reader """
 # pylint: disable=E1101 no-member
 # this pylint disable is needed due to poor behaviour inside cv2
+import argparse
 import cv2
+import dataclasses
+import functools
+import json
 import numpy as np
 import os
-import pytesseract
 import sys
+from typing import List, Union
 
 # import our helpers
 from ocrcode import ocr
 from ocrcode import arguments
+from ocrcode import batch
+from ocrcode import capture
+from ocrcode import dedup
+from ocrcode import engines
+from ocrcode import large
+from ocrcode import sinks
+from ocrcode import sources
+from ocrcode import tuning
+from ocrcode.cache import DEFAULT_CACHE_BYTES, ResultCache, parameters_hash
+from ocrcode.pipeline import DocumentPipeline, PipelineConfig, Result
+from ocrcode.profiling import ProfileWriter
+from ocrcode.server import OCRServer, serve as run_server
+from ocrcode.settings import Settings, default_tesseract, load_settings
 
 # set up constants to help with openCV's magic numbers
 WAIT_UNTIL_PRESSED = 0
@@ -28,103 +45,566 @@ EPSILON = 0.02
 CONTRAST = 1.3
 BRIGHTNESS = 10
 # pytesseract path (for interoperability)
-# May be set to set None if PATH variable is set on system
-# see https://stackoverflow.com/questions/50655738/
-TESSERACT_PATH = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
+# None runs tesseract from the PATH, which is found at the Windows install
+# location instead when it is not on the PATH. -t or a settings file can also
+# give it, see https://stackoverflow.com/questions/50655738/
+TESSERACT_PATH = default_tesseract()
+
+# the default pipeline configuration built from the constants above
+CONFIG = PipelineConfig(
+    processing_size=PROCESSING_SIZE,
+    processing_blur=PROCESSING_BLUR,
+    threshold_high=THRESHOLD_HIGH,
+    threshold_low=THRESHOLD_LOW,
+    kernel_size=KERNEL_SIZE,
+    min_area=MIN_AREA,
+    epsilon=EPSILON,
+    contrast=CONTRAST,
+    brightness=BRIGHTNESS,
+    tesseract_cmd=TESSERACT_PATH,
+)
+# the default settings of a run, which presets, settings files and command
+# line options are layered over, see ocrcode.settings
+SETTINGS = Settings(pipeline=CONFIG)
+
+
+def load_run_settings(options: argparse.Namespace, names: tuple = None) -> Settings:
+    """ Layer the preset, settings file and options given on the command line
+    over SETTINGS, checking them once before any image is read
+
+    Args:
+        options (argparse.Namespace): parsed options, see arguments.parse_given
+        names (tuple(str), optional): the options that may override settings,
+            see arguments.settings_overrides. Defaults to all of them
+
+    Returns:
+        Settings: the validated settings
+    """
+    settings = load_settings(
+        options.config,
+        options.preset,
+        arguments.settings_overrides(options, names),
+        base=SETTINGS,
+    )
+    arguments.validate_tesseract(settings.pipeline.tesseract_cmd)
+    return settings
+
+
+@functools.lru_cache(maxsize=None)
+def get_pipeline(config: PipelineConfig, verbose: bool = False) -> DocumentPipeline:
+    """ Get this process's pipeline for a config, so that pool workers build
+    their pipeline (and OCR engine) once and reuse it for every image
+
+    Args:
+        config (PipelineConfig): pipeline parameters
+        verbose (bool, optional): display intermediate steps. Defaults to False
+
+    Returns:
+        DocumentPipeline: the pipeline
+    """
+    return DocumentPipeline(config, verbose=verbose)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cache(cache_dir: str, max_bytes: int) -> ResultCache:
+    """ Get this process's result cache for a directory
+
+    Args:
+        cache_dir (str): the cache directory
+        max_bytes (int): size limit of the cache
+
+    Returns:
+        ResultCache: the cache
+    """
+    return ResultCache(cache_dir, max_bytes)
 
-if __name__ == "__main__":
-    # ingest our program parameters
-    paths, save_path, verbose, tesseract = arguments.argument_parser(sys.argv[1:])
-    paths = arguments.paths_to_files(paths)
-    # save directory defaults to cwd if -s specified without directory
-    save_path = arguments.validate_save(save_path)
-    tesseract = arguments.validate_tesseract(tesseract)
 
-    # point pytesseract at custom install location if required
-    if tesseract is not None:
-        pytesseract.pytesseract.tesseract_cmd = tesseract
+@functools.lru_cache(maxsize=None)
+def get_index(path: str, max_distance: int, parameters: str) -> dedup.DuplicateIndex:
+    """ Get this process's duplicate index for a file
+
+    Args:
+        path (str): the SQLite index file
+        max_distance (int): most differing bits for pages to be duplicates
+        parameters (str): hash of the pipeline parameters and OCR engine, see
+            parameters_hash
+
+    Returns:
+        dedup.DuplicateIndex: the index
+    """
+    return dedup.DuplicateIndex(path, max_distance, parameters=parameters)
+
+
+def process_image(
+    full_path: Union[str, sources.Page],
+    config: PipelineConfig = CONFIG,
+    save_path: str = None,
+    verbose: bool = False,
+    cache_dir: str = None,
+    cache_size: int = DEFAULT_CACHE_BYTES,
+    keep_image: bool = False,
+    dedup_index: str = None,
+    dedup_distance: int = dedup.DEFAULT_MAX_DISTANCE,
+) -> Result:
+    """ Run the full OCR pipeline on a single image file or page, optionally
+    saving the text and the straightened image. Defined at module level so that
+    it can be sent to worker processes
+
+    Args:
+        full_path (str or sources.Page): absolute path to the image, or a page
+            of a multi-page file
+        config (PipelineConfig, optional): pipeline parameters. Defaults to CONFIG
+        save_path (str, optional): directory to save outputs to. Defaults to None
+        verbose (bool, optional): display intermediate steps. Defaults to False
+        cache_dir (str, optional): directory of a result cache to reuse results
+            from unchanged images. Defaults to None
+        cache_size (int, optional): size limit of the cache in bytes. Defaults
+            to DEFAULT_CACHE_BYTES
+        keep_image (bool, optional): return the straightened image, eg for an
+            output sink. Defaults to False
+        dedup_index (str, optional): SQLite file of earlier pages, a page
+            matching one of them reuses its OCR result. Defaults to None
+        dedup_distance (int, optional): most differing hash bits for pages to
+            be duplicates. Defaults to dedup.DEFAULT_MAX_DISTANCE
+
+    Returns:
+        Result: the pipeline result, without the image unless keep_image is
+            set to keep it cheap to send back from worker processes
+    """
+    pipeline = get_pipeline(config, verbose)
+    page = full_path if isinstance(full_path, sources.Page) else sources.Page(full_path)
+    raw_image = None
+    if sources.is_document(page.path):
+        # identify a page of a document by its pixels, reading the whole
+        # document for every page would be far slower
+        raw_image = sources.read_page(page)
+        data = str(raw_image.shape).encode("utf-8") + raw_image.tobytes()
     else:
-        pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
-    # get our list of paths
-    paths = ocr.get_paths(*paths)
-    # cycle through our paths
-    for full_path in paths:
-        # open file
-        raw_image = cv2.imread(full_path, cv2.IMREAD_COLOR)
-        # scale file to something manageable
-        scaled_image = ocr.scale_longest_axis(raw_image, new_size=PROCESSING_SIZE)
-        # perform our preprocessing
-        preprocessed_image = ocr.preprocess_image(
-            image=scaled_image,
-            blur=PROCESSING_BLUR,
-            threshold_high=THRESHOLD_HIGH,
-            threshold_low=THRESHOLD_LOW,
-            kernel_size=KERNEL_SIZE,
-        )
-        if verbose:
-            cv2.imshow("preprocessed_image", preprocessed_image)
-        contour_check = np.copy(scaled_image)
-        # get our largest quadrilateral contour
-        paper_contour = ocr.get_contour_from_mask(
-            mask=preprocessed_image,
-            min_area=MIN_AREA,
-            epsilon=EPSILON,
-            contour_check=contour_check,
-            verbose=verbose,
-        )
-        if verbose:
-            print(paper_contour)
-
-        # make sure we have our points in the correct order for the transformation
-        ordered_paper_contour = ocr.order_quadrilateral(quad=paper_contour)
-        if verbose:
-            print(ordered_paper_contour)
-        # apply transformation to image
-        unwarped_paper = ocr.unwarp_quadrilateral(
-            image=scaled_image,
-            quad=ordered_paper_contour,
-            # trim the edge 2% off to cope with imperfect transforms
-            margin=int(PROCESSING_SIZE * 0.02),
+        # open file, keeping the raw bytes to identify the image in the cache
+        with open(page.path, "rb") as image_file:
+            data = image_file.read()
+    result, cache_key = None, None
+    with_image = save_path is not None or keep_image
+    if cache_dir is not None or dedup_index is not None:
+        parameters = parameters_hash(config, pipeline.engine.version())
+    if cache_dir is not None:
+        cache = get_cache(cache_dir, cache_size)
+        cache_key = cache.key(data, parameters)
+        result = cache.get(cache_key, with_image=with_image)
+    if result is None:
+        if raw_image is None:
+            raw_image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if raw_image is None:
+            raise IOError(f"unable to read image {page}")
+        if dedup_index is None:
+            result = pipeline.process(raw_image)
+        else:
+            clean_paper, result = pipeline.rectify(raw_image)
+            result = get_index(dedup_index, dedup_distance, parameters).recognise(
+                pipeline, str(page), clean_paper, result
+            )
+        if cache_key is not None:
+            cache.put(cache_key, result, with_image=with_image)
+
+    if save_path is not None:
+        save_result(result, page.path, save_path, page.suffix, verbose)
+
+    if verbose:
+        cv2.waitKey(WAIT_UNTIL_PRESSED)
+        # cv2.destroyAllWindows()
+    return result if keep_image else dataclasses.replace(result, image=None)
+
+
+def process_documents(
+    full_path: Union[str, sources.Page],
+    config: PipelineConfig = CONFIG,
+    save_path: str = None,
+    verbose: bool = False,
+    keep_image: bool = False,
+) -> List[Result]:
+    """ Run the OCR pipeline on every separate document in a single image file,
+    eg several receipts photographed together. Outputs are saved with the
+    index of each document, largest first
+
+    Args:
+        full_path (str or sources.Page): absolute path to the image, or a page
+            of a multi-page file
+        config (PipelineConfig, optional): pipeline parameters. Defaults to CONFIG
+        save_path (str, optional): directory to save outputs to. Defaults to None
+        verbose (bool, optional): display intermediate steps. Defaults to False
+        keep_image (bool, optional): return the straightened images, eg for
+            an output sink. Defaults to False
+
+    Returns:
+        list(Result): the result for each document, without the images unless
+            keep_image is set
+
+    Raises:
+        ValueError: if no documents were found
+    """
+    pipeline = get_pipeline(config, verbose)
+    page = full_path if isinstance(full_path, sources.Page) else sources.Page(full_path)
+    results = pipeline.process_all(sources.read_page(page))
+    if not results:
+        raise ValueError(f"no documents found in {page}")
+    if save_path is not None:
+        for index, result in enumerate(results):
+            save_result(result, page.path, save_path, f"{page.suffix}_{index}", verbose)
+    if verbose:
+        cv2.waitKey(WAIT_UNTIL_PRESSED)
+    if keep_image:
+        return results
+    return [dataclasses.replace(result, image=None) for result in results]
+
+
+def process_large(
+    full_path: str,
+    config: PipelineConfig = CONFIG,
+    save_path: str = None,
+    verbose: bool = False,
+    memory_limit: int = large.DEFAULT_MEMORY_LIMIT,
+    raw_cache_dir: str = None,
+) -> Result:
+    """ Run the OCR pipeline on a very large image file within a memory limit,
+    see ocrcode.large
+
+    Args:
+        full_path (str): absolute path to the image
+        config (PipelineConfig, optional): pipeline parameters. Defaults to CONFIG
+        save_path (str, optional): directory to save outputs to. Defaults to None
+        verbose (bool, optional): report the files written. Defaults to False
+        memory_limit (int, optional): memory allowed in bytes. Defaults to
+            large.DEFAULT_MEMORY_LIMIT
+        raw_cache_dir (str, optional): directory to keep decoded copies of the
+            image in for later runs. Defaults to None
+
+    Returns:
+        Result: the pipeline result, without the image
+
+    Raises:
+        ValueError: if the file is a PDF or a multi-page TIFF
+    """
+    # large scans are read with reduced decodes, which only see single images
+    if sources.is_document(full_path) and (
+        full_path.lower().endswith(sources.PDF_EXTENSIONS)
+        or sources.page_count(full_path) > 1
+    ):
+        raise ValueError(
+            f"{full_path} is a multi-page document, which -l can not read; "
+            "run without -l to process its pages"
         )
-        # improve contrast (keep seperate as we could save this out to disc)
-        # see https://stackoverflow.com/questions/39308030
-        levelled_image = cv2.addWeighted(
-            unwarped_paper,
-            alpha=CONTRAST,
-            src2=unwarped_paper,
-            beta=0,
-            gamma=BRIGHTNESS,
+    # large images are never displayed so the pipeline is not verbose
+    pipeline = get_pipeline(config, False)
+    result = large.process_large_image(
+        pipeline, full_path, memory_limit=memory_limit, cache_dir=raw_cache_dir
+    )
+    if save_path is not None:
+        save_result(result, full_path, save_path, verbose=verbose)
+    return dataclasses.replace(result, image=None)
+
+
+def save_result(
+    result: Result,
+    full_path: str,
+    save_path: str,
+    suffix: str = "",
+    verbose: bool = False,
+) -> None:
+    """ Save the text and straightened image of a result next to each other
+
+    Args:
+        result (Result): the pipeline result
+        full_path (str): path of the input image, used to name the outputs
+        save_path (str): directory to save outputs to
+        suffix (str, optional): added to the output names, eg a document
+            index. Defaults to ""
+        verbose (bool, optional): report the files written. Defaults to False
+    """
+    if result.rejected:
+        # nothing was straightened or OCRed
+        return
+    # use the existing filenames as a basis
+    raw_file_name = os.path.splitext(os.path.basename(full_path))[0]
+    # save our ocr text to a file
+    text_path = save_path + raw_file_name + "_ocr" + suffix + ".txt"
+    with open(text_path, "w") as text_file:
+        text_file.write(result.text)
+    # ensure a novel name for the corrected image output
+    image_path = save_path + raw_file_name + "_fix" + suffix + ".png"
+    cv2.imwrite(image_path, result.image)
+    if verbose:
+        print(f"cleaned image written to {image_path}, ocr text to {text_path}")
+
+
+def tune(args: list) -> None:
+    """ Search the detection and levelling parameters against labelled
+    samples, print the Pareto front of accuracy and time and write the chosen
+    parameters as a config file, see ocrcode.tuning
+
+    Args:
+        args (list(str)): command line arguments after "tune"
+    """
+    options = arguments.parse_tune_options(args)
+    config = load_run_settings(options, arguments.PIPELINE_OPTIONS).pipeline
+    workers = arguments.validate_workers(options.workers)
+    samples = tuning.load_samples(
+        ocr.iter_paths(arguments.iter_image_files(options.samples))
+    )
+    trials = tuning.make_trials(count=options.trials, seed=options.seed, base=config)
+    print(f"{len(trials)} trials on {len(samples)} samples", file=sys.stderr)
+    results = tuning.tune(samples, trials, config, workers=workers)
+    front = tuning.pareto_front(results)
+    chosen = tuning.choose_trial(front, options.max_seconds)
+    # the first trial is the starting config
+    print(
+        f"starting point: accuracy {results[0].accuracy:.3f}, "
+        f"{results[0].seconds * 1000:.1f}ms",
+        file=sys.stderr,
+    )
+    print("accuracy  time/image  parameters")
+    for trial in front:
+        marker = "*" if trial is chosen else " "
+        parameters = " ".join(f"{k}={v}" for k, v in trial.parameters.items())
+        print(
+            f"{marker}{trial.accuracy:7.3f} {trial.seconds * 1000:9.1f}ms  {parameters}"
         )
-        if verbose:
-            cv2.imshow("test_image", levelled_image)
-        # COULD SAVE IMAGE TO DISC HERE
+    values = dataclasses.replace(config, **chosen.parameters).to_dict()
+    # the tesseract location belongs to the machine, not the tuning
+    values.pop("tesseract_cmd")
+    with open(options.output, "w") as config_file:
+        json.dump(values, config_file, indent=2)
+    print(f"config written to {options.output}", file=sys.stderr)
+    if options.report is not None:
+        with open(options.report, "w") as report_file:
+            json.dump(
+                {
+                    "trials": [trial._asdict() for trial in results],
+                    "front": [trial._asdict() for trial in front],
+                    "chosen": chosen._asdict(),
+                },
+                report_file,
+                indent=2,
+            )
 
-        clean_paper = ocr.improve_image_quality(image=levelled_image, verbose=verbose)
 
-        # TBD text detection (fast and avoids trying to detect non existent text)
+def serve(args: list) -> None:
+    """ Run jmocr as an HTTP service, see ocrcode.server
 
-        # pass to tesseract for OCR
-        ocr_text = pytesseract.image_to_string(clean_paper, lang="eng")
+    Args:
+        args (list(str)): command line arguments after "serve"
+    """
+    options = arguments.parse_serve_options(args)
+    config = load_run_settings(options, arguments.PIPELINE_OPTIONS).pipeline
+    # one engine shared by all OCR threads, kept warm between requests
+    ocr_engine = engines.get_engine(
+        config.engine,
+        lang=config.lang,
+        tesseract_cmd=config.tesseract_cmd,
+        size=options.ocr_concurrency,
+    )
+    server = OCRServer(
+        DocumentPipeline(config, engine=ocr_engine),
+        workers=options.workers,
+        ocr_concurrency=options.ocr_concurrency,
+        max_pending=options.max_pending,
+        timeout=options.timeout,
+    )
+    run_server(server, options.host, options.port)
 
-        if verbose:
-            print(preprocessed_image.shape)
-            print(type(preprocessed_image))
 
-        # output OCRed text (may be the only output with non-verbose non-save)
-        print(ocr_text)
+def scan(args: list) -> None:
+    """ OCR pages held up to a camera or in a video file, see ocrcode.capture
 
-        if save_path is not None:
-            # use the existing filenames as a basis
-            raw_file_name = os.path.splitext(os.path.basename(full_path))[0]
-            # save our ocr text to a file
-            text_path = save_path + raw_file_name + "_ocr.txt"
-            with open(text_path, "w") as text_file:
-                text_file.write(ocr_text)
-            # ensure a novel name for the corrected image output
-            image_path = save_path + raw_file_name + "_fix.png"
-            cv2.imwrite(image_path, levelled_image)
-            if verbose:
-                print(f"cleaned image written to {image_path}, ocr text to {text_path}")
+    Args:
+        args (list(str)): command line arguments after "capture"
+    """
+    options = arguments.parse_capture_options(args)
+    save_path = arguments.validate_save(options.save)
+    config = load_run_settings(options, arguments.PIPELINE_OPTIONS).pipeline
+    # one engine shared by the OCR threads
+    ocr_engine = engines.get_engine(
+        config.engine,
+        lang=config.lang,
+        tesseract_cmd=config.tesseract_cmd,
+        size=options.workers,
+    )
+    pipeline = DocumentPipeline(config, engine=ocr_engine)
+    tracker = capture.PageTracker(
+        config,
+        stable_frames=options.stable_frames,
+        min_sharpness=options.min_sharpness,
+    )
+    sink = sinks.open_sink(options.output) if options.output is not None else None
+    try:
+        for captured in capture.capture(
+            pipeline,
+            options.source,
+            workers=options.workers,
+            tracker=tracker,
+            display=options.verbose,
+        ):
+            index, result = captured.item, captured.value
+            name = f"{options.source} [frame {index}]"
+            if captured.error is not None:
+                # keep scanning, the page can be held up again
+                print(f"failed to process {name}: {captured.error}", file=sys.stderr)
+                continue
+            if save_path is not None:
+                save_result(result, options.source, save_path, f"_frame{index}")
+            if sink is not None:
+                sink.write(name, result)
+            if result.rejected:
+                reasons = ", ".join(result.quality.reasons)
+                print(f"rejected {name}: {reasons}", file=sys.stderr)
+                continue
+            print(f"==> {name} <==")
+            print(result.text, flush=True)
+    finally:
+        if sink is not None:
+            sink.close()
 
-        cv2.waitKey(WAIT_UNTIL_PRESSED)
-        # cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ["capture"]:
+        scan(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ["tune"]:
+        tune(sys.argv[2:])
+        sys.exit()
+    # ingest our program parameters
+    options = arguments.parse_options(sys.argv[1:])
+    verbose = options.verbose
+    # save directory defaults to cwd if -s specified without directory
+    save_path = arguments.validate_save(options.save)
+    # defaults, then the preset, the settings file and the options given
+    settings = load_run_settings(options)
+    workers = arguments.validate_workers(settings.workers, verbose)
+    config = dataclasses.replace(
+        settings.pipeline,
+        # document_workers > 1 would oversubscribe the batch workers. Worker
+        # counts are left out of the cache and dedup parameters, so runs with
+        # any -w share their results
+        document_workers=(
+            1 if verbose or workers > 1 else max(settings.pipeline.document_workers, 2)
+        ),
+    )
+    # lazily list our paths so the first image starts processing straight away
+    paths = ocr.iter_paths(arguments.iter_image_files(options.paths))
+    # work on single pages so the pages of a long document run in parallel,
+    # large scans are read straight from their files, see process_large
+    items = paths if options.large else sources.iter_pages(paths)
+    # cycle through our paths, in parallel if we have more than one worker,
+    # otherwise overlapping reading the next image with OCR of the current one
+    threads = 1 if verbose else 2
+    if options.large:
+        # each image limits the heap of its process while it runs, in the
+        # same process or a worker, which a second thread would share
+        threads = 1
+        process = functools.partial(
+            process_large,
+            config=config,
+            save_path=save_path,
+            verbose=verbose,
+            memory_limit=settings.memory_limit * 1024 * 1024,
+            raw_cache_dir=(
+                os.path.join(settings.cache_dir, "raw") if settings.cache_dir else None
+            ),
+        )
+    elif options.multi:
+        # the cache holds a single result per image, so is not used here
+        process = functools.partial(
+            process_documents,
+            config=config,
+            save_path=save_path,
+            verbose=verbose,
+            keep_image=settings.output_images,
+        )
+    else:
+        process = functools.partial(
+            process_image,
+            config=config,
+            save_path=save_path,
+            verbose=verbose,
+            cache_dir=settings.cache_dir,
+            cache_size=settings.cache_size * 1024 * 1024,
+            keep_image=settings.output_images,
+            dedup_index=settings.dedup,
+            dedup_distance=settings.dedup_distance,
+        )
+    hits, misses = 0, 0
+    # name, original and distance of each duplicate page
+    duplicates = []
+    profile = ProfileWriter(settings.profile) if settings.profile else None
+    sink = None
+    if settings.output is not None:
+        sink = sinks.open_sink(
+            settings.output,
+            settings.output_format,
+            batch_size=settings.batch_size,
+            images=settings.output_images,
+        )
+    results = batch.run_batch(process, items, workers=workers, threads=threads)
+    try:
+        for result in results:
+            if result.error is not None:
+                # one bad image should not stop the rest of the batch
+                print(
+                    f"failed to process {result.item}: {result.error}", file=sys.stderr
+                )
+                continue
+            documents = result.value if options.multi else [result.value]
+            for index, document in enumerate(documents):
+                name = f"{result.item} [{index}]" if options.multi else str(result.item)
+                if document.cached:
+                    hits += 1
+                else:
+                    misses += 1
+                if profile is not None and not document.cached:
+                    profile.write(name, document.metrics)
+                if document.duplicate_of is not None:
+                    duplicates.append(
+                        (name, document.duplicate_of, document.duplicate_distance)
+                    )
+                if sink is not None:
+                    sink.write(name, document)
+                if document.rejected:
+                    reasons = ", ".join(document.quality.reasons)
+                    print(f"rejected {name}: {reasons}", file=sys.stderr)
+                    continue
+                # output OCRed text (may be the only output with non-verbose non-save)
+                multi_page = (
+                    isinstance(result.item, sources.Page) and result.item.count > 1
+                )
+                if workers > 1 or options.multi or multi_page:
+                    print(f"==> {name} <==")
+                print(document.text, flush=True)
+    finally:
+        # write out the results so far even if the run is interrupted
+        if sink is not None:
+            sink.close()
+    # the result cache is only used for single documents
+    if settings.cache_dir is not None and not (options.multi or options.large):
+        print(f"cache hits: {hits}, misses: {misses}", file=sys.stderr)
+    # duplicates are only looked for in single documents too
+    if settings.dedup is not None and not (options.multi or options.large):
+        clusters = dedup.duplicate_clusters(duplicates)
+        print(
+            f"duplicates: {len(duplicates)}, of {len(clusters)} earlier pages",
+            file=sys.stderr,
+        )
+        if settings.dedup_report is not None:
+            with open(settings.dedup_report, "w") as report_file:
+                json.dump(clusters, report_file, indent=2)
+    if profile is not None:
+        summary = profile.close()
+        # print a compact percentile table of wall times to stderr
+        for stage, stats in summary.items():
+            print(
+                f"{stage:>12}: p50 {stats['wall_p50'] * 1000:8.1f}ms "
+                f"p95 {stats['wall_p95'] * 1000:8.1f}ms "
+                f"p99 {stats['wall_p99'] * 1000:8.1f}ms",
+                file=sys.stderr,
+            )
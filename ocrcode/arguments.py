@@ -1,23 +1,149 @@
 import argparse
 import os
 import sys
-from typing import Union, List, Tuple
+from typing import Dict, Iterable, Iterator, Union, List, Tuple
 from unittest.mock import NonCallableMock
 
+from ocrcode.capture import MIN_SHARPNESS, STABLE_FRAMES
+from ocrcode.dedup import DEFAULT_MAX_DISTANCE
+from ocrcode.ocr import THRESHOLDS
+from ocrcode.quality import QualityPolicy
+from ocrcode.settings import PRESETS, parse_override
+from ocrcode.sinks import DEFAULT_BATCH_SIZE, SINKS
+from ocrcode.sources import DOCUMENT_EXTENSIONS
+from ocrcode.tuning import DEFAULT_TRIALS
 
-def argument_parser(args: List[str]) -> Tuple[List[str], str, bool, str]:
-    """ Use argparse to allow for the processing of input paths, a save location
-    and adjusting the verbosity of the program. we pass args explicitly to
-    simplify testing
+# file extensions of the images we can read
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+# every file extension we accept, including multi-page documents
+INPUT_EXTENSIONS = IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS
+# options that override settings, and the Settings or PipelineConfig field
+# each one sets
+SETTINGS_OPTIONS = {
+    "workers": "workers",
+    "engine": "engine",
+    "tesseract": "tesseract_cmd",
+    "profile": "profile",
+    "detect_text": "text_detection",
+    "fused": "fused_rectification",
+    "threshold": "threshold",
+    "retry_confidence": "retry_confidence",
+    "quality_gate": "quality_gate",
+    "output": "output",
+    "output_format": "output_format",
+    "output_images": "output_images",
+    "batch_size": "batch_size",
+    "memory_limit": "memory_limit",
+    "cache_dir": "cache_dir",
+    "cache_size": "cache_size",
+    "dedup": "dedup",
+    "dedup_distance": "dedup_distance",
+    "dedup_report": "dedup_report",
+}
+# the options of every subcommand that set pipeline parameters
+PIPELINE_OPTIONS = ("engine", "tesseract")
+
+
+def add_settings_options(parser: argparse.ArgumentParser) -> None:
+    """ add the options choosing a settings file, a preset and overrides of
+    single settings, see ocrcode.settings
 
     Args:
-        args (list(str)): list of sys.argv arguments excluding the program name 
+        parser (argparse.ArgumentParser): the parser to add them to
+    """
+    parser.add_argument(
+        "-c",
+        "--config",
+        required=False,
+        type=str,
+        default=None,
+        help="Load settings from this TOML, YAML or JSON file, eg from tune",
+    )
+    parser.add_argument(
+        "--preset",
+        required=False,
+        choices=tuple(PRESETS),
+        default=None,
+        help="Start from these settings, below --config and other options",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        metavar="NAME=VALUE",
+        action="append",
+        type=parse_override,
+        default=[],
+        help="Override any setting or pipeline parameter, may be repeated",
+    )
+
+
+def parse_given(parser: argparse.ArgumentParser, args: List[str]) -> argparse.Namespace:
+    """ parse args, noting which options were given rather than left at
+    their defaults, so that only those override the settings
+
+    Args:
+        parser (argparse.ArgumentParser): the parser
+        args (list(str)): the arguments
 
     Returns:
-        image_paths (list(str)): List of image paths
-        save_path (str): Directory path to save outputs to
-        verbose (bool): Whether or not to provide verbose output
-        tesseract_path (str): Absolute path to tesseract.exe 
+        argparse.Namespace: parsed options, with the names of those that were
+            given in "given"
+    """
+    options = parser.parse_args(args)
+    # parse again with a marker in place of each default, lists such as the
+    # --set overrides are appended to so keep theirs
+    missing = object()
+    parser.set_defaults(
+        **{
+            name: missing
+            for name, value in vars(options).items()
+            if not isinstance(value, list)
+        }
+    )
+    options.given = {
+        name
+        for name, value in vars(parser.parse_args(args)).items()
+        if value is not missing
+    }
+    return options
+
+
+def settings_overrides(
+    options: argparse.Namespace, names: Iterable[str] = None
+) -> Dict:
+    """ the settings given on the command line, for settings.load_settings:
+    the options given, under their settings names, then each --set
+
+    Args:
+        options (argparse.Namespace): options from parse_given
+        names (iterable(str), optional): the options in SETTINGS_OPTIONS to
+            take. Defaults to all of them
+
+    Returns:
+        dict: setting names to values
+    """
+    names = SETTINGS_OPTIONS if names is None else names
+    overrides = {
+        SETTINGS_OPTIONS[name]: getattr(options, name)
+        for name in names
+        if name in options.given
+    }
+    # -q gates pages with the default policy, a file can set its own
+    if overrides.get("quality_gate") is True:
+        overrides["quality_gate"] = QualityPolicy()
+    overrides.update(options.overrides)
+    return overrides
+
+
+def parse_options(args: List[str]) -> argparse.Namespace:
+    """ Use argparse to process every command line option of the program. We
+    pass args explicitly to simplify testing
+
+    Args:
+        args (list(str)): list of sys.argv arguments excluding the program name
+
+    Returns:
+        argparse.Namespace: parsed options, see the -h output for details
     """
     parser = argparse.ArgumentParser(
         description="Process images to straighten images and extract text",
@@ -27,7 +153,7 @@ def argument_parser(args: List[str]) -> Tuple[List[str], str, bool, str]:
         metavar="N",
         type=str,
         nargs="*",  # ? is zero or one, * is zero or more, + is one or more
-        help="File or folder paths. Files must be jpg, png or gif",
+        help="File or folder paths. Files must be jpg, png, gif, tif or pdf",
     )
     parser.add_argument(
         "-s",
@@ -53,7 +179,307 @@ def argument_parser(args: List[str]) -> Tuple[List[str], str, bool, str]:
         default=None,  # returned if argument not used
         help="Specify location of tesseract.exe",
     )
-    parsed = parser.parse_args(args)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        type=int,
+        default=1,
+        help="Number of worker processes to OCR images in parallel, 0 for all cores",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        required=False,
+        type=str,
+        choices=("auto", "pytesseract", "tesserocr"),
+        default=None,
+        help="OCR backend, auto (the default) uses tesserocr if installed else "
+        "pytesseract",
+    )
+    add_settings_options(parser)
+    parser.add_argument(
+        "-p",
+        "--profile",
+        required=False,
+        type=str,
+        default=None,
+        help="Write per stage timings for each image as JSON lines to this file",
+    )
+    parser.add_argument(
+        "-d",
+        "--detect-text",
+        action="store_true",
+        help="Only OCR the blocks of text found on each page, skip blank pages",
+    )
+    parser.add_argument(
+        "-f",
+        "--fused",
+        action="store_true",
+        help="Rectify each page in a single greyscale pass, saves greyscale images",
+    )
+    parser.add_argument(
+        "--threshold",
+        required=False,
+        choices=("auto",) + THRESHOLDS,
+        default=None,
+        help="Threshold method before OCR (default simple), auto chooses one "
+        "for each page",
+    )
+    parser.add_argument(
+        "--retry-confidence",
+        required=False,
+        type=float,
+        default=None,
+        help="OCR again with other threshold methods below this mean confidence",
+    )
+    parser.add_argument(
+        "-q",
+        "--quality-gate",
+        action="store_true",
+        help="Skip blurred, badly exposed or misshapen pages, reporting why",
+    )
+    # several small documents or one huge one, not both
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument(
+        "-m",
+        "--multi",
+        action="store_true",
+        help="OCR every separate document in each image, eg several receipts",
+    )
+    layout.add_argument(
+        "-l",
+        "--large",
+        action="store_true",
+        help="Process very large scans tile by tile within --memory-limit",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=None,
+        help="Write every result to this .jsonl, .parquet or .db file",
+    )
+    parser.add_argument(
+        "--output-format",
+        required=False,
+        choices=SINKS,
+        default=None,
+        help="Format of --output, by default chosen from its extension",
+    )
+    parser.add_argument(
+        "--output-images",
+        action="store_true",
+        help="Include the straightened images in --output",
+    )
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Results per write, Parquet row group or SQLite transaction",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        required=False,
+        type=int,
+        default=1024,
+        help="Memory limit per image in megabytes for --large, after its decode",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        type=str,
+        default=None,
+        help="Reuse results for unchanged images from a cache in this folder",
+    )
+    parser.add_argument(
+        "--cache-size",
+        required=False,
+        type=int,
+        default=1024,
+        help="Maximum size of the result cache in megabytes",
+    )
+    parser.add_argument(
+        "--dedup",
+        required=False,
+        type=str,
+        default=None,
+        help="Reuse results for repeat photos of a page via this SQLite index",
+    )
+    parser.add_argument(
+        "--dedup-distance",
+        required=False,
+        type=int,
+        default=DEFAULT_MAX_DISTANCE,
+        help="Most differing hash bits for pages to count as duplicates",
+    )
+    parser.add_argument(
+        "--dedup-report",
+        required=False,
+        type=str,
+        default=None,
+        help="Write the clusters of duplicate pages found to this JSON file",
+    )
+    return parse_given(parser, args)
+
+
+def parse_serve_options(args: List[str]) -> argparse.Namespace:
+    """ Use argparse to process the options of the serve subcommand, which runs
+    jmocr as an HTTP service
+
+    Args:
+        args (list(str)): list of sys.argv arguments after "serve"
+
+    Returns:
+        argparse.Namespace: parsed options, see the -h output for details
+    """
+    parser = argparse.ArgumentParser(
+        prog="jmocr.py serve",
+        description="Serve OCR over HTTP: POST images to /ocr, GET /health, /metrics",
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Interface to listen on",
+    )
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        default=2,
+        help="Threads running the OpenCV stages",
+    )
+    parser.add_argument(
+        "--ocr-concurrency",
+        type=positive_int,
+        default=2,
+        help="Maximum number of OCR calls running at once",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=positive_int,
+        default=16,
+        help="Requests in progress before new ones are rejected with 503",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Request timeout in seconds",
+    )
+    parser.add_argument(
+        "-t",
+        "--tesseract",
+        required=False,
+        type=str,
+        default=None,
+        help="Specify location of tesseract.exe",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=("auto", "pytesseract", "tesserocr"),
+        default="auto",
+        help="OCR backend, auto uses tesserocr if installed else pytesseract",
+    )
+    add_settings_options(parser)
+    return parse_given(parser, args)
+
+
+def parse_capture_options(args: List[str]) -> argparse.Namespace:
+    """ Use argparse to process the options of the capture subcommand, which
+    scans pages from a camera or video file
+
+    Args:
+        args (list(str)): list of sys.argv arguments after "capture"
+
+    Returns:
+        argparse.Namespace: parsed options, see the -h output for details
+    """
+    parser = argparse.ArgumentParser(
+        prog="jmocr.py capture",
+        description="OCR each page held still in front of a camera or in a video",
+    )
+    parser.add_argument(
+        "source", type=str, help="Video file, or camera index such as 0",
+    )
+    parser.add_argument(
+        "-s",
+        "--save",
+        required=False,
+        type=str,
+        nargs="?",
+        default=None,
+        const="||cwd||",
+        help="Save data to current working directory or a specified folder",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Show the video with the tracked page outlined, q to stop",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        default=2,
+        help="Threads OCRing captured pages",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=False,
+        type=str,
+        default=None,
+        help="Write every result to this .jsonl, .parquet or .db file",
+    )
+    parser.add_argument(
+        "--stable-frames",
+        type=int,
+        default=STABLE_FRAMES,
+        help="Frames a page must be still for before it is captured",
+    )
+    parser.add_argument(
+        "--min-sharpness",
+        type=float,
+        default=MIN_SHARPNESS,
+        help="Least Laplacian variance of a page for it to be captured",
+    )
+    parser.add_argument(
+        "-t",
+        "--tesseract",
+        required=False,
+        type=str,
+        default=None,
+        help="Specify location of tesseract.exe",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=("auto", "pytesseract", "tesserocr"),
+        default="auto",
+        help="OCR backend, auto uses tesserocr if installed else pytesseract",
+    )
+    add_settings_options(parser)
+    return parse_given(parser, args)
+
+
+def argument_parser(args: List[str]) -> Tuple[List[str], str, bool, str]:
+    """ Use argparse to allow for the processing of input paths, a save location
+    and adjusting the verbosity of the program. we pass args explicitly to
+    simplify testing
+
+    Args:
+        args (list(str)): list of sys.argv arguments excluding the program name 
+
+    Returns:
+        image_paths (list(str)): List of image paths
+        save_path (str): Directory path to save outputs to
+        verbose (bool): Whether or not to provide verbose output
+        tesseract_path (str): Absolute path to tesseract.exe 
+    """
+    parsed = parse_options(args)
     image_paths = parsed.paths
     save_path = parsed.save
     verbose = parsed.verbose
@@ -89,7 +515,7 @@ def paths_to_files(paths) -> Union[List[str], None]:
     # take only image files we can read
     valid_files = []
     for file in files:
-        if file.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
+        if file.lower().endswith(INPUT_EXTENSIONS):
             valid_files.append(file)
     if len(valid_files) > 0:
         return valid_files
@@ -97,6 +523,137 @@ def paths_to_files(paths) -> Union[List[str], None]:
         raise FileNotFoundError("No valid input image files specified")
 
 
+def iter_image_files(paths: Iterable[str]) -> Iterator[str]:
+    """ Lazily convert our files and folders into image files, as for
+    paths_to_files. Folders are scanned incrementally with os.scandir so the
+    first file is available immediately however large the folder is. If no
+    valid files are found, a FileNotFoundError error is raised once the paths
+    are exhausted
+
+    Args:
+        paths (iterable(str)): paths to convert
+
+    Yields:
+        str: image file locations
+    """
+    found = False
+    for path in paths:
+        # only explore the specified directory, this is not a recursive search
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(
+                        INPUT_EXTENSIONS
+                    ):
+                        found = True
+                        yield entry.path
+        elif os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS):
+            found = True
+            yield path
+    if not found:
+        raise FileNotFoundError("No valid input image files specified")
+
+
+def positive_int(text: str) -> int:
+    """ argparse type for counts that must be at least 1
+
+    Args:
+        text (str): the command line value
+
+    Returns:
+        int: the count
+
+    Raises:
+        argparse.ArgumentTypeError: if the value is not a whole number of at
+            least 1
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def parse_tune_options(args: List[str]) -> argparse.Namespace:
+    """ Use argparse to process the options of the tune subcommand, which
+    searches the pipeline parameters against labelled samples
+
+    Args:
+        args (list(str)): list of sys.argv arguments after "tune"
+
+    Returns:
+        argparse.Namespace: parsed options, see the -h output for details
+    """
+    parser = argparse.ArgumentParser(
+        prog="jmocr.py tune",
+        description="Tune the pipeline parameters on images labelled with their "
+        "text (image.txt) or page corners (image.json)",
+    )
+    parser.add_argument(
+        "samples",
+        metavar="N",
+        type=str,
+        nargs="+",
+        help="Labelled image files or folders",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="tuned.json",
+        help="Config file to write, load it with --config",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes evaluating samples in parallel, 0 for all cores",
+    )
+    parser.add_argument(
+        "--trials",
+        type=positive_int,
+        default=DEFAULT_TRIALS,
+        help="Parameter sets to try, drawn at random from the search space",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for drawing the trials",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Choose the most accurate trial within this many seconds per image",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        default=None,
+        help="Write every trial and the Pareto front to this JSON file",
+    )
+    parser.add_argument(
+        "-t",
+        "--tesseract",
+        required=False,
+        type=str,
+        default=None,
+        help="Specify location of tesseract.exe",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=("auto", "pytesseract", "tesserocr"),
+        default=None,
+        help="OCR backend, auto (the default) uses tesserocr if installed else "
+        "pytesseract",
+    )
+    add_settings_options(parser)
+    return parse_given(parser, args)
+
+
 def validate_save(save_path: str) -> Union[str, None]:
     """ Validate that a save path is a valid folder. If no save path was 
     specified then the current working directory will be returned. If an invalid
@@ -119,20 +676,45 @@ def validate_save(save_path: str) -> Union[str, None]:
 
 
 def validate_tesseract(tesseract_path: str) -> Union[str, None]:
-    """ validate that the tesseract path is valid folder else raise an error
+    """ validate that the tesseract path is a tesseract executable, called
+    tesseract.exe on Windows and tesseract elsewhere, else raise an error
     
     Args:
-        tesseract_path: Directory path to be validated
+        tesseract_path: File path to be validated
 
     Returns:
-        (str or None): None if passed None, otherwise directory path if valid
+        (str or None): None if passed None, otherwise the file path if valid
     """
     if tesseract_path is None:
         return None
-    if os.path.isfile(tesseract_path) and tesseract_path[-13:] == "tesseract.exe":
+    # split on either separator, so Windows paths are checked on any system
+    name = tesseract_path.replace("\\", "/").split("/")[-1].lower()
+    if os.path.isfile(tesseract_path) and name in ("tesseract", "tesseract.exe"):
         return tesseract_path
     else:
-        raise FileNotFoundError("Location specified is not a tesseract.exe file")
+        raise FileNotFoundError("Location specified is not a tesseract executable")
+
+
+def validate_workers(workers: int, verbose: bool = False) -> int:
+    """ validate the requested number of worker processes. 0 means one worker
+    per core. Verbose mode displays images from the main process so it always
+    runs serially. A negative worker count raises a ValueError
+
+    Args:
+        workers (int): requested number of worker processes
+        verbose (bool, optional): whether verbose output was requested.
+            Defaults to False
+
+    Returns:
+        int: number of worker processes to use
+    """
+    if workers < 0:
+        raise ValueError("number of workers can not be negative")
+    if verbose:
+        return 1
+    if workers == 0:
+        return os.cpu_count() or 1
+    return workers
 
 
 if __name__ == "__main__":
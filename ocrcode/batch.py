@@ -0,0 +1,200 @@
+""" Helpers for running the per-image pipeline over many images, optionally
+spread across a pool of worker processes or threads """
+import contextlib
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import cv2
+
+# environment variables read by OpenMP, BLAS and Tesseract when they start up
+THREAD_LIMIT_VARIABLES = (
+    "OMP_THREAD_LIMIT",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+)
+# how many images each worker may have queued before we wait for results
+QUEUE_DEPTH = 2
+# where Linux reports the memory of this process, including the heap size
+# that RLIMIT_DATA is checked against
+PROCESS_STATUS = "/proc/self/status"
+
+
+class BatchResult(NamedTuple):
+    """ The outcome of running the batch function on a single item. Exactly
+    one of value and error will be set """
+
+    item: Any
+    value: Any
+    error: Optional[str]
+
+
+def limit_threads(threads: int = 1) -> None:
+    """ Pin the number of internal threads used by OpenCV and any OpenMP based
+    libraries (including Tesseract subprocesses, which inherit our environment)
+    so that a pool of processes does not oversubscribe the available cores
+
+    Args:
+        threads (int, optional): threads each process may use. Defaults to 1
+    """
+    for variable in THREAD_LIMIT_VARIABLES:
+        os.environ[variable] = str(threads)
+    cv2.setNumThreads(threads)
+
+
+def limit_memory(max_bytes: int) -> bool:
+    """ Set a hard limit on the heap memory of this process, so a worker that
+    exceeds its budget fails with a MemoryError instead of pushing the machine
+    into swap. Memory mapped files do not count towards the limit. Only
+    supported where the resource module is available (not on Windows)
+
+    Args:
+        max_bytes (int): heap memory allowed in bytes
+
+    Returns:
+        bool: whether the limit was applied
+    """
+    try:
+        import resource
+    except ImportError:
+        return False
+    _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+    if hard != resource.RLIM_INFINITY:
+        max_bytes = min(max_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_DATA, (max_bytes, hard))
+    return True
+
+
+def heap_size() -> Optional[int]:
+    """ the heap memory of this process in bytes, as counted against the limit
+    set by limit_memory
+
+    Returns:
+        int: heap bytes, or None where they cannot be read (only Linux
+            reports them)
+    """
+    try:
+        with open(PROCESS_STATUS) as status:
+            for line in status:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+@contextlib.contextmanager
+def limit_memory_growth(max_bytes: int) -> Iterator[bool]:
+    """ Limit the heap of this process to grow by at most max_bytes while the
+    block runs, then restore the previous limit, see limit_memory. Unlike
+    limit_memory this works in a long running process whatever it already
+    holds. The limit is process wide so it also applies to other threads.
+    Only supported on Linux
+
+    Args:
+        max_bytes (int): heap memory the block may add in bytes
+
+    Yields:
+        bool: whether the limit was applied
+    """
+    used = heap_size()
+    try:
+        import resource
+    except ImportError:
+        used = None
+    if used is None:
+        yield False
+        return
+    previous = resource.getrlimit(resource.RLIMIT_DATA)
+    limit_memory(used + max_bytes)
+    try:
+        yield True
+    finally:
+        resource.setrlimit(resource.RLIMIT_DATA, previous)
+
+
+def _call(function: Callable[[Any], Any], item: Any) -> Tuple[Any, Optional[str]]:
+    """ Call function on item, converting any exception into an error string so
+    that a single bad image cannot take down the whole batch (exceptions raised
+    by native libraries do not always survive pickling back to the parent)
+
+    Args:
+        function (callable): function to apply
+        item (any): argument to pass to function
+
+    Returns:
+        tuple(any, str or None): function return value, error description
+    """
+    try:
+        return function(item), None
+    except Exception as error:  # pylint: disable=broad-except
+        return None, f"{type(error).__name__}: {error}"
+
+
+def _collect(item: Any, future: Future) -> BatchResult:
+    """ Wait for a submitted item and wrap its outcome as a BatchResult
+
+    Args:
+        item (any): the item that was submitted
+        future (Future): the future returned on submission
+
+    Returns:
+        BatchResult: outcome of processing the item
+    """
+    try:
+        value, error = future.result()
+    except Exception as error:  # pylint: disable=broad-except
+        # a worker died outright (eg segfault in native code)
+        return BatchResult(item, None, f"{type(error).__name__}: {error}")
+    return BatchResult(item, value, error)
+
+
+def run_batch(
+    function: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: int = 1,
+    threads: int = 1,
+) -> Iterator[BatchResult]:
+    """ Apply function to every item, yielding results in the same order as the
+    items. With more than one worker the items are processed in a process pool,
+    otherwise with more than one thread they are processed in a thread pool so
+    that reading the next image overlaps with OCR of the current one. Items are
+    consumed lazily with a bounded number in flight, so the first result comes
+    back quickly and memory use stays flat however many items there are.
+    Failures are isolated per item and reported through BatchResult.error
+
+    Args:
+        function (callable): picklable function taking a single item
+        items (iterable): items to process
+        workers (int, optional): number of worker processes, 1 runs everything
+            in the current process. Defaults to 1
+        threads (int, optional): number of threads to use when running in the
+            current process, 1 runs everything inline. Defaults to 1
+
+    Yields:
+        BatchResult: the outcome for each item in input order
+    """
+    if workers > 1:
+        # set limits before the pool starts so forked workers inherit them
+        limit_threads()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=limit_threads,)
+        in_flight = workers * QUEUE_DEPTH
+    elif threads > 1:
+        # OpenCV and tesseract release the GIL so threads overlap usefully
+        executor = ThreadPoolExecutor(max_workers=threads)
+        in_flight = threads * QUEUE_DEPTH
+    else:
+        for item in items:
+            value, error = _call(function, item)
+            yield BatchResult(item, value, error)
+        return
+    with executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(_call, function, item)))
+            if len(pending) >= in_flight:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
@@ -0,0 +1,41 @@
+""" Reusable scratch buffers, so that batch runs do not allocate a new full
+frame array for every intermediate image of every page """
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+class BufferPool:
+    """ Named scratch arrays that are reused between calls. Each name is backed
+    by a flat array that only grows, and callers get a view of it in the shape
+    they need, suitable for passing as the dst of OpenCV functions. A buffer is
+    only valid until the next request for the same name, so a pool must not be
+    shared between threads """
+
+    def __init__(self):
+        self._buffers: Dict[str, np.array] = {}
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.array:
+        """ get a scratch array, reusing the memory of earlier requests
+
+        Args:
+            name (str): identifies the buffer
+            shape (tuple(int)): shape of the array required
+            dtype (optional): data type of the array. Defaults to np.uint8
+
+        Returns:
+            np.array: a contiguous array of the requested shape, its contents
+                are undefined
+        """
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        backing = self._buffers.get(name)
+        if backing is None or backing.nbytes < size:
+            backing = np.empty(size, np.uint8)
+            self._buffers[name] = backing
+        return backing[:size].view(dtype).reshape(shape)
+
+    @property
+    def nbytes(self) -> int:
+        """ total memory held by the pool """
+        return sum(backing.nbytes for backing in self._buffers.values())
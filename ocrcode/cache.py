@@ -0,0 +1,235 @@
+""" A content addressed on disk cache of pipeline results, so re-runs skip
+images that have already been processed with the same parameters """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode.engines import Word
+from ocrcode.pipeline import PipelineConfig, Result
+from ocrcode.quality import QualityReport
+
+# default size limit of the cache in bytes
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+# rescan the cache directory after this many writes, as other processes may
+# be writing to it too
+RESCAN_INTERVAL = 100
+# config fields that do not affect the results: where tesseract is and how
+# many threads share the work
+IGNORED_FIELDS = ("tesseract_cmd", "document_workers", "text_detection_workers")
+
+
+def parameters_hash(config: PipelineConfig, engine_version: str) -> str:
+    """ hash every pipeline parameter that affects the result
+
+    Args:
+        config (PipelineConfig): the pipeline parameters
+        engine_version (str): OCR engine version, eg the tesseract version
+
+    Returns:
+        str: hex digest of the parameters
+    """
+    parameters = dataclasses.asdict(config)
+    for name in IGNORED_FIELDS:
+        parameters.pop(name, None)
+    parameters["engine_version"] = engine_version
+    encoded = json.dumps(parameters, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    """ Stores the OCR text and detected quad of each image, keyed by a hash of
+    the image file contents and of the pipeline parameters. The rectified image
+    can optionally be stored too. Least recently used entries are evicted once
+    the cache grows beyond its size limit. Safe to share between threads """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        Args:
+            cache_dir (str): directory to keep the cache in, created if needed
+            max_bytes (int, optional): size limit of the cache. Defaults to
+                DEFAULT_CACHE_BYTES
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # guards the counters and our record of the entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._scan()
+
+    def _scan(self) -> None:
+        """ rebuild our record of the size and last use of every entry """
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                stat = entry.stat()
+                key = entry.name.split(".")[0]
+                last_used, size = self._entries.get(key, (0, 0))
+                self._entries[key] = (
+                    max(last_used, stat.st_mtime),
+                    size + stat.st_size,
+                )
+        self._total = sum(size for _, size in self._entries.values())
+
+    def _path(self, key: str, extension: str) -> str:
+        """ the file holding part of a cache entry, split over subdirectories so
+        no single directory gets too large """
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    @staticmethod
+    def key(data: bytes, parameters: str) -> str:
+        """ build the cache key for an image
+
+        Args:
+            data (bytes): the raw contents of the image file
+            parameters (str): hash of the pipeline parameters, see
+                parameters_hash
+
+        Returns:
+            str: the cache key
+        """
+        digest = hashlib.sha256(data)
+        digest.update(parameters.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, with_image: bool = False) -> Optional[Result]:
+        """ look up a cached result. Recording a hit marks the entry as recently
+        used
+
+        Args:
+            key (str): the cache key
+            with_image (bool, optional): the rectified image is required, so an
+                entry stored without one counts as a miss. Defaults to False
+
+        Returns:
+            Result or None: the cached result with cached set, or None on a miss
+        """
+        json_path = self._path(key, ".json")
+        image_path = self._path(key, ".png")
+        try:
+            with open(json_path) as json_file:
+                record = json.load(json_file)
+            image = cv2.imread(image_path) if with_image else None
+        except (OSError, ValueError):
+            # missing, or evicted or half written by another process
+            record, image = None, None
+        # pages rejected by the quality gate have no image
+        rejected = record is not None and bool(
+            (record.get("quality") or {}).get("reasons")
+        )
+        if record is None or (with_image and image is None and not rejected):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        for path in (json_path, image_path):
+            if os.path.exists(path):
+                os.utime(path)
+        words = record.get("words")
+        if words is not None:
+            words = [
+                Word(text, confidence, tuple(box), np.array(quad, np.int32))
+                for text, confidence, box, quad in words
+            ]
+        report = record.get("quality")
+        if report is not None:
+            report = QualityReport(**report)
+        page_transform = record.get("page_transform")
+        if page_transform is not None:
+            page_transform = np.array(page_transform)
+        text_regions = record.get("text_regions")
+        if text_regions is not None:
+            text_regions = [tuple(region) for region in text_regions]
+        return Result(
+            text=record["text"],
+            quad=np.array(record["quad"], np.int32),
+            image=image,
+            cached=True,
+            magnification=record.get("magnification"),
+            threshold=record.get("threshold"),
+            text_regions=text_regions,
+            confidence=record.get("confidence"),
+            words=words,
+            page_transform=page_transform,
+            quality=report,
+        )
+
+    def put(self, key: str, result: Result, with_image: bool = False) -> None:
+        """ store a result, evicting old entries if the cache is too large
+
+        Args:
+            key (str): the cache key
+            result (Result): the result to store
+            with_image (bool, optional): store the rectified image as well.
+                Defaults to False
+        """
+        os.makedirs(os.path.join(self.cache_dir, key[:2]), exist_ok=True)
+        image_path = self._path(key, ".png")
+        if with_image and result.image is not None:
+            cv2.imwrite(image_path, result.image)
+        json_path = self._path(key, ".json")
+        # write then rename so readers never see a partial entry
+        record = {
+            "text": result.text,
+            "quad": result.quad.tolist(),
+            "magnification": result.magnification,
+            "threshold": result.threshold,
+            "confidence": result.confidence,
+        }
+        if result.text_regions is not None:
+            record["text_regions"] = [list(region) for region in result.text_regions]
+        if result.page_transform is not None:
+            record["page_transform"] = result.page_transform.tolist()
+        if result.words is not None:
+            record["words"] = [
+                [word.text, word.confidence, list(word.box), word.quad.tolist()]
+                for word in result.words
+            ]
+        if result.quality is not None:
+            record["quality"] = result.quality._asdict()
+        with open(json_path + ".tmp", "w") as json_file:
+            json.dump(record, json_file)
+        os.replace(json_path + ".tmp", json_path)
+        # an image stored earlier under this key is kept, so is counted too
+        size = os.path.getsize(json_path)
+        if os.path.exists(image_path):
+            size += os.path.getsize(image_path)
+        with self._lock:
+            # a replaced entry no longer takes up its old size
+            _, old_size = self._entries.get(key, (0, 0))
+            self._entries[key] = (os.path.getmtime(json_path), size)
+            self._total += size - old_size
+            self._writes += 1
+            if self._writes % RESCAN_INTERVAL == 0:
+                self._scan()
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """ remove least recently used entries until we are within our limit,
+        called holding the lock """
+        # other processes may have used or added entries since we last looked
+        self._scan()
+        for key, (_, size) in sorted(self._entries.items(), key=lambda e: e[1][0]):
+            if self._total <= self.max_bytes:
+                break
+            for extension in (".json", ".png"):
+                try:
+                    os.remove(self._path(key, extension))
+                except FileNotFoundError:
+                    pass
+            del self._entries[key]
+            self._total -= size
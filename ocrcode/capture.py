@@ -0,0 +1,339 @@
+""" Scanning from a camera or video file. The page is found and then tracked
+from frame to frame with optical flow, which is cheap enough to run on every
+frame. Only when the page has been still and sharp for a moment is the frame
+handed to a worker pool to be straightened and OCRed, so tracking keeps up
+with the camera while Tesseract runs in the background """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Union
+
+import cv2
+import numpy as np
+
+from ocrcode import ocr
+from ocrcode import quality
+from ocrcode.batch import BatchResult
+from ocrcode.pipeline import DocumentPipeline, PipelineConfig
+
+# frames between searches for the page while it is being tracked, as optical
+# flow slowly drifts
+REDETECT_INTERVAL = 15
+# padding round the tracked page searched when re-detecting, as a fraction of
+# its size, so re-detection does not search the whole frame
+ROI_PADDING = 0.25
+# features tracked inside the page, and fewest that must survive each frame
+TRACK_POINTS = 100
+MIN_TRACK_POINTS = 8
+# frames the page must be still for, and the most any corner may move in a
+# still frame, in detection pixels
+STABLE_FRAMES = 10
+STABLE_DISTANCE = 2.0
+# a corner moving this far in one frame means a new page, which is captured
+# again once it settles
+NEW_PAGE_DISTANCE = 40.0
+# least variance of the Laplacian of the page for it to count as sharp
+MIN_SHARPNESS = 100.0
+
+
+class PageTracker:
+    """ Follows the page through the frames of a video and decides when to
+    capture it. The page is searched for with the pipeline's detection stages,
+    then tracked by optical flow on features inside it, and searched for again
+    near where it was every redetect_interval frames or when tracking fails """
+
+    def __init__(
+        self,
+        config: PipelineConfig = None,
+        redetect_interval: int = REDETECT_INTERVAL,
+        stable_frames: int = STABLE_FRAMES,
+        stable_distance: float = STABLE_DISTANCE,
+        min_sharpness: float = MIN_SHARPNESS,
+    ):
+        """
+        Args:
+            config (PipelineConfig, optional): detection parameters. Defaults
+                to the PipelineConfig defaults
+            redetect_interval (int, optional): frames between searches while
+                tracking. Defaults to REDETECT_INTERVAL
+            stable_frames (int, optional): frames the page must be still for.
+                Defaults to STABLE_FRAMES
+            stable_distance (float, optional): most a corner may move in a
+                still frame, in detection pixels. Defaults to STABLE_DISTANCE
+            min_sharpness (float, optional): least sharpness to capture, see
+                quality.measure_sharpness. Defaults to MIN_SHARPNESS
+        """
+        self.config = config if config is not None else PipelineConfig()
+        self.redetect_interval = redetect_interval
+        self.stable_frames = stable_frames
+        self.stable_distance = stable_distance
+        self.min_sharpness = min_sharpness
+        # ordered 4x1x2 corners of the page in the detection image, None when
+        # there is no page
+        self.quad = None
+        # frames the page has been still for
+        self.still_frames = 0
+        # whether the page has already been captured since it settled
+        self.captured = False
+        self.sharpness = 0.0
+        self._scale = 1.0
+        self._grey = None
+        self._points = None
+        self._since_detection = 0
+
+    def update(self, frame: np.array) -> bool:
+        """ find or track the page in the next frame
+
+        Args:
+            frame (np.array): BGR video frame
+
+        Returns:
+            bool: True when the page has just become still and sharp enough to
+                capture, at most once each time it settles
+        """
+        config = self.config
+        detection_size = min(
+            config.detection_size or config.processing_size, max(frame.shape[:2])
+        )
+        grey = cv2.cvtColor(
+            ocr.scale_longest_axis(frame, new_size=detection_size), cv2.COLOR_BGR2GRAY
+        )
+        self._scale = max(frame.shape[:2]) / max(grey.shape[:2])
+        min_area = int(config.min_area * (detection_size / config.processing_size) ** 2)
+        previous = self.quad
+        quad = self._track(grey) if previous is not None else None
+        # movement is measured by the flow when there is one, as it is
+        # smoother than comparing the corners of separate searches
+        movement = np.inf
+        if quad is not None:
+            movement = float(np.abs(quad - previous).max())
+        if quad is None or self._since_detection >= self.redetect_interval:
+            # correct any drift by searching near the page, then everywhere
+            detected = None
+            if previous is not None:
+                detected = self._detect(grey, min_area, around=previous)
+            if detected is None:
+                detected = self._detect(grey, min_area)
+            if detected is not None:
+                if quad is None and previous is not None:
+                    movement = float(np.abs(detected - previous).max())
+                quad = detected
+        self._grey = grey
+        self.quad = quad
+        if quad is None:
+            # the page has gone, capture the next one
+            self.still_frames = 0
+            self.captured = False
+            return False
+        if movement > NEW_PAGE_DISTANCE:
+            self.captured = False
+        self.still_frames = (
+            self.still_frames + 1 if movement <= self.stable_distance else 0
+        )
+        if self.captured or self.still_frames < self.stable_frames:
+            return False
+        # only measured once the page is still
+        self.sharpness = quality.measure_sharpness(grey, quad)
+        if self.sharpness < self.min_sharpness:
+            return False
+        self.captured = True
+        return True
+
+    def frame_quad(self) -> np.array:
+        """ the corners of the page in the coordinates of the last frame
+
+        Returns:
+            np.array: ordered 4x1x2 corners, None when there is no page
+        """
+        if self.quad is None:
+            return None
+        return ocr.scale_quadrilateral(self.quad, self._scale)
+
+    def _detect(
+        self, grey: np.array, min_area: int, around: np.array = None
+    ) -> np.array:
+        """ search for the page, only near around when given
+
+        Args:
+            grey (np.array): greyscale detection image
+            min_area (int): smallest page area in grey
+            around (np.array, optional): corners of the page in the previous
+                frame, None to search the whole image. Defaults to None
+
+        Returns:
+            np.array: ordered 4x1x2 float corners, None if no page was found
+        """
+        left, top = 0, 0
+        region = grey
+        if around is not None:
+            x, y, width, height = cv2.boundingRect(np.int32(around).reshape((4, 2)))
+            pad_x, pad_y = int(width * ROI_PADDING), int(height * ROI_PADDING)
+            left, top = max(x - pad_x, 0), max(y - pad_y, 0)
+            region = grey[top : y + height + pad_y, left : x + width + pad_x]
+        config = self.config
+        mask = ocr.preprocess_image(
+            region,
+            blur=config.processing_blur,
+            threshold_high=config.threshold_high,
+            threshold_low=config.threshold_low,
+            kernel_size=config.kernel_size,
+        )
+        quad = ocr.get_contour_from_mask(
+            mask,
+            min_area=min_area,
+            epsilon=config.epsilon,
+            verbose=False,
+            fallback=config.contour_fallback,
+        )
+        # nothing found gives a tiny placeholder quad
+        if cv2.contourArea(quad) < min_area:
+            return None
+        self._since_detection = 0
+        self._points = None
+        quad = ocr.order_quadrilateral(quad).astype(np.float32)
+        return quad + np.float32([left, top])
+
+    def _track(self, grey: np.array) -> np.array:
+        """ move the page with the optical flow of features inside it
+
+        Args:
+            grey (np.array): greyscale detection image
+
+        Returns:
+            np.array: ordered 4x1x2 float corners, None if tracking failed
+        """
+        if self._points is None or len(self._points) < MIN_TRACK_POINTS:
+            mask = np.zeros_like(self._grey)
+            cv2.fillConvexPoly(mask, np.int32(self.quad[[0, 1, 3, 2]]), 255)
+            self._points = cv2.goodFeaturesToTrack(
+                self._grey, TRACK_POINTS, qualityLevel=0.01, minDistance=8, mask=mask
+            )
+            if self._points is None or len(self._points) < MIN_TRACK_POINTS:
+                return None
+        points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._grey, grey, self._points, None
+        )
+        found = status.ravel() == 1
+        if np.count_nonzero(found) < MIN_TRACK_POINTS:
+            return None
+        homography, inliers = cv2.findHomography(
+            self._points[found], points[found], cv2.RANSAC, 3.0
+        )
+        if homography is None:
+            return None
+        self._since_detection += 1
+        self._points = points[found][inliers.ravel() == 1]
+        return cv2.perspectiveTransform(self.quad, homography)
+
+
+def open_video(source: Union[str, int]) -> cv2.VideoCapture:
+    """ open a video file or camera
+
+    Args:
+        source (str or int): video file, or camera index such as 0 or "0"
+
+    Returns:
+        cv2.VideoCapture: the opened capture
+
+    Raises:
+        IOError: if the source cannot be opened
+    """
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        raise IOError(f"unable to open video {source}")
+    return video
+
+
+def capture(
+    pipeline: DocumentPipeline,
+    source: Union[str, int],
+    workers: int = 1,
+    tracker: PageTracker = None,
+    display: bool = False,
+    max_frames: int = None,
+) -> Iterator[BatchResult]:
+    """ track pages through a video and OCR each one once it settles. Frames
+    are read and tracked as fast as they arrive while OCR runs on a pool of
+    workers threads. A page that settles while every worker is busy waits for
+    one to free up rather than stalling the tracking. A page that fails is
+    reported and capture carries on with the next
+
+    Args:
+        pipeline (DocumentPipeline): straightens and OCRs the captured pages
+        source (str or int): video file, or camera index
+        workers (int, optional): threads OCRing pages. Defaults to 1
+        tracker (PageTracker, optional): finds and tracks the page, None for
+            one using the pipeline config. Defaults to None
+        display (bool, optional): show the frames with the page outlined,
+            press q to stop. Defaults to False
+        max_frames (int, optional): stop after this many frames, None to run
+            until the video ends. Defaults to None
+
+    Yields:
+        BatchResult: the index of the captured frame as the item, with its
+            Result as the value or else the error, in capture order
+    """
+    tracker = tracker if tracker is not None else PageTracker(pipeline.config)
+    video = open_video(source)
+    pending = deque()
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        try:
+            index = 0
+            while max_frames is None or index < max_frames:
+                ok, frame = video.read()
+                if not ok:
+                    break
+                if tracker.update(frame):
+                    if len(pending) < max(workers, 1):
+                        future = pool.submit(
+                            pipeline.process_quad, frame, tracker.frame_quad()
+                        )
+                        pending.append((index, future))
+                    else:
+                        # try again on the next frame
+                        tracker.captured = False
+                # hand back finished pages without waiting for the rest
+                while pending and pending[0][1].done():
+                    yield _collect(*pending.popleft())
+                if display and _show(frame, tracker):
+                    break
+                index += 1
+        finally:
+            video.release()
+            if display:
+                cv2.destroyAllWindows()
+        for captured_index, future in pending:
+            yield _collect(captured_index, future)
+
+
+def _collect(index: int, future: Future) -> BatchResult:
+    """ wait for the OCR of a captured frame, converting any exception into an
+    error string so that one bad page does not end the session
+
+    Args:
+        index (int): the index of the captured frame
+        future (Future): its OCR
+
+    Returns:
+        BatchResult: the outcome for the frame
+    """
+    try:
+        return BatchResult(index, future.result(), None)
+    except Exception as error:  # pylint: disable=broad-except
+        return BatchResult(index, None, f"{type(error).__name__}: {error}")
+
+
+def _show(frame: np.array, tracker: PageTracker) -> bool:
+    """ show a frame with the tracked page outlined, green once captured,
+    returning True if q was pressed """
+    quad = tracker.frame_quad()
+    if quad is not None:
+        # the frame may be queued for OCR, so draw on a copy
+        frame = frame.copy()
+        colour = (0, 255, 0) if tracker.captured else (0, 0, 255)
+        cv2.polylines(frame, [quad[[0, 1, 3, 2]]], True, colour, 2)
+    cv2.imshow("capture", frame)
+    return cv2.waitKey(1) & 0xFF == ord("q")
@@ -0,0 +1,350 @@
+""" Finding repeated photos of the same document. Each straightened page is
+reduced to a 64 bit perceptual hash before OCR, and pages within a small
+Hamming distance of a page already in the index reuse its OCR result. The
+index is a SQLite file, so it is shared by worker processes and kept between
+runs """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode.engines import Word
+from ocrcode.pipeline import DocumentPipeline, Result, map_words
+from ocrcode.profiling import StageProfiler
+
+# the perceptual hashes accepted by image_hash
+HASH_METHODS = ("dhash", "phash")
+# side of the grid of bits, giving 64 bit hashes
+HASH_SIZE = 8
+# side of the image the DCT of phash is taken over
+PHASH_SIZE = 32
+# most differing bits for two pages to count as the same document. Two photos
+# of the same card differ by 6 with dhash, while different synthetic text
+# pages in the same layout differ by at least 11
+DEFAULT_MAX_DISTANCE = 8
+# seconds to wait for another process writing to the index
+SQLITE_TIMEOUT = 30
+# number of bits set in each byte value, for Hamming distances
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], np.uint8)
+
+
+def _to_int(bits: np.array) -> int:
+    """ pack an array of booleans into an integer, first bit most significant """
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _small_grey(image: np.array, size: Tuple[int, int]) -> np.array:
+    """ shrink then greyscale, so only the tiny image is converted """
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+
+def dhash(image: np.array) -> int:
+    """ difference hash: whether each cell of a small grid is brighter than
+    the cell to its left. Quick, and robust to brightness and contrast
+
+    Args:
+        image (np.array): greyscale or BGR image
+
+    Returns:
+        int: 64 bit hash
+    """
+    small = _small_grey(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(image: np.array) -> int:
+    """ DCT hash: whether each of the lowest frequencies of the image is above
+    their median. Depends only on the coarse layout of the page, so pages with
+    similar layouts hash closer together than with dhash
+
+    Args:
+        image (np.array): greyscale or BGR image
+
+    Returns:
+        int: 64 bit hash
+    """
+    small = _small_grey(image, (PHASH_SIZE, PHASH_SIZE))
+    frequencies = cv2.dct(np.float32(small))[:HASH_SIZE, :HASH_SIZE]
+    # the first term is the mean brightness, which would skew the median
+    return _to_int(frequencies > np.median(frequencies.ravel()[1:]))
+
+
+def image_hash(image: np.array, method: str = "dhash") -> int:
+    """ perceptual hash of an image by name. An unknown name raises a
+    ValueError
+
+    Args:
+        image (np.array): greyscale or BGR image
+        method (str, optional): one of HASH_METHODS. Defaults to "dhash"
+
+    Returns:
+        int: 64 bit hash
+    """
+    if method == "dhash":
+        return dhash(image)
+    if method == "phash":
+        return phash(image)
+    raise ValueError(f"unknown hash {method}, choose from {HASH_METHODS}")
+
+
+def hamming_distances(page_hash: int, hashes: np.array) -> np.array:
+    """ number of bits differing between a hash and each of many
+
+    Args:
+        page_hash (int): 64 bit hash
+        hashes (np.array): uint64 hashes
+
+    Returns:
+        np.array: the distance to each of hashes
+    """
+    differences = np.bitwise_xor(np.asarray(hashes, np.uint64), np.uint64(page_hash))
+    return POPCOUNT[differences.view(np.uint8)].reshape((-1, 8)).sum(axis=1)
+
+
+class Duplicate(NamedTuple):
+    """ An earlier page matching a new one, and the OCR result to reuse """
+
+    name: str
+    distance: int
+    text: str
+    confidence: float
+    # boxes on the earlier page handed to the OCR engine, without quads
+    words: List[Word]
+    # height and width of the earlier page handed to the OCR engine
+    ocr_shape: Tuple[int, int]
+
+
+class DuplicateIndex:
+    """ Hashes of the pages OCRed so far, with their results. A page matching
+    several earlier ones is matched to the closest, and then to the oldest, so
+    clusters keep to their first page. Each process keeps the hashes in
+    memory and reads rows added by other processes before every search. Only
+    pages OCRed with the same parameters are matched, so an index kept between
+    runs never hands back text read with other settings or another engine.
+    Safe to share between threads """
+
+    def __init__(
+        self,
+        path: str,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        method: str = "dhash",
+        parameters: str = "",
+    ):
+        """
+        Args:
+            path (str): SQLite file to keep the index in, added to if it
+                exists, or ":memory:" for an index private to this object
+            max_distance (int, optional): most differing bits for pages to
+                count as duplicates, 0 for exact matches only. Defaults to
+                DEFAULT_MAX_DISTANCE
+            method (str, optional): one of HASH_METHODS, only pages hashed
+                the same way are compared. Defaults to "dhash"
+            parameters (str, optional): identifies the pipeline parameters and
+                OCR engine, see cache.parameters_hash. Only pages OCRed with
+                the same are compared. Defaults to ""
+        """
+        if method not in HASH_METHODS:
+            raise ValueError(f"unknown hash {method}, choose from {HASH_METHODS}")
+        self.max_distance = max_distance
+        self.method = method
+        self.parameters = parameters
+        # one connection shared by the threads of this process, in turn
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=SQLITE_TIMEOUT, check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "name TEXT, method TEXT, hash TEXT, text TEXT, confidence REAL, "
+                "words TEXT, height INTEGER, width INTEGER, parameters TEXT)"
+            )
+            columns = [
+                column[1]
+                for column in self._connection.execute("PRAGMA table_info(pages)")
+            ]
+            if "parameters" not in columns:
+                # indexes made before parameters were recorded, their pages
+                # are left NULL so they never match
+                self._connection.execute("ALTER TABLE pages ADD COLUMN parameters TEXT")
+        self._rowids = np.zeros(0, np.int64)
+        self._hashes = np.zeros(0, np.uint64)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._hashes)
+
+    def _refresh(self) -> None:
+        """ load the hashes added since the last search, by any process """
+        last = int(self._rowids[-1]) if len(self._rowids) else 0
+        rows = self._connection.execute(
+            "SELECT rowid, hash FROM pages "
+            "WHERE method = ? AND parameters = ? AND rowid > ? ORDER BY rowid",
+            (self.method, self.parameters, last),
+        ).fetchall()
+        if rows:
+            rowids, hashes = zip(*rows)
+            self._rowids = np.append(self._rowids, np.int64(rowids))
+            self._hashes = np.append(
+                self._hashes, np.uint64([int(value, 16) for value in hashes])
+            )
+
+    def find(self, page_hash: int) -> Duplicate:
+        """ the closest page within max_distance of a hash, the oldest of
+        equally close pages
+
+        Args:
+            page_hash (int): hash of the new page
+
+        Returns:
+            Duplicate: the closest match, None if there is none
+        """
+        with self._lock:
+            self._refresh()
+            if not len(self._hashes):
+                return None
+            distances = hamming_distances(page_hash, self._hashes)
+            # argmin gives the first, ie oldest, of equally close pages
+            closest = int(np.argmin(distances))
+            if distances[closest] > self.max_distance:
+                return None
+            row = self._connection.execute(
+                "SELECT name, text, confidence, words, height, width FROM pages "
+                "WHERE rowid = ?",
+                (int(self._rowids[closest]),),
+            ).fetchone()
+        name, text, confidence, words, height, width = row
+        if words is not None:
+            words = [
+                Word(word_text, word_confidence, tuple(box))
+                for word_text, word_confidence, box in json.loads(words)
+            ]
+        return Duplicate(
+            name, int(distances[closest]), text, confidence, words, (height, width)
+        )
+
+    def add(
+        self, name: str, page_hash: int, result: Result, ocr_shape: Tuple[int, int]
+    ) -> None:
+        """ store a page's hash and OCR result
+
+        Args:
+            name (str): identifies the page, usually its path
+            page_hash (int): hash of the page
+            result (Result): the OCRed result
+            ocr_shape (tuple(int, int)): height and width of the page that was
+                handed to the OCR engine, which the word boxes are relative to
+        """
+        words = None
+        if result.words is not None:
+            words = json.dumps(
+                [[word.text, word.confidence, list(word.box)] for word in result.words]
+            )
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO pages (name, method, hash, text, confidence, words, "
+                "height, width, parameters) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    self.method,
+                    f"{page_hash:016x}",
+                    result.text,
+                    result.confidence,
+                    words,
+                    int(ocr_shape[0]),
+                    int(ocr_shape[1]),
+                    self.parameters,
+                ),
+            )
+
+    def recognise(
+        self,
+        pipeline: DocumentPipeline,
+        name: str,
+        clean_image: np.array,
+        result: Result,
+    ) -> Result:
+        """ DocumentPipeline.recognise, unless the page duplicates one in the
+        index. A duplicate takes the earlier page's text and confidence, and
+        its word boxes scaled onto this page and mapped onto this image, so
+        the quads are still right. Other pages are OCRed and added
+
+        Args:
+            pipeline (DocumentPipeline): OCRs new pages
+            name (str): identifies the page, usually its path
+            clean_image (np.array): the page prepared for OCR
+            result (Result): the result returned alongside it by rectify
+
+        Returns:
+            Result: the result with the text filled in, and duplicate_of set
+                when it was reused
+        """
+        if result.rejected:
+            return result
+        profiler = StageProfiler(pipeline.hooks)
+        # the straightened page, so framing and perspective do not matter
+        page_hash = image_hash(result.image, self.method)
+        duplicate = self.find(page_hash)
+        profiler.lap("dedup")
+        result.metrics.extend(profiler.metrics)
+        result.timings.update(profiler.timings)
+        if duplicate is None:
+            result = pipeline.recognise(clean_image, result)
+            self.add(name, page_hash, result, clean_image.shape[:2])
+            return result
+        result.text = duplicate.text
+        result.confidence = duplicate.confidence
+        result.duplicate_of = duplicate.name
+        result.duplicate_distance = duplicate.distance
+        if duplicate.words is not None and result.page_transform is not None:
+            scale_y = clean_image.shape[0] / duplicate.ocr_shape[0]
+            scale_x = clean_image.shape[1] / duplicate.ocr_shape[1]
+            words = [
+                word._replace(
+                    box=(
+                        int(round(word.box[0] * scale_x)),
+                        int(round(word.box[1] * scale_y)),
+                        int(round(word.box[2] * scale_x)),
+                        int(round(word.box[3] * scale_y)),
+                    )
+                )
+                for word in duplicate.words
+            ]
+            result.words = map_words(words, result.page_transform)
+        return result
+
+    def close(self) -> None:
+        """ close the index file """
+        self._connection.close()
+
+
+def duplicate_clusters(duplicates: Iterable[Tuple[str, str, int]]) -> List[Dict]:
+    """ group duplicates by the page whose result they reused
+
+    Args:
+        duplicates (iterable(tuple(str, str, int))): the name of each
+            duplicate, the name of the page it matched and their distance
+
+    Returns:
+        list(dict): a cluster per original page with its "original" name and
+            its "duplicates", each with a "name" and a "distance" (0 when the
+            pages hashed identically), largest cluster first
+    """
+    clusters: Dict[str, List[Dict]] = {}
+    for name, original, distance in duplicates:
+        clusters.setdefault(original, []).append({"name": name, "distance": distance})
+    report = [
+        {"original": original, "duplicates": members}
+        for original, members in clusters.items()
+    ]
+    # stable, so clusters of equal size keep the order they were found in
+    return sorted(report, key=lambda cluster: -len(cluster["duplicates"]))
@@ -0,0 +1,277 @@
+""" Pluggable OCR backends. Each engine exposes image_to_string, and
+image_to_data for the words as well, so the rest of the code does not need to
+know how Tesseract is being driven """
+import queue
+from typing import Dict, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+# the names accepted by get_engine, "auto" prefers a long lived engine
+ENGINES = ("auto", "pytesseract", "tesserocr")
+# the level of word rows in tesseract's data output
+WORD_LEVEL = 5
+
+
+class Word(NamedTuple):
+    """ A recognised word, its confidence and where it was found """
+
+    text: str
+    # from 0 to 100
+    confidence: float
+    # x, y, width, height in the image that was OCRed
+    box: Tuple[int, int, int, int]
+    # 4x2 corners of the box in the original image, top left, top right,
+    # bottom left, bottom right. Filled in by the pipeline
+    quad: np.array = None
+
+
+def words_from_data(data: Dict[str, List]) -> Tuple[str, List[Word]]:
+    """ rebuild the text and words from tesseract's data output, joining words
+    into lines and separating paragraphs with a blank line as its text output
+    does
+
+    Args:
+        data (dict): columns of the data output, as returned by
+            pytesseract.image_to_data with Output.DICT
+
+    Returns:
+        tuple(str, list(Word)): the text and the recognised words
+    """
+    words = []
+    paragraphs = []
+    last_paragraph, last_line = None, None
+    for index, level in enumerate(data["level"]):
+        text = str(data["text"][index]).strip()
+        if int(level) != WORD_LEVEL or not text:
+            continue
+        paragraph = (data["block_num"][index], data["par_num"][index])
+        line = data["line_num"][index]
+        if paragraph != last_paragraph:
+            paragraphs.append([[]])
+        elif line != last_line:
+            paragraphs[-1].append([])
+        last_paragraph, last_line = paragraph, line
+        paragraphs[-1][-1].append(text)
+        box = tuple(int(data[key][index]) for key in ("left", "top", "width", "height"))
+        words.append(Word(text, float(data["conf"][index]), box))
+    text = "\n\n".join(
+        "\n".join(" ".join(line) for line in lines) for lines in paragraphs
+    )
+    return (text + "\n" if text else text), words
+
+
+class PytesseractEngine:
+    """ OCR through pytesseract. Simple and always available, but every call
+    starts a new tesseract process, writes the image to a temporary file and
+    reloads the language model """
+
+    def __init__(self, lang: str = "eng", tesseract_cmd: str = None):
+        """
+        Args:
+            lang (str, optional): tesseract language code. Defaults to "eng"
+            tesseract_cmd (str, optional): tesseract executable, None to use
+                whatever pytesseract finds on the PATH. Defaults to None
+        """
+        self.lang = lang
+        self._version = None
+        if tesseract_cmd is not None:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def image_to_string(self, image: np.array) -> str:
+        """ OCR an image
+
+        Args:
+            image (np.array): greyscale or BGR image
+
+        Returns:
+            str: the recognised text
+        """
+        return pytesseract.image_to_string(image, lang=self.lang)
+
+    def image_to_data(self, image: np.array) -> Tuple[str, List[Word]]:
+        """ OCR an image once, returning the words along with the text
+
+        Args:
+            image (np.array): greyscale or BGR image
+
+        Returns:
+            tuple(str, list(Word)): the recognised text and words
+        """
+        data = pytesseract.image_to_data(
+            image, lang=self.lang, output_type=pytesseract.Output.DICT
+        )
+        return words_from_data(data)
+
+    def version(self) -> str:
+        """ the engine and tesseract version plus language, which identify the
+        model producing our results """
+        # asking tesseract its version starts a process so only do it once
+        if self._version is None:
+            self._version = str(pytesseract.get_tesseract_version())
+        return f"pytesseract {self._version} {self.lang}"
+
+    def close(self) -> None:
+        """ nothing to release, each call cleans up its own process """
+        pass
+
+
+class TesserocrEngine:
+    """ OCR through the tesserocr bindings. Keeps a pool of in-process
+    Tesseract APIs with the language model already loaded, so it can be reused
+    across thousands of pages without any process or model start up cost.
+    tesserocr releases the GIL while recognising, so a pool larger than one
+    lets several threads OCR at once. The language models are found in
+    tesserocr's default tessdata directory, or in TESSDATA_PREFIX when set """
+
+    def __init__(self, lang: str = "eng", size: int = 1):
+        """
+        Args:
+            lang (str, optional): tesseract language code. Defaults to "eng"
+            size (int, optional): number of loaded APIs to keep. Defaults to 1
+
+        Raises:
+            ImportError: if tesserocr is not installed
+        """
+        # optional dependency so only import when this engine is requested
+        import tesserocr
+
+        self.lang = lang
+        self._apis = queue.Queue()
+        for _ in range(max(size, 1)):
+            self._apis.put(tesserocr.PyTessBaseAPI(lang=lang))
+
+    def image_to_string(self, image: np.array) -> str:
+        """ OCR an image using the next free API in the pool
+
+        Args:
+            image (np.array): greyscale or BGR image
+
+        Returns:
+            str: the recognised text
+        """
+        api = self._apis.get()
+        try:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+        finally:
+            self._apis.put(api)
+
+    def image_to_data(self, image: np.array) -> Tuple[str, List[Word]]:
+        """ OCR an image once, returning the words along with the text. The
+        text and words are both read from the same recognition
+
+        Args:
+            image (np.array): greyscale or BGR image
+
+        Returns:
+            tuple(str, list(Word)): the recognised text and words
+        """
+        import tesserocr
+
+        level = tesserocr.RIL.WORD
+        words = []
+        api = self._apis.get()
+        try:
+            self._set_image(api, image)
+            api.Recognize()
+            text = api.GetUTF8Text()
+            iterator = api.GetIterator()
+            if iterator is not None:
+                for word in tesserocr.iterate_level(iterator, level):
+                    word_text = (word.GetUTF8Text(level) or "").strip()
+                    corners = word.BoundingBox(level)
+                    if not word_text or corners is None:
+                        continue
+                    left, top, right, bottom = corners
+                    words.append(
+                        Word(
+                            word_text,
+                            float(word.Confidence(level)),
+                            (left, top, right - left, bottom - top),
+                        )
+                    )
+            return text, words
+        finally:
+            self._apis.put(api)
+
+    @staticmethod
+    def _set_image(api, image: np.array) -> None:
+        """ hand an image to a Tesseract API """
+        if image.ndim == 3:
+            # tesserocr expects RGB ordering for colour data
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[0], image.shape[1]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(
+            image.tobytes(), width, height, bytes_per_pixel, image.strides[0]
+        )
+
+    def version(self) -> str:
+        """ the engine and tesseract version plus language, which identify the
+        model producing our results """
+        import tesserocr
+
+        return f"tesserocr {tesserocr.tesseract_version()} {self.lang}"
+
+    def close(self) -> None:
+        """ release the loaded Tesseract APIs """
+        while not self._apis.empty():
+            self._apis.get().End()
+
+
+# engines already created by get_engine in this process
+_ENGINE_CACHE: Dict[Tuple, object] = {}
+
+
+def create_engine(
+    name: str = "auto", lang: str = "eng", tesseract_cmd: str = None, size: int = 1,
+):
+    """ Create a new OCR engine by name. "auto" uses tesserocr when it is
+    installed and falls back to pytesseract otherwise. An unknown name raises a
+    ValueError
+
+    Args:
+        name (str, optional): one of ENGINES. Defaults to "auto"
+        lang (str, optional): tesseract language code. Defaults to "eng"
+        tesseract_cmd (str, optional): tesseract executable for pytesseract.
+            Defaults to None
+        size (int, optional): pool size for long lived engines. Defaults to 1
+
+    Returns:
+        PytesseractEngine or TesserocrEngine: the OCR engine
+    """
+    if name not in ENGINES:
+        raise ValueError(f"unknown OCR engine {name}, choose from {ENGINES}")
+    if name in ("auto", "tesserocr"):
+        try:
+            return TesserocrEngine(lang=lang, size=size)
+        except ImportError:
+            if name == "tesserocr":
+                raise
+    return PytesseractEngine(lang=lang, tesseract_cmd=tesseract_cmd)
+
+
+def get_engine(
+    name: str = "auto", lang: str = "eng", tesseract_cmd: str = None, size: int = 1,
+):
+    """ Get an OCR engine, reusing one already created in this process with the
+    same settings. This keeps long lived engines (and their loaded models)
+    warm across calls, including in pool workers
+
+    Args:
+        name (str, optional): one of ENGINES. Defaults to "auto"
+        lang (str, optional): tesseract language code. Defaults to "eng"
+        tesseract_cmd (str, optional): tesseract executable for pytesseract.
+            Defaults to None
+        size (int, optional): pool size for long lived engines. Defaults to 1
+
+    Returns:
+        PytesseractEngine or TesserocrEngine: the OCR engine
+    """
+    key = (name, lang, tesseract_cmd, size)
+    if key not in _ENGINE_CACHE:
+        _ENGINE_CACHE[key] = create_engine(name, lang, tesseract_cmd, size)
+    return _ENGINE_CACHE[key]
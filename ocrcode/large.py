@@ -0,0 +1,315 @@
+""" Memory bounded processing of very large scans, eg 600dpi A0 drawings. The
+page is found on a reduced decode of the file, then unwarped tile by tile from
+a memory mapped copy of the full image and OCRed strip by strip, so the working
+memory stays within a configurable limit however large the scan is. The one
+exception is the first full decode of the file, which OpenCV can only do whole:
+about 3 bytes a pixel, 900MB for 300 megapixels, outside the limit """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import hashlib
+import math
+import os
+import tempfile
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode import batch
+from ocrcode import ocr
+from ocrcode.pipeline import DocumentPipeline, Result, map_words, mean_confidence
+from ocrcode.profiling import StageProfiler
+
+# default memory limit of the stages after the full decode of a single image
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024
+# fraction of the memory limit used for tiles and strips, the rest is left for
+# the interpreter, the libraries and the reduced decode
+WORKING_FRACTION = 0.5
+# reduced decodes to try for page detection, smallest first
+REDUCTIONS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# working bytes per output pixel while unwarping a tile: the BGR and grey
+# source crop, which is up to twice the tile area when the page is rotated,
+# plus the warped tile
+UNWARP_BYTES_PER_PIXEL = 10
+# working bytes per page pixel while OCRing a strip: the strip, its median
+# blurred and thresholded copies and the copy handed to the OCR engine
+OCR_BYTES_PER_PIXEL = 4
+# fewest rows worth OCRing in a strip, a couple of lines of large text
+MIN_STRIP_ROWS = 64
+# rows with at most this fraction of dark pixels count as blank
+BLANK_ROW_INK = 0.002
+
+
+def read_reduced(path: str, detection_size: int) -> Tuple[np.array, int]:
+    """ decode an image at the smallest reduced scale that still has at least
+    detection_size pixels on its longest side, so the full image is never
+    decoded just to find the page
+
+    Args:
+        path (str): image file
+        detection_size (int): longest side needed for page detection
+
+    Returns:
+        tuple(np.array, int): the reduced BGR image and its reduction factor
+
+    Raises:
+        IOError: if the file cannot be decoded
+    """
+    for factor, flag in REDUCTIONS:
+        image = cv2.imread(path, flag)
+        if image is None:
+            raise IOError(f"unable to read image {path}")
+        if max(image.shape[:2]) >= detection_size:
+            return image, factor
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"unable to read image {path}")
+    return image, 1
+
+
+def open_source(path: str, cache_dir: str = None) -> np.array:
+    """ memory map the full resolution image. The file is decoded once into a
+    raw .npy copy and mapped from there, so only the parts of the image being
+    worked on are paged in. Compressed formats cannot be decoded piecewise, so
+    the decode holds the whole image in memory, 3 bytes a pixel, and is not
+    covered by the memory limit of process_large_image. With cache_dir that
+    happens once per file rather than once per run
+
+    Args:
+        path (str): image file
+        cache_dir (str, optional): directory to keep raw copies in so later
+            runs skip the decode, None for a temporary copy deleted once
+            unused. Defaults to None
+
+    Returns:
+        np.array: read only memory mapped BGR image
+
+    Raises:
+        IOError: if the file cannot be decoded
+    """
+    if cache_dir is not None:
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        key = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        raw_path = os.path.join(cache_dir, key + ".npy")
+        if os.path.exists(raw_path):
+            return np.load(raw_path, mmap_mode="r")
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"unable to read image {path}")
+    if cache_dir is None:
+        source = _temporary_memmap(image.shape, None)
+        source[:] = image
+        return source
+    os.makedirs(cache_dir, exist_ok=True)
+    # write then rename so other processes never map a partial copy
+    with open(raw_path + ".tmp", "wb") as raw_file:
+        np.save(raw_file, image)
+    os.replace(raw_path + ".tmp", raw_path)
+    del image
+    return np.load(raw_path, mmap_mode="r")
+
+
+def _temporary_memmap(shape: Tuple[int, ...], directory: str) -> np.array:
+    """ a writable uint8 memory map backed by a temporary file, which is deleted
+    once the map is no longer used """
+    return np.memmap(
+        tempfile.TemporaryFile(dir=directory), dtype=np.uint8, mode="w+", shape=shape
+    )
+
+
+def unwarp_tiles(
+    source: np.array,
+    quad: np.array,
+    margin: int,
+    lut: np.array,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    directory: str = None,
+) -> Tuple[np.array, np.array]:
+    """ unwarp and level a page tile by tile into a memory mapped greyscale
+    page, see ocr.unwarp_and_level. Each tile only reads the part of the
+    source that maps onto it
+
+    Args:
+        source (np.array): BGR image, usually memory mapped
+        quad (np.array): ordered 4x1x2 corners of the page in source
+        margin (int): pixels to trim from the edges of the page
+        lut (np.array): levelling table from ocr.level_lut
+        memory_limit (int, optional): working memory allowed in bytes.
+            Defaults to DEFAULT_MEMORY_LIMIT
+        directory (str, optional): where to put the temporary page file, None
+            for the system default. Defaults to None
+
+    Returns:
+        tuple(np.array, np.array): the memory mapped page, and the fraction of
+            dark pixels in each of its rows
+    """
+    (height,), (width,) = ocr.get_quadrilateral_dimensions(quad)
+    transform = ocr.unwarp_transform(quad, margin)
+    inverse = np.linalg.inv(transform)
+    page_height, page_width = max(height - 2 * margin, 1), max(width - 2 * margin, 1)
+    page = _temporary_memmap((page_height, page_width), directory)
+    row_ink = np.zeros(page_height, np.int64)
+    tile = max(int(math.sqrt(memory_limit / UNWARP_BYTES_PER_PIXEL)), 16)
+    for top in range(0, page_height, tile):
+        bottom = min(top + tile, page_height)
+        for left in range(0, page_width, tile):
+            right = min(left + tile, page_width)
+            # the part of the source that maps onto this tile, padded so
+            # interpolation at the tile edges sees the same pixels
+            corners = np.float32(
+                [[left, top], [right, top], [left, bottom], [right, bottom]]
+            ).reshape((4, 1, 2))
+            source_corners = cv2.perspectiveTransform(corners, inverse).reshape((4, 2))
+            x0, y0 = np.floor(source_corners.min(axis=0)).astype(int) - 2
+            x1, y1 = np.ceil(source_corners.max(axis=0)).astype(int) + 2
+            x0, y0 = max(x0, 0), max(y0, 0)
+            x1, y1 = min(x1, source.shape[1]), min(y1, source.shape[0])
+            if x1 <= x0 or y1 <= y0:
+                # the tile lies outside the photo, which warpPerspective
+                # would fill with black
+                page[top:bottom, left:right] = lut[0]
+                continue
+            grey = cv2.cvtColor(np.asarray(source[y0:y1, x0:x1]), cv2.COLOR_BGR2GRAY)
+            # map crop coordinates onto tile coordinates
+            shift_source = np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], np.float64)
+            shift_tile = np.array([[1, 0, -left], [0, 1, -top], [0, 0, 1]], np.float64)
+            tile_image = cv2.warpPerspective(
+                grey,
+                shift_tile @ transform @ shift_source,
+                (right - left, bottom - top),
+            )
+            cv2.LUT(tile_image, lut, dst=tile_image)
+            page[top:bottom, left:right] = tile_image
+            row_ink[top:bottom] += np.count_nonzero(tile_image < 128, axis=1)
+    return page, row_ink / page_width
+
+
+def find_strip_breaks(
+    row_ink: np.array, max_rows: int, blank: float = BLANK_ROW_INK
+) -> List[int]:
+    """ split a page into strips of at most max_rows rows, cutting through
+    blank rows where possible so no line of text is cut in half
+
+    Args:
+        row_ink (np.array): fraction of dark pixels in each row
+        max_rows (int): tallest strip allowed
+        blank (float, optional): rows with at most this much ink are blank.
+            Defaults to BLANK_ROW_INK
+
+    Returns:
+        list(int): strip boundaries, starting at 0 and ending at the page height
+    """
+    breaks = [0]
+    rows = len(row_ink)
+    while rows - breaks[-1] > max_rows:
+        # search the second half of the largest strip so strips stay large
+        start = breaks[-1] + max(max_rows // 2, 1)
+        window = row_ink[start : breaks[-1] + max_rows]
+        blank_rows = np.flatnonzero(window <= blank)
+        # the last blank row, otherwise the emptiest row
+        offset = blank_rows[-1] if len(blank_rows) else int(np.argmin(window))
+        breaks.append(start + int(offset))
+    breaks.append(rows)
+    return breaks
+
+
+def process_large_image(
+    pipeline: DocumentPipeline,
+    path: str,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    cache_dir: str = None,
+) -> Result:
+    """ find, straighten and OCR the page in a very large image file within a
+    memory limit, of which WORKING_FRACTION is used for tiles and strips. The
+    limit covers the stages after the full decode, see open_source, and is
+    enforced as a limit on heap growth where the platform allows, see
+    batch.limit_memory_growth. The page is OCRed at its native resolution, so
+    the magnification in the pipeline config is not applied
+
+    Args:
+        pipeline (DocumentPipeline): supplies the config, page detection and
+            OCR engine
+        path (str): image file
+        memory_limit (int, optional): memory allowed in bytes. Defaults to
+            DEFAULT_MEMORY_LIMIT
+        cache_dir (str, optional): directory to keep raw copies of the image
+            in, see open_source. Defaults to None
+
+    Returns:
+        Result: the text, words, the page corners in full resolution
+            coordinates and the memory mapped page
+
+    Raises:
+        MemoryError: if a single strip of the page does not fit in the limit,
+            or the stages after the decode exceed it
+    """
+    config = pipeline.config
+    working_memory = int(memory_limit * WORKING_FRACTION)
+    profiler = StageProfiler(pipeline.hooks)
+    reduced, _ = read_reduced(path, config.detection_size or config.processing_size)
+    profiler.lap("decode", reduced)
+    reduced_quad = pipeline.locate(reduced, profiler)
+    source = open_source(path, cache_dir)
+    profiler.lap("source")
+    # decoding needs the whole image in memory, so is outside the limit
+    with batch.limit_memory_growth(memory_limit):
+        quad = ocr.scale_quadrilateral(
+            reduced_quad, max(source.shape[:2]) / max(reduced.shape[:2])
+        )
+        margin = int(max(source.shape[:2]) * config.margin)
+        lut = ocr.level_lut(config.contrast, config.brightness)
+        page, row_ink = unwarp_tiles(
+            source, quad, margin, lut, working_memory, cache_dir
+        )
+        profiler.lap("unwarp")
+        max_rows = working_memory // (page.shape[1] * OCR_BYTES_PER_PIXEL)
+        if max_rows < MIN_STRIP_ROWS:
+            needed = page.shape[1] * OCR_BYTES_PER_PIXEL * MIN_STRIP_ROWS
+            raise MemoryError(
+                f"a {page.shape[1]} pixel wide page needs a memory limit of at least "
+                f"{int(needed / WORKING_FRACTION)} bytes"
+            )
+        breaks = find_strip_breaks(row_ink, max_rows)
+        texts = []
+        words = []
+        for top, bottom in zip(breaks, breaks[1:]):
+            if row_ink[top:bottom].max() <= BLANK_ROW_INK:
+                # nothing to read
+                continue
+            clean_strip = ocr.improve_image_quality(
+                np.asarray(page[top:bottom]),
+                threshold=config.threshold,
+                verbose=False,
+                scale=1,
+            )
+            text, strip_words = pipeline.read(clean_strip)
+            if text.strip():
+                texts.append(text.strip())
+            if strip_words is None:
+                words = None
+            elif words is not None:
+                # move each word box from its strip onto the page
+                words.extend(
+                    word._replace(box=(word.box[0], top + word.box[1]) + word.box[2:])
+                    for word in strip_words
+                )
+        transform = ocr.page_transform(quad, margin, page.shape, page.shape)
+        if words is not None:
+            words = map_words(words, transform)
+    profiler.lap("ocr")
+    return Result(
+        text="\n".join(texts),
+        quad=quad,
+        image=page,
+        timings=profiler.timings,
+        metrics=profiler.metrics,
+        magnification=1.0,
+        confidence=mean_confidence(words),
+        words=words,
+        page_transform=transform,
+    )
@@ -2,7 +2,9 @@ import cv2
 import numpy as np
 import os
 import sys
-from typing import Union, List, Tuple
+from typing import Iterable, Iterator, Union, List, Tuple
+
+from ocrcode.buffers import BufferPool
 
 
 def get_paths(*file_names: str) -> Union[List[str], None]:
@@ -26,6 +28,19 @@ def get_paths(*file_names: str) -> Union[List[str], None]:
         raise FileNotFoundError("No valid input image files specified")
 
 
+def iter_paths(file_names: Iterable[str]) -> Iterator[str]:
+    """lazily convert file strings to absolute paths, see get_paths
+
+    Args:
+        file_names (iterable(str)): file location strings
+
+    Yields:
+        str: absolute paths
+    """
+    for file_name in file_names:
+        yield os.path.abspath(file_name)
+
+
 def scale_longest_axis(image: np.array, new_size=512) -> np.array:
     """resize an image so its longest axis (height or width) equals the 
     specified new size. Choose appropriate interpolation depending on whether 
@@ -69,7 +84,7 @@ def preprocess_image(
     is black and white lineart ready for edge detection
 
     Args:
-        image (np.array): the input image as a numpy array
+        image (np.array): the input image as a numpy array, greyscale or BGR
         size (int): resize the maximum dimension to this many pixels
         blur (int): size of gaussian blur to apply
         threshold_high (int): upper edge detection threshold
@@ -79,8 +94,11 @@ def preprocess_image(
     Returns:
         np.array: the preprocessed image as a numpy array
     """
-    # greyscale
-    processed_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # greyscale, unless we were given a greyscale image already
+    if image.ndim == 3:
+        processed_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        processed_image = image
     # blur
     processed_image = cv2.GaussianBlur(processed_image, (blur, blur), 0)
     # edge detect
@@ -92,8 +110,17 @@ def preprocess_image(
     return processed_image
 
 
+# fallbacks get_contour_from_mask can use when no contour simplifies to a quad
+CONTOUR_FALLBACKS = (None, "hull", "rect")
+
+
 def get_contour_from_mask(
-    mask: np.array, min_area: int, epsilon: int, contour_check: np.array, verbose=True,
+    mask: np.array,
+    min_area: int,
+    epsilon: int,
+    contour_check: np.array = None,
+    verbose=True,
+    fallback: str = None,
 ) -> np.array:
     """takes a black and white input image and returns the largest continuous
     quadrilateral contour found
@@ -103,35 +130,123 @@ def get_contour_from_mask(
         min_area (int): minimum area of quads to be allowed in pixels
         epsilon (int): tuning parameter for cv2.approxPolyDP
             See https://en.wikipedia.org/wiki/Ramer-Douglas-Peucker_algorithm
-        contour_check (numpy.array): image to allow visual investigation 
-            of contouring
+        contour_check (numpy.array, optional): image to allow visual
+            investigation of contouring, only drawn on when verbose. Defaults
+            to None
+        fallback (str, optional): what to do when no contour simplifies to a
+            quadrilateral, one of CONTOUR_FALLBACKS:
+            None: return a dummy 10 pixel quad at the origin
+            "hull": simplify the convex hulls of the contours instead, which
+                copes with pages whose edges are partly hidden by clutter
+            "rect": the minimum area rectangle of the largest contour
+            Defaults to None
 
     Returns:
-        np.array: [description]
+        np.array: 4x1x2 corners of the quadrilateral
     """
-    # get only external contours from the group
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-    largest_quadrilateral = np.array([[[0, 0]], [[10, 0]], [[0, 10]], [[10, 10]]])
-    largest_area = min_area
-    # pick the largest quadrilateral contour we are assuming that will be the target
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        cv2.drawContours(contour_check, contour, -1, (255, 0, 0), 3)  ###
-        # check if contour is the largest we have found
-        if area > largest_area:
-            perimeter = cv2.arcLength(contour, closed=True)
-            # simplify to a polygon
-            # https://en.wikipedia.org/wiki/Ramer-Douglas-Peucker_algorithm
-            simplified = cv2.approxPolyDP(
-                contour, epsilon=(epsilon * perimeter), closed=True
-            )
-            # check if the polygon is quadrilateral and update our candidate if so
-            if len(simplified) == 4:
-                largest_quadrilateral = simplified
-                largest_area = area
-    if verbose:
-        cv2.imshow("contours", contour_check)  ###
-    return largest_quadrilateral
+    if fallback not in CONTOUR_FALLBACKS:
+        raise ValueError(f"unknown contour fallback {fallback}")
+    candidates = _find_candidate_contours(mask, min_area, contour_check, verbose)
+    # we are assuming the largest quadrilateral contour will be the target
+    for contour in candidates:
+        quad = _simplify_to_quadrilateral(contour, epsilon)
+        if quad is not None:
+            return quad
+    if fallback == "hull":
+        for contour in candidates:
+            quad = _simplify_to_quadrilateral(cv2.convexHull(contour), epsilon)
+            if quad is not None:
+                return quad
+    elif fallback == "rect" and candidates:
+        corners = cv2.boxPoints(cv2.minAreaRect(candidates[0]))
+        return np.round(corners).astype(np.int32).reshape((4, 1, 2))
+    return np.array([[[0, 0]], [[10, 0]], [[0, 10]], [[10, 10]]])
+
+
+def get_quadrilaterals_from_mask(
+    mask: np.array,
+    min_area: int,
+    epsilon: int,
+    max_count: int = None,
+    max_overlap: float = 0.1,
+    contour_check: np.array = None,
+    verbose=True,
+    fallback: str = None,
+) -> List[np.array]:
+    """takes a black and white input image and returns every separate
+    quadrilateral contour found, eg several cards or receipts in one photo
+
+    Args:
+        mask (np.array): monochrome image (white are areas to be contoured)
+        min_area (int): minimum area of quads to be allowed in pixels
+        epsilon (int): tuning parameter for cv2.approxPolyDP
+        max_count (int, optional): most quads to return, None for all.
+            Defaults to None
+        max_overlap (float, optional): largest fraction of the smaller of two
+            quads that may overlap the other, more overlap keeps only the
+            larger. Defaults to 0.1
+        contour_check (numpy.array, optional): image to allow visual
+            investigation of contouring, only drawn on when verbose. Defaults
+            to None
+        fallback (str, optional): applied to each contour that does not
+            simplify to a quadrilateral, see get_contour_from_mask. Defaults
+            to None
+
+    Returns:
+        list(np.array): 4x1x2 corners of each quadrilateral, largest first
+    """
+    if fallback not in CONTOUR_FALLBACKS:
+        raise ValueError(f"unknown contour fallback {fallback}")
+    quads = []
+    for contour in _find_candidate_contours(mask, min_area, contour_check, verbose):
+        if max_count is not None and len(quads) >= max_count:
+            break
+        quad = _simplify_to_quadrilateral(contour, epsilon)
+        if quad is None and fallback == "hull":
+            quad = _simplify_to_quadrilateral(cv2.convexHull(contour), epsilon)
+        elif quad is None and fallback == "rect":
+            corners = cv2.boxPoints(cv2.minAreaRect(contour))
+            quad = np.round(corners).astype(np.int32).reshape((4, 1, 2))
+        if quad is None:
+            continue
+        # a smaller quad inside or across a larger one is not a separate page
+        hull = np.float32(cv2.convexHull(quad))
+        area = cv2.contourArea(hull)
+        if all(
+            cv2.intersectConvexConvex(hull, other)[0]
+            <= max_overlap * min(area, cv2.contourArea(other))
+            for other in (np.float32(cv2.convexHull(kept)) for kept in quads)
+        ):
+            quads.append(quad)
+    return quads
+
+
+def _find_candidate_contours(
+    mask: np.array, min_area: int, contour_check: np.array, verbose: bool
+) -> List[np.array]:
+    """the external contours of a mask large enough to be a page, largest first
+    """
+    # get only external contours from the group, straight runs compressed to
+    # their end points as approxPolyDP only needs the corners
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if verbose and contour_check is not None:
+        cv2.drawContours(contour_check, contours, -1, (255, 0, 0), 3)
+        cv2.imshow("contours", contour_check)
+    areas = [cv2.contourArea(contour) for contour in contours]
+    return [
+        contours[index]
+        for index in sorted(range(len(areas)), key=lambda i: areas[i], reverse=True)
+        if areas[index] > min_area
+    ]
+
+
+def _simplify_to_quadrilateral(contour: np.array, epsilon: float) -> np.array:
+    """simplify a contour to a polygon, returning it if it is a quadrilateral
+    or None otherwise"""
+    perimeter = cv2.arcLength(contour, closed=True)
+    # https://en.wikipedia.org/wiki/Ramer-Douglas-Peucker_algorithm
+    simplified = cv2.approxPolyDP(contour, epsilon=(epsilon * perimeter), closed=True)
+    return simplified if len(simplified) == 4 else None
 
 
 def order_quadrilateral(quad: np.array) -> np.array:
@@ -159,6 +274,47 @@ def order_quadrilateral(quad: np.array) -> np.array:
     return ordered_quad
 
 
+def order_quadrilaterals(quads: np.array) -> np.array:
+    """ order_quadrilateral for a batch of quads in a single vectorised pass
+
+    Args:
+        quads (np.array): Nx4x2 or Nx4x1x2 array of corners
+
+    Returns:
+        np.array: Nx4x1x2 array of corners ordered top left, top right, bottom
+            left, bottom right
+    """
+    quads = np.asarray(quads).reshape((-1, 4, 2))
+    quad_sum = quads.sum(axis=2)
+    quad_diff = quads[:, :, 1] - quads[:, :, 0]
+    # indices of the top left, top right, bottom left and bottom right corners
+    corners = np.stack(
+        [
+            quad_sum.argmin(axis=1),
+            quad_diff.argmin(axis=1),
+            quad_diff.argmax(axis=1),
+            quad_sum.argmax(axis=1),
+        ],
+        axis=1,
+    )
+    ordered = np.take_along_axis(quads, corners[:, :, None], axis=1)
+    return ordered.astype(np.int32).reshape((-1, 4, 1, 2))
+
+
+def scale_quadrilateral(quad: np.array, factor: float) -> np.array:
+    """scale the corner coordinates of a quadrilateral, eg to map a quad found
+    on a downscaled image back onto the full resolution original
+
+    Args:
+        quad (np.array): 4x1x2 or 4x2 array of corners
+        factor (float): scale factor to apply
+
+    Returns:
+        np.array: scaled corners of the same shape, rounded to integers
+    """
+    return np.round(quad * factor).astype(np.int32)
+
+
 def get_parallelogram_dimensions(quad: np.array) -> Tuple[int, int]:
     """gets the width and height of a parallelogram whose corner coordinates
     are defined in a np.array((4,2)) 
@@ -180,62 +336,461 @@ def get_parallelogram_dimensions(quad: np.array) -> Tuple[int, int]:
     return height, width
 
 
-def unwarp_quadrilateral(image: np.array, quad: np.array, margin=1,) -> np.array:
-    """extracts a quadrilateral segment of an image and unwarps into a rectangle
-    trimming off a margin round the edge as desired
+def unwarp_transform(quad: np.array, margin: int = 0) -> np.array:
+    """ the perspective transform used to unwarp a quadrilateral into a
+    rectangle, see unwarp_quadrilateral
 
     Args:
-        image (np.array): image to be unwarped
         quad (np.array): 4x2 array designating the quadrilateral to be unwwarped
-        margin (int, optional): margin to trim from unwarped image. Defined in
-            pixels. Defaults to 1
+        margin (int, optional): margin trimmed from the unwarped image, which
+            shifts the rectangle up and left. Defaults to 0
 
     Returns:
-        np.array: [description]
+        np.array: 3x3 matrix taking image points to unwarped page points
     """
     # drop uneeded axis if present
     quad_2d = quad.reshape((4, 2))
-    # calculate height and width of our quadrilateral (approx parallelogram)
-    height, width = get_parallelogram_dimensions(quad_2d)
+    # sized as unwarp_transforms sizes a batch, so both give the same page
+    (height,), (width,) = get_quadrilateral_dimensions(quad_2d)
     # get our source quad in float 32
     area_view = np.float32(quad_2d)
     # define our target rectangle
-    area_target = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+    area_target = np.float32(
+        [[0, 0], [width, 0], [0, height], [width, height]]
+    ) - np.float32(margin)
+    return cv2.getPerspectiveTransform(area_view, area_target)
+
+
+def page_transform(
+    quad: np.array,
+    margin: int,
+    page_shape: Tuple[int, ...],
+    ocr_shape: Tuple[int, ...],
+    scale: float = 1.0,
+) -> np.array:
+    """ the perspective transform taking points on a page prepared for OCR
+    back onto the image the page was found in. Undoes the magnification, the
+    margin and the unwarp, then scales by scale, eg to go from the processing
+    sized image to the original
+
+    Args:
+        quad (np.array): ordered corners of the page that was unwarped
+        margin (int): pixels trimmed from the edges of the unwarped page
+        page_shape (tuple): shape of the unwarped page
+        ocr_shape (tuple): shape of the page after magnification
+        scale (float, optional): scale from the image quad is in to the
+            image wanted. Defaults to 1.0
+
+    Returns:
+        np.array: 3x3 matrix taking OCR page points to image points
+    """
+    unmagnify = np.diag(
+        [
+            page_shape[1] / max(ocr_shape[1], 1),
+            page_shape[0] / max(ocr_shape[0], 1),
+            1.0,
+        ]
+    )
+    rescale = np.diag([scale, scale, 1.0])
+    return rescale @ np.linalg.inv(unwarp_transform(quad, margin)) @ unmagnify
+
+
+def map_boxes(boxes: List[Tuple[int, int, int, int]], transform: np.array) -> np.array:
+    """ map rectangles through a perspective transform, eg word boxes on the
+    page prepared for OCR onto the original image, see page_transform
+
+    Args:
+        boxes (list(tuple(int, int, int, int))): x, y, width, height of each box
+        transform (np.array): 3x3 perspective transform
+
+    Returns:
+        np.array: Nx4x2 corners of each box in the order top left, top right,
+            bottom left, bottom right, rounded to integers
+    """
+    if len(boxes) == 0:
+        return np.zeros((0, 4, 2), np.int32)
+    x, y, width, height = np.float64(boxes).T
+    corners = np.stack(
+        [
+            np.stack([x, y], axis=1),
+            np.stack([x + width, y], axis=1),
+            np.stack([x, y + height], axis=1),
+            np.stack([x + width, y + height], axis=1),
+        ],
+        axis=1,
+    )
+    mapped = cv2.perspectiveTransform(corners.reshape((-1, 1, 2)), transform)
+    return np.round(mapped).astype(np.int32).reshape((-1, 4, 2))
+
+
+def get_quadrilateral_dimensions(quads: np.array) -> Tuple[np.array, np.array]:
+    """ the output height and width of a batch of ordered quads. Unlike
+    get_parallelogram_dimensions every edge is measured and the longer of each
+    opposite pair is used, so a page seen at an angle is not squashed
+
+    Args:
+        quads (np.array): Nx4x2 or Nx4x1x2 array of ordered corners
+
+    Returns:
+        tuple(np.array, np.array): integer heights and widths of each quad
+    """
+    quads = np.asarray(quads, np.float64).reshape((-1, 4, 2))
+    top_left, top_right, bottom_left, bottom_right = (
+        quads[:, index] for index in range(4)
+    )
+    widths = np.maximum(
+        np.hypot(*(top_right - top_left).T), np.hypot(*(bottom_right - bottom_left).T)
+    )
+    heights = np.maximum(
+        np.hypot(*(bottom_left - top_left).T), np.hypot(*(bottom_right - top_right).T)
+    )
+    return heights.astype(int), widths.astype(int)
+
+
+def unwarp_transforms(
+    quads: np.array, margin: int = 0
+) -> Tuple[np.array, np.array, np.array]:
+    """ unwarp_transform for a batch of ordered quads, solving every
+    perspective transform at once rather than calling
+    cv2.getPerspectiveTransform for each. The target rectangles use
+    get_quadrilateral_dimensions
+
+    Args:
+        quads (np.array): Nx4x2 or Nx4x1x2 array of ordered corners
+        margin (int, optional): margin trimmed from the unwarped images, which
+            shifts each rectangle up and left. Defaults to 0
+
+    Returns:
+        tuple(np.array, np.array, np.array): Nx3x3 matrices taking image
+            points to unwarped page points, and the heights and widths of the
+            untrimmed pages
+    """
+    source = np.asarray(quads, np.float64).reshape((-1, 4, 2))
+    heights, widths = get_quadrilateral_dimensions(source)
+    zeros = np.zeros_like(widths)
+    target = np.stack(
+        [
+            np.stack([zeros, zeros], axis=1),
+            np.stack([widths, zeros], axis=1),
+            np.stack([zeros, heights], axis=1),
+            np.stack([widths, heights], axis=1),
+        ],
+        axis=1,
+    ) - float(margin)
+    # each corner gives two rows of the 8x8 system for the matrix entries
+    x, y = source[:, :, 0], source[:, :, 1]
+    u, v = target[:, :, 0], target[:, :, 1]
+    ones, nothing = np.ones_like(x), np.zeros_like(x)
+    u_rows = np.stack([x, y, ones, nothing, nothing, nothing, -x * u, -y * u], axis=2)
+    v_rows = np.stack([nothing, nothing, nothing, x, y, ones, -x * v, -y * v], axis=2)
+    system = np.concatenate([u_rows, v_rows], axis=1)
+    values = np.concatenate([u, v], axis=1)
+    try:
+        solution = np.linalg.solve(system, values[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # a quad with repeated corners. Least squares copes with it, as
+        # getPerspectiveTransform does, rather than failing the whole batch
+        solution = (np.linalg.pinv(system) @ values[:, :, None])[:, :, 0]
+    transforms = np.concatenate(
+        [solution, np.ones((len(solution), 1))], axis=1
+    ).reshape((-1, 3, 3))
+    return transforms, heights, widths
+
+
+def _trim(image: np.array, margin: int) -> np.array:
+    """ crop margin pixels from each edge of an image. Slicing to -margin
+    would keep nothing when margin is 0
+
+    Args:
+        image (np.array): image to be trimmed
+        margin (int): pixels to remove from each edge
+
+    Returns:
+        np.array: view of the trimmed image
+    """
+    height, width = image.shape[:2]
+    return image[margin : height - margin, margin : width - margin]
+
+
+def unwarp_quadrilateral(
+    image: np.array, quad: np.array, margin=1,
+) -> Union[np.array, List[np.array]]:
+    """extracts a quadrilateral segment of an image and unwarps into a rectangle
+    trimming off a margin round the edge as desired. Also accepts a batch of
+    quads, whose transforms are then found together by unwarp_transforms
+
+    Args:
+        image (np.array): image to be unwarped
+        quad (np.array): 4x2 array designating the quadrilateral to be unwwarped,
+            or an Nx4x2 or Nx4x1x2 batch of them
+        margin (int, optional): margin to trim from unwarped image. Defined in
+            pixels. Defaults to 1
+
+    Returns:
+        np.array or list(np.array): the unwarped image, or a list of them for a
+            batch
+    """
+    # a batch rather than a single 4x2 or 4x1x2 quad
+    if quad.ndim >= 3 and quad.shape[1] == 4:
+        transforms, heights, widths = unwarp_transforms(quad)
+        return [
+            _trim(
+                cv2.warpPerspective(image, transform, (int(width), int(height))),
+                margin,
+            )
+            for transform, height, width in zip(transforms, heights, widths)
+        ]
+    # calculate height and width of our quadrilateral, as for a batch
+    (height,), (width,) = get_quadrilateral_dimensions(quad)
     # define a transform between the quad and the rectangle
-    transform = cv2.getPerspectiveTransform(area_view, area_target)
+    transform = unwarp_transform(quad)
     # apply that transform to our image
-    transformed_image = cv2.warpPerspective(image, transform, (width, height))
+    transformed_image = cv2.warpPerspective(image, transform, (int(width), int(height)))
     # edges tend to be untidy so crop in to aid OCR
-    cropped_image = transformed_image[margin:-margin, margin:-margin]
+    cropped_image = _trim(transformed_image, margin)
     # imgCropped = cv2.resize(imgCropped,(widthImg,heightImg))
     return cropped_image
 
 
+def level_lut(contrast: float, brightness: float) -> np.array:
+    """ build a lookup table applying contrast and brightness to 8 bit pixels,
+    giving the same result as cv2.addWeighted(image, contrast, image, 0,
+    brightness) for a fraction of the arithmetic
+
+    Args:
+        contrast (float): multiplier applied to each pixel
+        brightness (float): offset added to each pixel
+
+    Returns:
+        np.array: 256 entry uint8 table for cv2.LUT
+    """
+    # addWeighted works in single precision for 8 bit images and rounds half
+    # to even, as np.round does
+    values = np.arange(256, dtype=np.float32) * np.float32(contrast)
+    values += np.float32(brightness)
+    return np.clip(np.round(values), 0, 255).astype(np.uint8)
+
+
+def unwarp_and_level(
+    grey_image: np.array, quad: np.array, margin: int = 1, lut: np.array = None,
+) -> np.array:
+    """ fused version of unwarp_quadrilateral followed by greyscale and
+    levelling. The margin is trimmed by the warp itself, so only the pixels we
+    keep are ever interpolated, and levelling is a lookup applied in place to
+    the warped page, so the only array allocated is the result
+
+    Args:
+        grey_image (np.array): greyscale image to be unwarped
+        quad (np.array): 4x2 array designating the quadrilateral to be unwwarped
+        margin (int, optional): margin to trim from unwarped image. Defined in
+            pixels. Defaults to 1
+        lut (np.array, optional): levelling table from level_lut, None to skip
+            levelling. Defaults to None
+
+    Returns:
+        np.array: the unwarped and levelled greyscale page
+    """
+    (height,), (width,) = get_quadrilateral_dimensions(quad)
+    # shift the target rectangle so the margin falls outside the output
+    transform = unwarp_transform(quad, margin)
+    size = (max(int(width) - 2 * margin, 0), max(int(height) - 2 * margin, 0))
+    page = cv2.warpPerspective(grey_image, transform, size)
+    if lut is not None and page.size > 0:
+        cv2.LUT(page, lut, dst=page)
+    return page
+
+
+def estimate_text_height(image: np.array) -> float:
+    """ estimate the height of the dominant text on a page from the connected
+    components of dark ink, most of which are individual glyphs
+
+    Args:
+        image (np.array): greyscale or BGR image of a page
+
+    Returns:
+        float: median glyph height in pixels, 0 if no glyphs were found
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # dark ink becomes white foreground for the component labelling
+    ink = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    # skip the background label
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # keep components shaped like glyphs, not specks, rules or pictures
+    glyphs = (
+        (heights >= 4)
+        & (heights < image.shape[0] / 5)
+        & (areas >= 8)
+        & (widths < heights * 4)
+    )
+    if not glyphs.any():
+        return 0.0
+    return float(np.median(heights[glyphs]))
+
+
+def choose_magnification(
+    text_height: float,
+    target_height: float = 30,
+    min_scale: float = 1.0,
+    max_scale: float = 4.0,
+    fallback: float = None,
+) -> float:
+    """ choose how much to magnify a page so its text is the height Tesseract
+    reads best, without magnifying pages whose text is already large enough
+
+    Args:
+        text_height (float): estimated text height, see estimate_text_height
+        target_height (float, optional): desired text height in pixels.
+            Defaults to 30
+        min_scale (float, optional): smallest magnification. Defaults to 1.0
+        max_scale (float, optional): largest magnification. Defaults to 4.0
+        fallback (float, optional): magnification used when no text was found,
+            None for min_scale. Defaults to None
+
+    Returns:
+        float: the magnification to use
+    """
+    if text_height <= 0:
+        # a blank or unreadable page gains nothing from being made bigger
+        return min_scale if fallback is None else fallback
+    return float(np.clip(target_height / text_height, min_scale, max_scale))
+
+
+# threshold methods of improve_image_quality, which also accepts "auto"
+THRESHOLDS = ("simple", "adaptive", "otsu")
+# longest side of the thumbnail the paper brightness is measured on
+ILLUMINATION_SIZE = 64
+# spread of paper brightness across the page, in grey levels, beyond which the
+# lighting is too uneven for a single threshold
+ILLUMINATION_SPREAD = 60
+# fewest pixels that must be ink for the page to be worth choosing for
+MIN_INK = 0.001
+# a page that is mostly "ink" is shadowed or badly exposed
+MAX_INK = 0.5
+# between class over total variance below which the histogram is not clearly
+# split into ink and paper
+MIN_BIMODALITY = 0.6
+# how far the best global threshold can drift from the fixed one of the
+# simple method before otsu is used instead
+MAX_THRESHOLD_SHIFT = 40
+
+
+def choose_threshold(image: np.array) -> str:
+    """ pick the threshold method for improve_image_quality from cheap page
+    statistics, so a single OCR pass uses the right one. Uneven lighting,
+    pages that are mostly dark or without a clear split between ink and paper
+    use "adaptive", a clear split far from the fixed threshold uses "otsu",
+    and everything else "simple"
+
+    Args:
+        image (np.array): greyscale or BGR image of a page
+
+    Returns:
+        str: one of THRESHOLDS
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if image.size == 0:
+        return "simple"
+    # paper brightness, with the text removed by a small max filter. Shrinking
+    # by a whole factor takes the fast path through INTER_AREA
+    factor = int(np.ceil(max(image.shape) / ILLUMINATION_SIZE))
+    thumbnail = image
+    if factor > 1:
+        thumbnail = cv2.resize(
+            image, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA
+        )
+    paper = cv2.dilate(thumbnail, np.ones((3, 3)))
+    low, high = np.percentile(paper, (5, 95))
+    if high - low > ILLUMINATION_SPREAD:
+        return "adaptive"
+    # otsu's method from the histogram, keeping its quality measure
+    histogram = cv2.calcHist([image], [0], None, [256], [0, 256]).ravel()
+    probability = histogram / histogram.sum()
+    levels = np.arange(256)
+    class_weight = np.cumsum(probability)
+    class_mean = np.cumsum(probability * levels)
+    mean = class_mean[-1]
+    total_variance = np.sum(probability * (levels - mean) ** 2)
+    if total_variance == 0:
+        return "simple"
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between_variance = (mean * class_weight - class_mean) ** 2 / (
+            class_weight * (1 - class_weight)
+        )
+    between_variance = np.nan_to_num(between_variance, posinf=0)
+    best = np.flatnonzero(between_variance >= between_variance.max() * (1 - 1e-9))
+    # the middle of the best thresholds, they tie when the classes do not touch
+    threshold = (best[0] + best[-1]) / 2
+    bimodality = between_variance.max() / total_variance
+    ink = class_weight[int(threshold)]
+    if ink < MIN_INK:
+        # nothing much to read, keep it simple
+        return "simple"
+    if ink > MAX_INK or bimodality < MIN_BIMODALITY:
+        return "adaptive"
+    if abs(threshold - 127) > MAX_THRESHOLD_SHIFT:
+        return "otsu"
+    return "simple"
+
+
 def improve_image_quality(
-    image: np.array, threshold: str = "simple", verbose=True
+    image: np.array,
+    threshold: str = "simple",
+    verbose=True,
+    scale: float = 2,
+    buffers: BufferPool = None,
 ) -> np.array:
     """ improve the image quality for processing by OCR
 
     Args:
-        image (np.array): input image containing text
+        image (np.array): input image containing text, greyscale or BGR
         threshold (str, optional): threshold method, uses a string to 
             pick to avoid invalid methods being passed. Options are:
             "simple": generally prefered for simple images
             "adaptive": may help with local shodowing
             "otsu": useful for bimodal images eg poor exposure
+            "auto": chosen from the page, see choose_threshold
             Defaults to "simple".
+        scale (float, optional): magnification to apply before processing,
+            see choose_magnification. Defaults to 2
+        buffers (BufferPool, optional): scratch buffers to reuse for the
+            magnified and denoised intermediates, None to allocate new ones.
+            The returned image is always newly allocated. Defaults to None
 
     Returns:
         np.array: image optimised for OCR
     """
     # greyscale rectified image
-    grey_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if image.ndim == 3:
+        grey_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        grey_image = image
+    if threshold == "auto":
+        threshold = choose_threshold(grey_image)
     # magnify thie image before processing
-    large_image = cv2.resize(
-        grey_image, dsize=None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC
-    )
+    if scale == 1:
+        large_image = grey_image
+    else:
+        size = (
+            int(round(grey_image.shape[1] * scale)),
+            int(round(grey_image.shape[0] * scale)),
+        )
+        large_image = cv2.resize(
+            grey_image,
+            dsize=size,
+            dst=buffers.get("large", size[::-1]) if buffers else None,
+            interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA,
+        )
     # denoise with a median blur
-    median_image = cv2.medianBlur(large_image, ksize=3)
+    median_image = cv2.medianBlur(
+        large_image,
+        ksize=3,
+        dst=buffers.get("median", large_image.shape) if buffers else None,
+    )
     if verbose:
         cv2.imshow("medianblur", median_image)
     # threshhold image see https://stackoverflow.com/questions/28763419/
@@ -259,6 +814,54 @@ def improve_image_quality(
     return threshold_image
 
 
+def detect_text_regions(
+    image: np.array, min_height: int = 8, padding: int = 8,
+) -> List[Tuple[int, int, int, int]]:
+    """ find the blocks of text on a thresholded page by smearing neighbouring
+    glyphs together so that each line or paragraph becomes a single blob.
+    Blobs that are too small, too sparse or too solid to be text (eg specks,
+    rules and photographs) are dropped
+
+    Args:
+        image (np.array): thresholded page, dark text on a light background
+        min_height (int, optional): smallest block height in pixels to keep.
+            Defaults to 8
+        padding (int, optional): pixels of background to keep around each
+            block, Tesseract reads better with a margin. Defaults to 8
+
+    Returns:
+        list(tuple(int, int, int, int)): x, y, width, height of each block in
+            reading order (top to bottom, then left to right)
+    """
+    height, width = image.shape[:2]
+    ink = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY_INV)[1]
+    # the morphological gradient keeps glyph outlines and drops flat areas
+    gradient = cv2.morphologyEx(ink, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    # join glyphs into words and lines, and lines into blocks, using gaps
+    # relative to the size of the text
+    text_height = max(estimate_text_height(image), min_height)
+    join_x = int(text_height * 1.5)
+    join_y = int(text_height * 0.8)
+    smeared = cv2.morphologyEx(
+        gradient, cv2.MORPH_CLOSE, np.ones((join_y, join_x), np.uint8)
+    )
+    contours, _ = cv2.findContours(smeared, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < min_height or w < min_height:
+            continue
+        density = cv2.countNonZero(ink[y : y + h, x : x + w]) / (w * h)
+        # text is neither nearly empty nor nearly solid
+        if density < 0.02 or density > 0.6:
+            continue
+        x0, y0 = max(x - padding, 0), max(y - padding, 0)
+        x1, y1 = min(x + w + padding, width), min(y + h + padding, height)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    # reading order, treating blocks whose tops are close as the same row
+    return sorted(regions, key=lambda region: (region[1] // text_height, region[0]))
+
+
 if __name__ == "__main__":
     # we have no cause to run this file directly currently
     pass
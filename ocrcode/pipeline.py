@@ -0,0 +1,668 @@
+""" An importable document pipeline, so that long running processes can keep
+the pipeline (and its OCR engine) warm and call it directly """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode import engines
+from ocrcode import ocr
+from ocrcode.buffers import BufferPool
+from ocrcode.profiling import StageMetrics, StageProfiler
+from ocrcode.quality import QualityPolicy, QualityReport, assess_quality
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """ Tuning parameters for every stage of the pipeline. Frozen so a config
+    can be shared between processes and used as a cache key """
+
+    # resizing
+    processing_size: int = 1024
+    # preprocessing
+    processing_blur: int = 5
+    threshold_high: int = 200
+    threshold_low: int = 200
+    kernel_size: int = 7
+    # contour extraction
+    min_area: int = 10000
+    epsilon: float = 0.02
+    # used when no contour simplifies to a quad, see ocr.CONTOUR_FALLBACKS
+    contour_fallback: str = None
+    # process_all: the most separate pages to extract from one image, None for
+    # all, and the threads used to unwarp and OCR them in parallel
+    max_documents: int = None
+    document_workers: int = 1
+    # check the sharpness, exposure and shape of each page before unwarping it
+    # and skip the rest of the pipeline for pages that fail, None for no check
+    quality_gate: QualityPolicy = None
+    # fraction of the image size to trim from the edges of the unwarped page
+    margin: float = 0.02
+    # coarse to fine: find the page on an image scaled to detection_size
+    # (processing_size if None, min_area is scaled to match) and unwarp it
+    # straight from the full resolution image. The page is then already at
+    # native resolution so the fixed magnification is not applied
+    detection_size: int = None
+    full_resolution_unwarp: bool = False
+    # contrast and brightness controls
+    contrast: float = 1.3
+    brightness: int = 10
+    # single pass rectification: greyscale before the warp, trim the margin in
+    # the warp and level with a lookup table, so the page is only written once.
+    # The rectified image in the result is then greyscale
+    fused_rectification: bool = False
+    # threshold method for ocr.improve_image_quality, "auto" to choose it for
+    # each page, see ocr.choose_threshold
+    threshold: str = "simple"
+    # OCR again with the other threshold methods when the mean word confidence
+    # is below this, keeping the most confident read. None never retries
+    retry_confidence: float = None
+    # magnification applied before thresholding and OCR
+    magnification: float = 2.0
+    # choose the magnification per page from its text height instead
+    adaptive_magnification: bool = False
+    target_text_height: float = 30
+    max_magnification: float = 4.0
+    # only OCR the blocks of text found on the page, skipping blank pages
+    text_detection: bool = False
+    # threads used to OCR the text blocks of a page in parallel
+    text_detection_workers: int = 1
+    # OCR backend, see engines.ENGINES
+    engine: str = "auto"
+    lang: str = "eng"
+    tesseract_cmd: str = None
+
+    def to_dict(self) -> Dict:
+        """ the config as plain values, eg to save as JSON """
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "PipelineConfig":
+        """ build a config from values such as to_dict gives. Fields not given
+        keep their defaults, and an unknown name raises a ValueError
+
+        Args:
+            values (dict): field names to values
+
+        Returns:
+            PipelineConfig: the config
+        """
+        unknown = set(values) - {config_field.name for config_field in fields(cls)}
+        if unknown:
+            raise ValueError(f"unknown config fields {sorted(unknown)}")
+        values = dict(values)
+        if isinstance(values.get("quality_gate"), dict):
+            values["quality_gate"] = QualityPolicy(**values["quality_gate"])
+        return cls(**values)
+
+
+@dataclass
+class Result:
+    """ The outputs of running the pipeline on a single image """
+
+    # the OCRed text
+    text: str
+    # ordered 4x1x2 corners of the page in the image it was unwarped from,
+    # the processing sized image or the original for full_resolution_unwarp
+    quad: np.array
+    # the straightened and levelled page
+    image: np.array
+    # seconds spent in each stage, keyed by stage name
+    timings: Dict[str, float] = field(default_factory=dict)
+    # wall time, CPU time and largest output array of each stage
+    metrics: List[StageMetrics] = field(default_factory=list)
+    # whether the result came from a cache rather than being processed
+    cached: bool = False
+    # magnification applied to the page before OCR
+    magnification: float = None
+    # threshold method applied to the page before OCR
+    threshold: str = None
+    # x, y, width, height of the text blocks OCRed when text detection is on
+    text_regions: List[Tuple[int, int, int, int]] = None
+    # mean word confidence from 0 to 100, when the engine reports one
+    confidence: float = None
+    # the recognised words with their confidences and corners in the original
+    # image, when the engine reports them, see engines.Word
+    words: List[engines.Word] = None
+    # 3x3 perspective transform from the page handed to the OCR engine back
+    # onto the original image, see ocr.page_transform
+    page_transform: np.array = None
+    # measurements of the page from the quality gate, when it is on. A page
+    # that failed is not unwarped or OCRed, and its reasons say why
+    quality: QualityReport = None
+    # name of the earlier page whose OCR result was reused and how many bits
+    # their hashes differ by, when this page duplicated it, see dedup
+    duplicate_of: str = None
+    duplicate_distance: int = None
+
+    @property
+    def rejected(self) -> bool:
+        """ whether the quality gate stopped the page being OCRed """
+        return self.quality is not None and not self.quality.passed
+
+
+def map_words(words: List[engines.Word], transform: np.array) -> List[engines.Word]:
+    """ fill in the corners of each word in the original image
+
+    Args:
+        words (list(Word)): words with boxes on the page that was OCRed
+        transform (np.array): page to original image transform, see
+            ocr.page_transform
+
+    Returns:
+        list(Word): the words with their quad set
+    """
+    quads = ocr.map_boxes([word.box for word in words], transform)
+    return [word._replace(quad=quad) for word, quad in zip(words, quads)]
+
+
+def mean_confidence(words: List[engines.Word]) -> float:
+    """ the mean confidence of some words, None if there are none """
+    if not words:
+        return None
+    return float(np.mean([word.confidence for word in words]))
+
+
+class DocumentPipeline:
+    """ Straightens the page in an image and OCRs it. The OCR engine is created
+    on first use and then kept for the life of the pipeline """
+
+    def __init__(
+        self,
+        config: PipelineConfig = None,
+        verbose: bool = False,
+        engine=None,
+        hooks: Iterable[Callable[[StageMetrics], None]] = (),
+    ):
+        """
+        Args:
+            config (PipelineConfig, optional): pipeline parameters. Defaults to
+                the PipelineConfig defaults
+            verbose (bool, optional): display intermediate steps. Defaults to
+                False
+            engine (optional): OCR engine to use instead of the one named in
+                the config, anything with an image_to_string method, and
+                optionally image_to_data for word boxes. Defaults to None
+            hooks (iterable(callable), optional): functions called with the
+                StageMetrics of every stage as it completes, eg to forward them
+                to a metrics collector. Defaults to ()
+        """
+        self.config = config if config is not None else PipelineConfig()
+        self.verbose = verbose
+        self.hooks = list(hooks)
+        self._engine = engine
+        self._local = threading.local()
+        self._lut = ocr.level_lut(self.config.contrast, self.config.brightness)
+
+    @property
+    def buffers(self) -> BufferPool:
+        """ scratch buffers for the calling thread, reused from page to page """
+        if not hasattr(self._local, "buffers"):
+            self._local.buffers = BufferPool()
+        return self._local.buffers
+
+    @property
+    def engine(self):
+        """ the OCR engine, created on first use """
+        if self._engine is None:
+            self._engine = engines.get_engine(
+                self.config.engine,
+                lang=self.config.lang,
+                tesseract_cmd=self.config.tesseract_cmd,
+            )
+        return self._engine
+
+    def process(self, image: np.array) -> Result:
+        """ find, straighten and OCR the page in an image
+
+        Args:
+            image (np.array): BGR input image
+
+        Returns:
+            Result: text, detected quad, rectified image and stage metrics
+        """
+        clean_paper, result = self.rectify(image)
+        return self.recognise(clean_paper, result)
+
+    def rectify(self, image: np.array) -> Tuple[np.array, Result]:
+        """ run every stage before OCR: find, straighten and clean up the page.
+        Kept separate from recognise so callers can schedule the CPU bound
+        OpenCV stages and the OCR stage independently
+
+        Args:
+            image (np.array): BGR input image
+
+        Returns:
+            tuple(np.array, Result): the page prepared for OCR, and a result
+                with everything but the text filled in
+        """
+        profiler = StageProfiler(self.hooks)
+        scaled_image, search_image, mask, min_area = self._search(image, profiler)
+        contour_check = np.copy(scaled_image) if self.verbose else None
+        # get our largest quadrilateral contour
+        paper_contour = ocr.get_contour_from_mask(
+            mask=mask,
+            min_area=min_area,
+            epsilon=self.config.epsilon,
+            contour_check=contour_check,
+            verbose=self.verbose,
+            fallback=self.config.contour_fallback,
+        )
+        # make sure we have our points in the correct order for the transformation
+        ordered_paper_contour = ocr.order_quadrilateral(quad=paper_contour)
+        profiler.lap("contour", contour_check)
+        return self._prepare(
+            image, scaled_image, search_image, ordered_paper_contour, profiler
+        )
+
+    def process_quad(self, image: np.array, quad: np.array) -> Result:
+        """ straighten and OCR a page whose corners are already known, eg from
+        tracking it across the frames of a video, skipping the page search
+
+        Args:
+            image (np.array): BGR input image
+            quad (np.array): ordered 4x1x2 corners of the page in image
+
+        Returns:
+            Result: text, the quad, rectified image and stage metrics
+        """
+        profiler = StageProfiler(self.hooks)
+        clean_paper, result = self._prepare(image, image, image, quad, profiler)
+        return self.recognise(clean_paper, result)
+
+    def locate(self, image: np.array, profiler: StageProfiler = None) -> np.array:
+        """ find the page in an image without straightening it
+
+        Args:
+            image (np.array): BGR input image
+            profiler (StageProfiler, optional): records the stages. Defaults to
+                None
+
+        Returns:
+            np.array: ordered 4x1x2 corners of the page in image coordinates
+        """
+        profiler = profiler if profiler is not None else StageProfiler(self.hooks)
+        scaled_image, _, mask, min_area = self._search(image, profiler)
+        paper_contour = ocr.get_contour_from_mask(
+            mask=mask,
+            min_area=min_area,
+            epsilon=self.config.epsilon,
+            verbose=False,
+            fallback=self.config.contour_fallback,
+        )
+        profiler.lap("contour")
+        return ocr.scale_quadrilateral(
+            ocr.order_quadrilateral(quad=paper_contour),
+            max(image.shape[:2]) / max(scaled_image.shape[:2]),
+        )
+
+    def process_all(self, image: np.array) -> List[Result]:
+        """ find, straighten and OCR every separate page in an image, eg several
+        cards or receipts photographed together. The image is scaled and
+        searched once, then each page is unwarped and OCRed on its own, using
+        document_workers threads
+
+        Args:
+            image (np.array): BGR input image
+
+        Returns:
+            list(Result): a result for each page, largest first. Only the first
+                result includes the metrics of the shared search stages
+        """
+        config = self.config
+        profiler = StageProfiler(self.hooks)
+        scaled_image, search_image, mask, min_area = self._search(image, profiler)
+        contour_check = np.copy(scaled_image) if self.verbose else None
+        quads = ocr.get_quadrilaterals_from_mask(
+            mask=mask,
+            min_area=min_area,
+            epsilon=config.epsilon,
+            max_count=config.max_documents,
+            contour_check=contour_check,
+            verbose=self.verbose,
+            fallback=config.contour_fallback,
+        )
+        quads = list(ocr.order_quadrilaterals(np.array(quads)))
+        profiler.lap("contour", contour_check)
+
+        def process_page(index: int) -> Result:
+            # every page after the first starts its own metrics
+            page_profiler = profiler if index == 0 else StageProfiler(self.hooks)
+            clean_paper, result = self._prepare(
+                image, scaled_image, search_image, quads[index], page_profiler
+            )
+            return self.recognise(clean_paper, result)
+
+        if config.document_workers > 1 and len(quads) > 1:
+            with ThreadPoolExecutor(config.document_workers) as pool:
+                return list(pool.map(process_page, range(len(quads))))
+        return [process_page(index) for index in range(len(quads))]
+
+    def _search(
+        self, image: np.array, profiler: StageProfiler
+    ) -> Tuple[np.array, np.array, np.array, int]:
+        """ the stages shared by every page of an image: scale it down and find
+        the edges to search for pages
+
+        Args:
+            image (np.array): BGR input image
+            profiler (StageProfiler): records the stages
+
+        Returns:
+            tuple(np.array, np.array, np.array, int): the scaled image, the
+                scaled image greyscaled when fused_rectification is set, the
+                edge mask and the minimum page area in the mask
+        """
+        config = self.config
+        detection_size = config.detection_size or config.processing_size
+        # keep the minimum page area in proportion to the image we search
+        min_area = int(config.min_area * (detection_size / config.processing_size) ** 2)
+        # scale file to something manageable
+        scaled_image = ocr.scale_longest_axis(image, new_size=detection_size)
+        profiler.lap("scale", scaled_image)
+        search_image = scaled_image
+        if config.fused_rectification:
+            # greyscale once, both the search and the unwarp then use it
+            search_image = cv2.cvtColor(scaled_image, cv2.COLOR_BGR2GRAY)
+        # perform our preprocessing
+        preprocessed_image = ocr.preprocess_image(
+            image=search_image,
+            blur=config.processing_blur,
+            threshold_high=config.threshold_high,
+            threshold_low=config.threshold_low,
+            kernel_size=config.kernel_size,
+        )
+        profiler.lap("preprocess", preprocessed_image)
+        if self.verbose:
+            cv2.imshow("preprocessed_image", preprocessed_image)
+        return scaled_image, search_image, preprocessed_image, min_area
+
+    def _prepare(
+        self,
+        image: np.array,
+        scaled_image: np.array,
+        search_image: np.array,
+        ordered_paper_contour: np.array,
+        profiler: StageProfiler,
+    ) -> Tuple[np.array, Result]:
+        """ straighten and clean up a single page found by _search
+
+        Args:
+            image (np.array): BGR input image
+            scaled_image (np.array): the scaled image the page was found in
+            search_image (np.array): the scaled image, greyscale when fused
+            ordered_paper_contour (np.array): ordered corners of the page in
+                the scaled image
+            profiler (StageProfiler): records the stages
+
+        Returns:
+            tuple(np.array, Result): the page prepared for OCR, and a result
+                with everything but the text filled in. When the page fails
+                the quality gate the page is None and the result is rejected
+        """
+        config = self.config
+        if self.verbose:
+            print(ordered_paper_contour)
+        report = None
+        if config.quality_gate is not None:
+            # measured where the page was found, before any full size work
+            report = assess_quality(
+                search_image, ordered_paper_contour, config.quality_gate
+            )
+            profiler.lap("quality")
+        magnification = config.magnification
+        source = scaled_image
+        if config.full_resolution_unwarp:
+            # map the quad found on the small image back onto the original
+            source = image
+            ordered_paper_contour = ocr.scale_quadrilateral(
+                ordered_paper_contour,
+                max(image.shape[:2]) / max(scaled_image.shape[:2]),
+            )
+            magnification = 1.0
+        if report is not None and not report.passed:
+            return (
+                None,
+                Result(
+                    text="",
+                    quad=ordered_paper_contour,
+                    image=None,
+                    timings=profiler.timings,
+                    metrics=profiler.metrics,
+                    quality=report,
+                ),
+            )
+        # trim the edges to cope with imperfect transforms
+        margin = int(max(source.shape[:2]) * config.margin)
+        if config.fused_rectification:
+            levelled_image = self._unwarp_and_level(
+                source if config.full_resolution_unwarp else search_image,
+                ordered_paper_contour,
+                margin,
+            )
+            profiler.lap("unwarp", levelled_image)
+        else:
+            # apply transformation to image
+            unwarped_paper = ocr.unwarp_quadrilateral(
+                image=source, quad=ordered_paper_contour, margin=margin,
+            )
+            profiler.lap("unwarp", unwarped_paper)
+            # improve contrast, see https://stackoverflow.com/questions/39308030
+            levelled_image = cv2.addWeighted(
+                unwarped_paper,
+                alpha=config.contrast,
+                src2=unwarped_paper,
+                beta=0,
+                gamma=config.brightness,
+            )
+            profiler.lap("level", levelled_image)
+        if self.verbose:
+            cv2.imshow("test_image", levelled_image)
+        page = levelled_image
+        if config.adaptive_magnification:
+            # greyscale once here rather than again in improve_image_quality
+            if page.ndim == 3:
+                page = cv2.cvtColor(levelled_image, cv2.COLOR_BGR2GRAY)
+            magnification = ocr.choose_magnification(
+                ocr.estimate_text_height(page),
+                target_height=config.target_text_height,
+                max_scale=config.max_magnification,
+                # the fixed magnification when there is no text to measure
+                fallback=magnification,
+            )
+            profiler.lap("magnification", page)
+        threshold = config.threshold
+        if threshold == "auto":
+            # decided before OCR from cheap statistics of the page
+            threshold = ocr.choose_threshold(page)
+            profiler.lap("threshold")
+        clean_paper = ocr.improve_image_quality(
+            image=page,
+            threshold=threshold,
+            verbose=self.verbose,
+            scale=magnification,
+            buffers=self.buffers,
+        )
+        profiler.lap("improve", clean_paper)
+        result = Result(
+            text="",
+            quad=ordered_paper_contour,
+            image=levelled_image,
+            timings=profiler.timings,
+            metrics=profiler.metrics,
+            magnification=magnification,
+            threshold=threshold,
+            quality=report,
+            page_transform=ocr.page_transform(
+                ordered_paper_contour,
+                margin,
+                levelled_image.shape,
+                clean_paper.shape,
+                scale=max(image.shape[:2]) / max(source.shape[:2]),
+            ),
+        )
+        return clean_paper, result
+
+    def _unwarp_and_level(
+        self, image: np.array, quad: np.array, margin: int
+    ) -> np.array:
+        """ the fused unwarp, see ocr.unwarp_and_level. A BGR image is cropped
+        to the page before greyscaling, so on a full resolution photo only the
+        page itself is converted
+
+        Args:
+            image (np.array): greyscale or BGR image containing the page
+            quad (np.array): ordered corners of the page in image
+            margin (int): pixels to trim from the edges of the page
+
+        Returns:
+            np.array: the unwarped and levelled greyscale page
+        """
+        if image.ndim == 3:
+            # pad so interpolation at the page edges sees the same pixels
+            x, y, width, height = cv2.boundingRect(quad.reshape((4, 2)))
+            left, top = max(x - 2, 0), max(y - 2, 0)
+            right = min(x + width + 2, image.shape[1])
+            bottom = min(y + height + 2, image.shape[0])
+            image = cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+            quad = quad - np.int32([left, top])
+        return ocr.unwarp_and_level(image, quad, margin=margin, lut=self._lut)
+
+    def recognise(self, clean_image: np.array, result: Result) -> Result:
+        """ OCR a page prepared by rectify. Engines with image_to_data also
+        give the words, their confidences and their corners in the original
+        image from the same OCR call. When the mean word confidence is below
+        retry_confidence the page is thresholded and OCRed again with each
+        other method in turn, until one is confident enough. A page rejected
+        by the quality gate is returned as it is, without OCR
+
+        Args:
+            clean_image (np.array): the page prepared for OCR
+            result (Result): the result returned alongside it by rectify
+
+        Returns:
+            Result: the same result with the text, words, confidence and OCR
+                timing filled in
+        """
+        if result.rejected:
+            return result
+        profiler = StageProfiler(self.hooks)
+        self._read_page(clean_image, result, profiler)
+        profiler.lap("ocr")
+        retry_confidence = self.config.retry_confidence
+        retried = False
+        for threshold in ocr.THRESHOLDS:
+            # an engine reporting no words at all read nothing, so also retries
+            if (
+                retry_confidence is None
+                or result.words is None
+                or result.image is None
+                or (result.confidence or 0) >= retry_confidence
+            ):
+                break
+            if threshold == result.threshold:
+                continue
+            # the same magnification keeps the page transform valid
+            retry_image = ocr.improve_image_quality(
+                result.image,
+                threshold=threshold,
+                verbose=False,
+                scale=result.magnification,
+                buffers=self.buffers,
+            )
+            attempt = Result(
+                text="",
+                quad=result.quad,
+                image=result.image,
+                threshold=threshold,
+                page_transform=result.page_transform,
+            )
+            self._read_page(retry_image, attempt)
+            retried = True
+            if attempt.confidence is not None and attempt.confidence > (
+                result.confidence or 0
+            ):
+                result.text = attempt.text
+                result.words = attempt.words
+                result.confidence = attempt.confidence
+                result.text_regions = attempt.text_regions
+                result.threshold = threshold
+        if retried:
+            profiler.lap("retry")
+        result.metrics.extend(profiler.metrics)
+        result.timings.update(profiler.timings)
+        return result
+
+    def _read_page(
+        self, clean_image: np.array, result: Result, profiler: StageProfiler = None
+    ) -> None:
+        """ OCR a prepared page into result, only the text blocks when text
+        detection is on
+
+        Args:
+            clean_image (np.array): the page prepared for OCR
+            result (Result): filled in with the text, words and confidence
+            profiler (StageProfiler, optional): records text detection.
+                Defaults to None
+        """
+        if self.config.text_detection:
+            # only OCR the text blocks, which skips blank margins and pictures
+            regions = ocr.detect_text_regions(clean_image)
+            if profiler is not None:
+                profiler.lap("text_detection")
+            result.text_regions = regions
+            crops = [clean_image[y : y + h, x : x + w] for x, y, w, h in regions]
+            if self.config.text_detection_workers > 1 and len(crops) > 1:
+                with ThreadPoolExecutor(self.config.text_detection_workers) as pool:
+                    reads = list(pool.map(self.read, crops))
+            else:
+                reads = [self.read(crop) for crop in crops]
+            result.text = "\n".join(text.strip() for text, _ in reads if text.strip())
+            if all(words is not None for _, words in reads):
+                # move each word box from its block onto the page
+                words = [
+                    word._replace(box=(x + word.box[0], y + word.box[1]) + word.box[2:])
+                    for (x, y, _, _), (_, block_words) in zip(regions, reads)
+                    for word in block_words
+                ]
+            else:
+                words = None
+        else:
+            # pass to tesseract for OCR
+            result.text, words = self.read(clean_image)
+        if words is not None:
+            if result.page_transform is not None:
+                words = map_words(words, result.page_transform)
+            result.words = words
+            result.confidence = mean_confidence(words)
+
+    def read(self, image: np.array) -> Tuple[str, List[engines.Word]]:
+        """ OCR an image with a single engine call
+
+        Args:
+            image (np.array): image prepared for OCR
+
+        Returns:
+            tuple(str, list(Word)): the text, and the words with boxes in image
+                when the engine has image_to_data, otherwise None
+        """
+        if hasattr(self.engine, "image_to_data"):
+            return self.engine.image_to_data(image)
+        return self.engine.image_to_string(image), None
+
+    def process_many(self, images: Iterable[np.array]) -> Iterator[Result]:
+        """ lazily process a sequence of images
+
+        Args:
+            images (iterable(np.array)): BGR input images
+
+        Yields:
+            Result: the result for each image in turn
+        """
+        for image in images:
+            yield self.process(image)
@@ -0,0 +1,136 @@
+""" Lightweight per-stage instrumentation for the OCR pipeline """
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+# percentiles reported in profile summaries
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class StageMetrics:
+    """ The cost of a single pipeline stage on a single image """
+
+    stage: str
+    # elapsed wall clock seconds
+    wall: float
+    # CPU seconds used by the calling thread (excludes tesseract subprocesses)
+    cpu: float
+    # size in bytes of the largest array the stage returned. Not the peak
+    # memory of the stage, which also holds inputs and temporaries
+    output_bytes: int
+
+
+class StageProfiler:
+    """ Records metrics for consecutive pipeline stages. Each call to lap closes
+    the current stage and starts the next one. Hooks are called with every
+    StageMetrics as it is recorded so metrics can be forwarded elsewhere """
+
+    def __init__(self, hooks: Iterable[Callable[[StageMetrics], None]] = ()):
+        """
+        Args:
+            hooks (iterable(callable), optional): functions called with each
+                StageMetrics as it is recorded. Defaults to ()
+        """
+        self.hooks = list(hooks)
+        self.metrics: List[StageMetrics] = []
+        self.start()
+
+    def start(self) -> None:
+        """ start timing a new stage """
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+
+    def lap(self, stage: str, *arrays: np.array) -> StageMetrics:
+        """ finish the current stage and start timing the next one
+
+        Args:
+            stage (str): name of the stage that just finished
+            arrays (np.array, optional, *arg): arrays produced by the stage
+
+        Returns:
+            StageMetrics: the metrics recorded for the stage
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        output_bytes = max(
+            (array.nbytes for array in arrays if array is not None), default=0
+        )
+        metrics = StageMetrics(stage, wall - self._wall, cpu - self._cpu, output_bytes)
+        self.metrics.append(metrics)
+        for hook in self.hooks:
+            hook(metrics)
+        # start the next stage after the hooks so they are not counted
+        self.start()
+        return metrics
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """ wall clock seconds per stage """
+        return {metrics.stage: metrics.wall for metrics in self.metrics}
+
+
+def summarise(records: Iterable[List[StageMetrics]]) -> Dict[str, Dict]:
+    """ Summarise the metrics of many images as percentiles per stage
+
+    Args:
+        records (iterable(list(StageMetrics))): stage metrics for each image
+
+    Returns:
+        dict: for each stage the count and p50/p95/p99 of wall time, CPU time
+            and largest output array bytes
+    """
+    by_stage: Dict[str, List[StageMetrics]] = {}
+    for metrics_list in records:
+        for metrics in metrics_list:
+            by_stage.setdefault(metrics.stage, []).append(metrics)
+    summary = {}
+    for stage, metrics_list in by_stage.items():
+        summary[stage] = {"count": len(metrics_list)}
+        for measure in ("wall", "cpu", "output_bytes"):
+            values = np.array([getattr(metrics, measure) for metrics in metrics_list])
+            percentiles = np.percentile(values, PERCENTILES)
+            for percentile, value in zip(PERCENTILES, percentiles):
+                summary[stage][f"{measure}_p{percentile}"] = float(value)
+    return summary
+
+
+class ProfileWriter:
+    """ Writes one JSON line of stage metrics per image, followed by a summary
+    line of per stage percentiles when closed """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): file to write the JSON lines to
+        """
+        self._file = open(path, "w")
+        self._records: List[List[StageMetrics]] = []
+
+    def write(self, name: str, metrics: List[StageMetrics]) -> None:
+        """ write the metrics for one image
+
+        Args:
+            name (str): image identifier, usually its path
+            metrics (list(StageMetrics)): the image's stage metrics
+        """
+        self._records.append(metrics)
+        record = {
+            "type": "image",
+            "name": name,
+            "stages": [asdict(stage_metrics) for stage_metrics in metrics],
+        }
+        self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> Dict[str, Dict]:
+        """ write the summary line and close the file
+
+        Returns:
+            dict: the summary, see summarise
+        """
+        summary = summarise(self._records)
+        self._file.write(json.dumps({"type": "summary", "stages": summary}) + "\n")
+        self._file.close()
+        return summary
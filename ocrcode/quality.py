@@ -0,0 +1,183 @@
+""" A quality gate run on the found page before it is unwarped and OCRed.
+Blurred, badly exposed or implausibly shaped pages are rejected with machine
+readable reasons, so they can be sent back for re-capture without paying for
+Tesseract """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+from dataclasses import dataclass
+from typing import List, NamedTuple
+
+import cv2
+import numpy as np
+
+# the quad get_contour_from_mask gives when it finds no page
+PLACEHOLDER_QUAD = np.array([[0, 0], [10, 0], [0, 10], [10, 10]])
+# fraction of the page trimmed from each side before measuring sharpness and
+# exposure, so the strong edges of the page and the background do not count
+INSET = 0.1
+# pixels at or beyond these levels are clipped
+DARK_LEVEL = 5
+BRIGHT_LEVEL = 250
+# rejection reasons
+NO_PAGE = "no_page"
+SMALL_PAGE = "small_page"
+NOT_CONVEX = "not_convex"
+SKEWED_CORNERS = "skewed_corners"
+BLURRED = "blurred"
+UNDEREXPOSED = "underexposed"
+OVEREXPOSED = "overexposed"
+
+
+@dataclass(frozen=True)
+class QualityPolicy:
+    """ Limits a page must meet to be OCRed. Frozen so it can sit in a
+    PipelineConfig """
+
+    # least variance of the Laplacian of the middle of the page, measured on
+    # the image the page was found in
+    min_sharpness: float = 50.0
+    # most of the page that may be clipped to black or to white
+    max_dark_clipping: float = 0.5
+    max_bright_clipping: float = 0.5
+    # least fraction of the image the page must cover
+    min_area_fraction: float = 0.02
+    # every corner angle must be within this many degrees of a straight line
+    # ie between min_corner_angle and 180 - min_corner_angle
+    min_corner_angle: float = 45.0
+
+
+class QualityReport(NamedTuple):
+    """ The measurements made by the quality gate and any reasons to reject
+    the page, which are empty when it passed """
+
+    sharpness: float
+    dark_clipping: float
+    bright_clipping: float
+    area_fraction: float
+    convex: bool
+    min_corner_angle: float
+    max_corner_angle: float
+    reasons: List[str]
+
+    @property
+    def passed(self) -> bool:
+        """ whether the page should be OCRed """
+        return not self.reasons
+
+
+def page_region(image: np.array, quad: np.array) -> np.array:
+    """ the middle of a page's bounding box, trimmed by INSET on each side
+
+    Args:
+        image (np.array): image containing the page
+        quad (np.array): corners of the page in image
+
+    Returns:
+        np.array: view of the region, empty if the page is outside the image
+    """
+    x, y, width, height = cv2.boundingRect(np.int32(quad).reshape((4, 2)))
+    inset_x, inset_y = int(width * INSET), int(height * INSET)
+    left, top = max(x + inset_x, 0), max(y + inset_y, 0)
+    return image[top : y + height - inset_y, left : x + width - inset_x]
+
+
+def measure_sharpness(grey_image: np.array, quad: np.array) -> float:
+    """ variance of the Laplacian over the middle of a page, which falls as
+    the page blurs from motion or focus
+
+    Args:
+        grey_image (np.array): greyscale image containing the page
+        quad (np.array): corners of the page in grey_image
+
+    Returns:
+        float: the sharpness, 0 if the page is outside the image
+    """
+    return laplacian_variance(page_region(grey_image, quad))
+
+
+def laplacian_variance(grey_image: np.array) -> float:
+    """ variance of the Laplacian of a greyscale image, 0 if it is empty """
+    if grey_image.size == 0:
+        return 0.0
+    # 16 bit is enough for the Laplacian of 8 bit pixels and much faster
+    _, deviation = cv2.meanStdDev(cv2.Laplacian(grey_image, cv2.CV_16S))
+    return float(deviation[0, 0] ** 2)
+
+
+def corner_angles(quad: np.array) -> np.array:
+    """ interior angles of an ordered quad
+
+    Args:
+        quad (np.array): corners ordered top left, top right, bottom left,
+            bottom right
+
+    Returns:
+        np.array: the four angles in degrees, going round the quad
+    """
+    # round the outline rather than in the zig-zag corner order
+    points = np.float64(quad).reshape((4, 2))[[0, 1, 3, 2]]
+    before = np.roll(points, 1, axis=0) - points
+    after = np.roll(points, -1, axis=0) - points
+    lengths = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+    cosines = np.sum(before * after, axis=1) / np.maximum(lengths, 1e-9)
+    return np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+
+
+def assess_quality(
+    image: np.array, quad: np.array, policy: QualityPolicy = None
+) -> QualityReport:
+    """ measure a found page and decide whether it is worth OCRing. Only the
+    page's bounding box is examined, so this costs little next to the unwarp
+
+    Args:
+        image (np.array): greyscale or BGR image the page was found in
+        quad (np.array): ordered corners of the page in image
+        policy (QualityPolicy, optional): limits to apply. Defaults to the
+            QualityPolicy defaults
+
+    Returns:
+        QualityReport: the measurements and any reasons to reject the page
+    """
+    policy = policy if policy is not None else QualityPolicy()
+    quad_2d = np.int32(quad).reshape((4, 2))
+    reasons = []
+    if np.array_equal(quad_2d, PLACEHOLDER_QUAD):
+        reasons.append(NO_PAGE)
+    outline = quad_2d[[0, 1, 3, 2]]
+    area_fraction = cv2.contourArea(outline) / (image.shape[0] * image.shape[1])
+    if area_fraction < policy.min_area_fraction:
+        reasons.append(SMALL_PAGE)
+    convex = bool(cv2.isContourConvex(outline))
+    if not convex:
+        reasons.append(NOT_CONVEX)
+    angles = corner_angles(quad_2d)
+    if (
+        angles.min() < policy.min_corner_angle
+        or angles.max() > 180 - policy.min_corner_angle
+    ):
+        reasons.append(SKEWED_CORNERS)
+    region = page_region(image, quad_2d)
+    if region.ndim == 3:
+        # only greyscale the part we look at
+        region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    sharpness = laplacian_variance(region)
+    dark_clipping, bright_clipping = 0.0, 0.0
+    if region.size > 0:
+        dark_clipping = float(np.count_nonzero(region <= DARK_LEVEL) / region.size)
+        bright_clipping = float(np.count_nonzero(region >= BRIGHT_LEVEL) / region.size)
+    if sharpness < policy.min_sharpness:
+        reasons.append(BLURRED)
+    if dark_clipping > policy.max_dark_clipping:
+        reasons.append(UNDEREXPOSED)
+    if bright_clipping > policy.max_bright_clipping:
+        reasons.append(OVEREXPOSED)
+    return QualityReport(
+        sharpness=sharpness,
+        dark_clipping=dark_clipping,
+        bright_clipping=bright_clipping,
+        area_fraction=float(area_fraction),
+        convex=convex,
+        min_corner_angle=float(angles.min()),
+        max_corner_angle=float(angles.max()),
+        reasons=reasons,
+    )
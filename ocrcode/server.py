@@ -0,0 +1,330 @@
+""" An asyncio HTTP service exposing the document pipeline, so callers can POST
+images to a warm pipeline instead of starting jmocr.py per request
+
+Endpoints:
+    POST /ocr      body is an encoded image, responds with JSON text, words,
+                   quad and the quality gate report
+    GET /health    responds with JSON status
+    GET /metrics   responds with JSON request counters and latencies
+"""
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode.pipeline import DocumentPipeline
+
+# largest upload we will accept
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# how long we wait for a client to send its request headers
+HEADER_TIMEOUT = 10.0
+
+
+class HTTPError(Exception):
+    """ An error to be reported to the client with the given status """
+
+    def __init__(self, status: HTTPStatus, message: str = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+async def read_request(
+    reader: asyncio.StreamReader, max_body: int = MAX_BODY_BYTES
+) -> Tuple[str, str, Dict[str, str], bytes]:
+    """ read a single HTTP/1.1 request from a stream
+
+    Args:
+        reader (asyncio.StreamReader): the client stream
+        max_body (int, optional): largest body to accept. Defaults to
+            MAX_BODY_BYTES
+
+    Returns:
+        tuple(str, str, dict, bytes): method, path, lower cased headers, body
+
+    Raises:
+        HTTPError: if the request is malformed or too large
+    """
+    request_line = await reader.readline()
+    try:
+        method, path, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid content-length")
+    if length > max_body:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), path, headers, body
+
+
+def encode_response(status: HTTPStatus, payload: Dict) -> bytes:
+    """ encode a JSON HTTP response, closing the connection afterwards
+
+    Args:
+        status (HTTPStatus): response status
+        payload (dict): JSON serialisable response body
+
+    Returns:
+        bytes: the full response
+    """
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        headers.append("Retry-After: 1")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+
+class OCRServer:
+    """ Serves a single warm DocumentPipeline over HTTP. The OpenCV stages run
+    on a pool of threads (OpenCV releases the GIL) and OCR runs on a separate
+    pool so the number of concurrent Tesseract calls is capped independently.
+    Requests beyond max_pending are rejected with 503 rather than queued
+    without limit, and requests taking longer than timeout get a 504. A timed
+    out request keeps its place among the pending requests until the stage it
+    was on finishes, as a running thread can not be stopped """
+
+    def __init__(
+        self,
+        pipeline: DocumentPipeline,
+        workers: int = 2,
+        ocr_concurrency: int = 2,
+        max_pending: int = 16,
+        timeout: float = 30.0,
+        max_body: int = MAX_BODY_BYTES,
+    ):
+        """
+        Args:
+            pipeline (DocumentPipeline): the pipeline to serve, its engine must
+                be safe to call from ocr_concurrency threads at once
+            workers (int, optional): threads for the OpenCV stages. Defaults to 2
+            ocr_concurrency (int, optional): concurrent OCR calls. Defaults to 2
+            max_pending (int, optional): requests in progress before new ones
+                are rejected. Defaults to 16
+            timeout (float, optional): seconds before a request times out.
+                Defaults to 30.0
+            max_body (int, optional): largest upload accepted. Defaults to
+                MAX_BODY_BYTES
+        """
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_body = max_body
+        self._cpu_pool = ThreadPoolExecutor(max_workers=workers)
+        self._ocr_pool = ThreadPoolExecutor(max_workers=ocr_concurrency)
+        self.pending = 0
+        self.counters = {
+            "requests": 0,
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "errors": 0,
+        }
+        self.total_seconds = 0.0
+
+    async def _run(
+        self, pool: ThreadPoolExecutor, function: Callable, *args: Any
+    ) -> Any:
+        """ run function on a pool of threads. If the caller is cancelled the
+        call still runs to the end, so wait for it before passing on the
+        cancellation
+
+        Args:
+            pool (ThreadPoolExecutor): the pool to run on
+            function (callable): the function to run
+            *args: its arguments
+
+        Returns:
+            any: what function returns
+        """
+        future = asyncio.get_running_loop().run_in_executor(pool, function, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait({future})
+            raise
+
+    async def ocr(self, body: bytes) -> Dict:
+        """ decode, rectify and OCR an uploaded image
+
+        Args:
+            body (bytes): the encoded image
+
+        Returns:
+            dict: the text, quad, confidence, words, quality gate report,
+                magnification and stage timings. A page rejected by the quality
+                gate is not OCRed, its report gives the reasons
+        """
+        image = await self._run(
+            self._cpu_pool,
+            cv2.imdecode,
+            np.frombuffer(body, np.uint8),
+            cv2.IMREAD_COLOR,
+        )
+        if image is None:
+            raise HTTPError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "could not decode image")
+        clean_image, result = await self._run(
+            self._cpu_pool, self.pipeline.rectify, image
+        )
+        if not result.rejected:
+            result = await self._run(
+                self._ocr_pool, self.pipeline.recognise, clean_image, result
+            )
+        return {
+            "text": result.text,
+            "quad": result.quad.reshape((4, 2)).tolist(),
+            "confidence": result.confidence,
+            "words": [
+                {
+                    "text": word.text,
+                    "confidence": word.confidence,
+                    "quad": word.quad.tolist(),
+                }
+                for word in result.words or []
+            ],
+            "quality": None if result.quality is None else result.quality._asdict(),
+            "magnification": result.magnification,
+            "timings": result.timings,
+        }
+
+    def metrics(self) -> Dict:
+        """ current request counters and mean latency """
+        completed = self.counters["completed"]
+        return {
+            **self.counters,
+            "pending": self.pending,
+            "mean_seconds": self.total_seconds / completed if completed else 0.0,
+        }
+
+    def _release(self, _: asyncio.Future) -> None:
+        """ free the pending slot of a finished request """
+        self.pending -= 1
+
+    async def route(self, method: str, path: str, body: bytes) -> Dict:
+        """ dispatch a request to its handler
+
+        Args:
+            method (str): HTTP method
+            path (str): request path
+            body (bytes): request body
+
+        Returns:
+            dict: the JSON response payload
+        """
+        if path == "/health" and method == "GET":
+            return {"status": "ok", "pending": self.pending}
+        if path == "/metrics" and method == "GET":
+            return self.metrics()
+        if path == "/ocr" and method == "POST":
+            if self.pending >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "server busy")
+            self.pending += 1
+            start = time.perf_counter()
+            task = asyncio.ensure_future(self.ocr(body))
+            # the slot is freed once the work is done, not when we stop waiting
+            task.add_done_callback(self._release)
+            try:
+                # shielded so a timeout answers at once rather than waiting
+                # for the cancelled task
+                payload = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+            except asyncio.TimeoutError:
+                # stop before the next stage, the current one runs on
+                task.cancel()
+                self.counters["timeouts"] += 1
+                raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, "request timed out")
+            self.counters["completed"] += 1
+            self.total_seconds += time.perf_counter() - start
+            return payload
+        if path in ("/health", "/metrics", "/ocr"):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """ serve a single request on a client connection """
+        try:
+            method, path, _, body = await asyncio.wait_for(
+                read_request(reader, self.max_body), HEADER_TIMEOUT
+            )
+            self.counters["requests"] += 1
+            status, payload = HTTPStatus.OK, await self.route(method, path, body)
+        except HTTPError as error:
+            status, payload = error.status, {"error": str(error)}
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            status, payload = (
+                HTTPStatus.REQUEST_TIMEOUT,
+                {"error": "incomplete request"},
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            self.counters["errors"] += 1
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            payload = {"error": f"{type(error).__name__}: {error}"}
+        try:
+            writer.write(encode_response(status, payload))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        """ start listening
+
+        Args:
+            host (str, optional): interface to bind. Defaults to "127.0.0.1"
+            port (int, optional): port to bind, 0 for any. Defaults to 8080
+
+        Returns:
+            asyncio.AbstractServer: the listening server
+        """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self) -> None:
+        """ shut down the worker pools """
+        self._cpu_pool.shutdown(wait=False)
+        self._ocr_pool.shutdown(wait=False)
+
+
+def serve(server: OCRServer, host: str = "127.0.0.1", port: int = 8080) -> None:
+    """ run the server until interrupted
+
+    Args:
+        server (OCRServer): the server to run
+        host (str, optional): interface to bind. Defaults to "127.0.0.1"
+        port (int, optional): port to bind. Defaults to 8080
+    """
+
+    async def run():
+        listener = await server.start(host, port)
+        print(f"serving on http://{host}:{port}", flush=True)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
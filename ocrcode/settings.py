@@ -0,0 +1,312 @@
+""" Settings for a whole run: the pipeline parameters plus how images are
+spread over workers, cached and written out. Settings are layered, each layer
+overriding the one before: the defaults, a named preset, a TOML, YAML or JSON
+file and then the command line. They are checked once, when loaded, so that a
+bad value stops the run before any image is read """
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Tuple
+
+from ocrcode import engines
+from ocrcode import ocr
+from ocrcode.dedup import DEFAULT_MAX_DISTANCE
+from ocrcode.pipeline import PipelineConfig
+from ocrcode.quality import QualityPolicy
+from ocrcode.sinks import DEFAULT_BATCH_SIZE, SINKS
+
+# where the Windows installer puts tesseract, used when it is not on the PATH
+WINDOWS_TESSERACT = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
+# named starting points, applied over the defaults and under any file
+PRESETS = {
+    # the defaults as they are
+    "default": {},
+    # search and unwarp a smaller image and OCR the page at that size with a
+    # single global threshold. min_area is scaled down with the image. Half
+    # the default size, so camera images shrink by a whole factor, which
+    # OpenCV's area resize does far faster than a fractional one
+    "fast": {
+        "processing_size": 512,
+        "min_area": 2500,
+        "magnification": 1.0,
+        "adaptive_magnification": False,
+        "full_resolution_unwarp": False,
+        "threshold": "simple",
+        "retry_confidence": None,
+    },
+    # unwarp from the full resolution image, magnify each page to suit its
+    # text, choose its threshold and try the others on unsure reads
+    "accurate": {
+        "full_resolution_unwarp": True,
+        "adaptive_magnification": True,
+        "threshold": "auto",
+        "retry_confidence": 60.0,
+    },
+}
+# file extensions of the settings files we can read
+SETTINGS_EXTENSIONS = (".toml", ".yaml", ".yml", ".json")
+# checks on values beyond their type, and what is wrong when one fails
+RULES = {
+    "processing_size": (lambda value: value > 0, "must be positive"),
+    "processing_blur": (
+        lambda value: value > 0 and value % 2 == 1,
+        "must be a positive odd number",
+    ),
+    "threshold_high": (lambda value: value >= 0, "can not be negative"),
+    "threshold_low": (lambda value: value >= 0, "can not be negative"),
+    "kernel_size": (lambda value: value > 0, "must be positive"),
+    "min_area": (lambda value: value >= 0, "can not be negative"),
+    "epsilon": (lambda value: 0 < value < 1, "must be between 0 and 1"),
+    "contour_fallback": (
+        lambda value: value in ocr.CONTOUR_FALLBACKS,
+        f"must be one of {ocr.CONTOUR_FALLBACKS}",
+    ),
+    "max_documents": (lambda value: value > 0, "must be positive"),
+    "document_workers": (lambda value: value > 0, "must be positive"),
+    "margin": (lambda value: 0 <= value < 0.5, "must be from 0 to under 0.5"),
+    "detection_size": (lambda value: value > 0, "must be positive"),
+    "contrast": (lambda value: value > 0, "must be positive"),
+    "threshold": (
+        lambda value: value in ("auto",) + ocr.THRESHOLDS,
+        f"must be one of {('auto',) + ocr.THRESHOLDS}",
+    ),
+    "retry_confidence": (lambda value: 0 <= value <= 100, "must be from 0 to 100"),
+    "magnification": (lambda value: value > 0, "must be positive"),
+    "target_text_height": (lambda value: value > 0, "must be positive"),
+    "max_magnification": (lambda value: value > 0, "must be positive"),
+    "text_detection_workers": (lambda value: value > 0, "must be positive"),
+    "engine": (
+        lambda value: value in engines.ENGINES,
+        f"must be one of {engines.ENGINES}",
+    ),
+    "workers": (lambda value: value >= 0, "can not be negative"),
+    "cache_size": (lambda value: value > 0, "must be positive"),
+    "output_format": (lambda value: value in SINKS, f"must be one of {SINKS}"),
+    "batch_size": (lambda value: value > 0, "must be positive"),
+    "memory_limit": (lambda value: value > 0, "must be positive"),
+    "dedup_distance": (lambda value: 0 <= value <= 64, "must be from 0 to 64"),
+}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """ Everything a run is configured with. Held flat in files and on the
+    command line, where each name is either one of these fields or a
+    PipelineConfig field """
+
+    # parameters of every stage, see PipelineConfig
+    pipeline: PipelineConfig = PipelineConfig()
+    # worker processes OCRing images in parallel, 0 for one per core
+    workers: int = 1
+    # folder of the result cache, None for no cache, and its size in megabytes
+    cache_dir: str = None
+    cache_size: int = 1024
+    # file every result is written to and its format, see ocrcode.sinks
+    output: str = None
+    output_format: str = None
+    output_images: bool = False
+    batch_size: int = DEFAULT_BATCH_SIZE
+    # memory limit per image in megabytes for large scans, after the decode
+    memory_limit: int = 1024
+    # SQLite index of pages seen before, see ocrcode.dedup, and where to
+    # report the duplicates found
+    dedup: str = None
+    dedup_distance: int = DEFAULT_MAX_DISTANCE
+    dedup_report: str = None
+    # file the per stage timings are written to
+    profile: str = None
+
+    def to_dict(self) -> Dict:
+        """ the settings as one flat dict of plain values """
+        values = asdict(self)
+        return {**values.pop("pipeline"), **values}
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "Settings":
+        """ build settings from a flat dict such as to_dict gives. Names not
+        given keep their defaults, and an unknown name raises a ValueError
+
+        Args:
+            values (dict): field names of Settings or PipelineConfig to values
+
+        Returns:
+            Settings: the settings
+        """
+        names = {settings_field.name for settings_field in fields(cls)}
+        names.remove("pipeline")
+        pipeline = PipelineConfig.from_dict(
+            {name: value for name, value in values.items() if name not in names}
+        )
+        return cls(
+            pipeline=pipeline,
+            **{name: value for name, value in values.items() if name in names},
+        )
+
+
+def default_tesseract() -> str:
+    """ where to find tesseract: the Windows install location when tesseract
+    is not on the PATH and is installed there, otherwise None so pytesseract
+    runs "tesseract" from the PATH
+
+    Returns:
+        str: the tesseract executable, or None
+    """
+    if shutil.which("tesseract") is None and os.path.isfile(WINDOWS_TESSERACT):
+        return WINDOWS_TESSERACT
+    return None
+
+
+def read_settings_file(path: str) -> Dict:
+    """ read a flat settings file, TOML, YAML or JSON by its extension. TOML
+    uses tomllib (Python 3.11+) or else the toml package, YAML needs pyyaml
+
+    Args:
+        path (str): the settings file
+
+    Returns:
+        dict: names to values, possibly including a "preset"
+
+    Raises:
+        ValueError: if the extension is unknown or the file is not a table
+        ImportError: if the parser for the format is not installed
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        # optional dependencies so only import the parser for this format
+        try:
+            import tomllib
+
+            with open(path, "rb") as settings_file:
+                values = tomllib.load(settings_file)
+        except ImportError:
+            import toml
+
+            values = toml.load(path)
+    elif extension in (".yaml", ".yml"):
+        import yaml
+
+        with open(path) as settings_file:
+            values = yaml.safe_load(settings_file)
+    elif extension == ".json":
+        with open(path) as settings_file:
+            values = json.load(settings_file)
+    else:
+        raise ValueError(
+            f"unknown settings file {path}, choose from {SETTINGS_EXTENSIONS}"
+        )
+    # an empty YAML file loads as None
+    values = {} if values is None else values
+    if not isinstance(values, dict):
+        raise ValueError(f"{path} must hold a table of names and values")
+    return values
+
+
+def parse_override(text: str) -> Tuple[str, Any]:
+    """ split a NAME=VALUE command line override. The value is read as JSON
+    where it can be, so numbers, true, false and null work, and is otherwise
+    kept as a string
+
+    Args:
+        text (str): the override, eg "processing_size=768"
+
+    Returns:
+        tuple(str, any): the name and value
+
+    Raises:
+        ValueError: if there is no "="
+    """
+    name, equals, value = text.partition("=")
+    if not equals or not name.strip():
+        raise ValueError(f"override {text} must be NAME=VALUE")
+    try:
+        return name.strip(), json.loads(value)
+    except json.JSONDecodeError:
+        return name.strip(), value
+
+
+def _problems(name: str, value: Any, default: Any, expected: type) -> str:
+    """ what is wrong with one value, None if nothing is """
+    if value is None:
+        return None if default is None else f"{name} can not be empty"
+    if expected is bool:
+        valid = isinstance(value, bool)
+    elif expected is int:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif expected is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, expected)
+    if not valid:
+        return f"{name} must be {expected.__name__}, not {value!r}"
+    if name in RULES:
+        check, message = RULES[name]
+        if not check(value):
+            return f"{name} {message}, not {value!r}"
+    return None
+
+
+def validate_settings(settings: Settings) -> Settings:
+    """ check the type and range of every value, reporting every problem at
+    once
+
+    Args:
+        settings (Settings): the settings to check
+
+    Returns:
+        Settings: the same settings, if they are valid
+
+    Raises:
+        ValueError: listing each invalid value
+    """
+    checks = [
+        (settings_field, getattr(settings, settings_field.name))
+        for settings_field in fields(settings)
+        if settings_field.name != "pipeline"
+    ]
+    checks.extend(
+        (config_field, getattr(settings.pipeline, config_field.name))
+        for config_field in fields(settings.pipeline)
+    )
+    problems = [
+        _problems(checked.name, value, checked.default, checked.type)
+        for checked, value in checks
+    ]
+    problems = [problem for problem in problems if problem is not None]
+    if problems:
+        raise ValueError("invalid settings: " + "; ".join(problems))
+    return settings
+
+
+def load_settings(
+    path: str = None, preset: str = None, overrides: Dict = None, base: Settings = None,
+) -> Settings:
+    """ layer a preset, a settings file and overrides over base settings, and
+    validate the result
+
+    Args:
+        path (str, optional): TOML, YAML or JSON settings file, which may name
+            its own "preset". Defaults to None
+        preset (str, optional): one of PRESETS, in place of the file's preset.
+            Defaults to None
+        overrides (dict, optional): names to values applied last, eg from the
+            command line. Defaults to None
+        base (Settings, optional): the defaults. Defaults to Settings()
+
+    Returns:
+        Settings: the validated settings
+
+    Raises:
+        ValueError: for an unknown preset or name, or an invalid value
+    """
+    base = base if base is not None else Settings()
+    values = read_settings_file(path) if path is not None else {}
+    file_preset = values.pop("preset", None)
+    preset = preset if preset is not None else file_preset
+    if preset is not None and preset not in PRESETS:
+        raise ValueError(f"unknown preset {preset}, choose from {tuple(PRESETS)}")
+    layers = [base.to_dict(), PRESETS.get(preset, {}), values, overrides or {}]
+    merged = {}
+    for layer in layers:
+        merged.update(layer)
+    return validate_settings(Settings.from_dict(merged))
@@ -0,0 +1,341 @@
+""" Batched output writers, so large jobs write a handful of files instead of
+a text file and an image for every input. Each sink buffers records and
+writes them in batches: JSON lines, Parquet row groups or SQLite transactions
+"""
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import abc
+import base64
+import json
+import os
+import sqlite3
+from typing import Dict, List
+
+import cv2
+
+from ocrcode.pipeline import Result
+
+# the output formats accepted by open_sink
+SINKS = ("jsonl", "parquet", "sqlite")
+# file extensions used to pick a format when none is given
+SINK_EXTENSIONS = {
+    ".jsonl": "jsonl",
+    ".json": "jsonl",
+    ".parquet": "parquet",
+    ".db": "sqlite",
+    ".sqlite": "sqlite",
+    ".sqlite3": "sqlite",
+}
+# records buffered before each write
+DEFAULT_BATCH_SIZE = 1000
+# fast rather than small PNGs, the sink runs in the main process
+PNG_COMPRESSION = 1
+
+
+def make_record(name: str, result: Result, images: bool = False) -> Dict:
+    """ flatten a result into a record for a sink
+
+    Args:
+        name (str): identifies the input, usually its path
+        result (Result): the pipeline result
+        images (bool, optional): include the rectified image PNG encoded.
+            Defaults to False
+
+    Returns:
+        dict: the name, text, quad corners as [x, y] pairs, confidence,
+            words, quality gate report, magnification, stage timings, whether
+            the result was cached, the page whose result it reused as a
+            duplicate (None if it was OCRed) and the image PNG bytes (None
+            when not included). Each word has its text, confidence and corners in the
+            original image. The quality report is None when the gate is off,
+            and its reasons are empty unless the page was rejected
+    """
+    image = None
+    if images and result.image is not None:
+        image = cv2.imencode(
+            ".png", result.image, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+        )[1].tobytes()
+    words = None
+    if result.words is not None:
+        words = [
+            {
+                "text": word.text,
+                "confidence": word.confidence,
+                "quad": None if word.quad is None else word.quad.tolist(),
+            }
+            for word in result.words
+        ]
+    return {
+        "name": name,
+        "text": result.text,
+        "quad": result.quad.reshape((-1, 2)).tolist(),
+        "confidence": result.confidence,
+        "words": words,
+        "quality": None if result.quality is None else result.quality._asdict(),
+        "magnification": result.magnification,
+        "timings": dict(result.timings),
+        "cached": result.cached,
+        "duplicate_of": result.duplicate_of,
+        "image": image,
+    }
+
+
+class Sink(abc.ABC):
+    """ Buffers records and hands them to _write_batch in batches. Subclasses
+    implement _write_batch and _close. Use as a context manager or call close
+    so the last batch is written """
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, images: bool = False):
+        """
+        Args:
+            batch_size (int, optional): records buffered before each write.
+                Defaults to DEFAULT_BATCH_SIZE
+            images (bool, optional): store the rectified images too. Defaults
+                to False
+        """
+        self.batch_size = max(batch_size, 1)
+        self.images = images
+        self.written = 0
+        self._records: List[Dict] = []
+
+    def write(self, name: str, result: Result) -> None:
+        """ add a result, writing the buffered batch once it is full
+
+        Args:
+            name (str): identifies the input, usually its path
+            result (Result): the pipeline result
+        """
+        self._records.append(make_record(name, result, self.images))
+        if len(self._records) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ write any buffered records """
+        if self._records:
+            self._write_batch(self._records)
+            self.written += len(self._records)
+            self._records = []
+
+    def close(self) -> None:
+        """ write any buffered records and close the output """
+        self.flush()
+        self._close()
+
+    @abc.abstractmethod
+    def _write_batch(self, records: List[Dict]) -> None:
+        """ write a batch of records to the output
+
+        Args:
+            records (list(dict)): records from make_record
+        """
+
+    @abc.abstractmethod
+    def _close(self) -> None:
+        """ close the output """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class JsonlSink(Sink):
+    """ One JSON object per line. Images are base64 encoded """
+
+    def __init__(
+        self, path: str, batch_size: int = DEFAULT_BATCH_SIZE, images: bool = False
+    ):
+        """
+        Args:
+            path (str): file to write, appended to if it exists
+            batch_size (int, optional): records buffered before each write.
+                Defaults to DEFAULT_BATCH_SIZE
+            images (bool, optional): store the rectified images too. Defaults
+                to False
+        """
+        super().__init__(batch_size, images)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write_batch(self, records: List[Dict]) -> None:
+        lines = []
+        for record in records:
+            if record["image"] is None:
+                record = {key: value for key, value in record.items() if key != "image"}
+            else:
+                record = {
+                    **record,
+                    "image": base64.b64encode(record["image"]).decode("ascii"),
+                }
+            lines.append(json.dumps(record) + "\n")
+        # a single write per batch
+        self._file.write("".join(lines))
+        self._file.flush()
+
+    def _close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink(Sink):
+    """ A Parquet file with one row group per batch, requires pyarrow """
+
+    def __init__(
+        self, path: str, batch_size: int = DEFAULT_BATCH_SIZE, images: bool = False
+    ):
+        """
+        Args:
+            path (str): file to write, replaced if it exists
+            batch_size (int, optional): rows in each row group. Defaults to
+                DEFAULT_BATCH_SIZE
+            images (bool, optional): store the rectified images too. Defaults
+                to False
+
+        Raises:
+            ImportError: if pyarrow is not installed
+        """
+        # optional dependency so only import when this sink is requested
+        import pyarrow
+        import pyarrow.parquet
+
+        super().__init__(batch_size, images)
+        self._pyarrow = pyarrow
+        self.schema = pyarrow.schema(
+            [
+                ("name", pyarrow.string()),
+                ("text", pyarrow.string()),
+                ("quad", pyarrow.list_(pyarrow.list_(pyarrow.int32()))),
+                ("confidence", pyarrow.float64()),
+                (
+                    "words",
+                    pyarrow.list_(
+                        pyarrow.struct(
+                            [
+                                ("text", pyarrow.string()),
+                                ("confidence", pyarrow.float64()),
+                                ("quad", pyarrow.list_(pyarrow.list_(pyarrow.int32()))),
+                            ]
+                        )
+                    ),
+                ),
+                (
+                    "quality",
+                    pyarrow.struct(
+                        [
+                            ("sharpness", pyarrow.float64()),
+                            ("dark_clipping", pyarrow.float64()),
+                            ("bright_clipping", pyarrow.float64()),
+                            ("area_fraction", pyarrow.float64()),
+                            ("convex", pyarrow.bool_()),
+                            ("min_corner_angle", pyarrow.float64()),
+                            ("max_corner_angle", pyarrow.float64()),
+                            ("reasons", pyarrow.list_(pyarrow.string())),
+                        ]
+                    ),
+                ),
+                ("magnification", pyarrow.float64()),
+                ("timings", pyarrow.map_(pyarrow.string(), pyarrow.float64())),
+                ("cached", pyarrow.bool_()),
+                ("duplicate_of", pyarrow.string()),
+                ("image", pyarrow.binary()),
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def _write_batch(self, records: List[Dict]) -> None:
+        rows = [
+            {**record, "timings": list(record["timings"].items())} for record in records
+        ]
+        table = self._pyarrow.Table.from_pylist(rows, schema=self.schema)
+        self._writer.write_table(table, row_group_size=self.batch_size)
+
+    def _close(self) -> None:
+        self._writer.close()
+
+
+class SqliteSink(Sink):
+    """ A results table in a SQLite database, each batch is one transaction.
+    The quad, words, quality report and timings are stored as JSON text """
+
+    def __init__(
+        self, path: str, batch_size: int = DEFAULT_BATCH_SIZE, images: bool = False
+    ):
+        """
+        Args:
+            path (str): database to write, the table is added to if it exists
+            batch_size (int, optional): rows in each transaction. Defaults to
+                DEFAULT_BATCH_SIZE
+            images (bool, optional): store the rectified images too. Defaults
+                to False
+        """
+        super().__init__(batch_size, images)
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "name TEXT, text TEXT, quad TEXT, confidence REAL, words TEXT, "
+                "quality TEXT, magnification REAL, timings TEXT, cached INTEGER, "
+                "duplicate_of TEXT, image BLOB)"
+            )
+
+    def _write_batch(self, records: List[Dict]) -> None:
+        rows = [
+            (
+                record["name"],
+                record["text"],
+                json.dumps(record["quad"]),
+                record["confidence"],
+                json.dumps(record["words"]),
+                json.dumps(record["quality"]),
+                record["magnification"],
+                json.dumps(record["timings"]),
+                int(record["cached"]),
+                record["duplicate_of"],
+                record["image"],
+            )
+            for record in records
+        ]
+        # the connection context manager commits the batch as one transaction
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def _close(self) -> None:
+        self._connection.close()
+
+
+def open_sink(
+    path: str,
+    sink: str = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    images: bool = False,
+) -> Sink:
+    """ Open an output sink by name, or by the extension of path when no name
+    is given. An unknown name or extension raises a ValueError
+
+    Args:
+        path (str): file to write
+        sink (str, optional): one of SINKS, None to pick from the extension.
+            Defaults to None
+        batch_size (int, optional): records per write, row group or
+            transaction. Defaults to DEFAULT_BATCH_SIZE
+        images (bool, optional): store the rectified images too. Defaults to
+            False
+
+    Returns:
+        Sink: the opened sink
+    """
+    if sink is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in SINK_EXTENSIONS:
+            raise ValueError(
+                f"cannot tell the output format of {path}, choose from {SINKS}"
+            )
+        sink = SINK_EXTENSIONS[extension]
+    if sink == "jsonl":
+        return JsonlSink(path, batch_size, images)
+    if sink == "parquet":
+        return ParquetSink(path, batch_size, images)
+    if sink == "sqlite":
+        return SqliteSink(path, batch_size, images)
+    raise ValueError(f"unknown output format {sink}, choose from {SINKS}")
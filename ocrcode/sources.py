@@ -0,0 +1,202 @@
+""" Multi-page inputs. TIFF and PDF files are split into pages which are read
+one at a time, so a batch can process the pages of a long document in parallel
+without exploding it into image files first """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import shutil
+import subprocess
+from typing import Iterable, Iterator, NamedTuple
+
+import cv2
+import numpy as np
+
+# file extensions of the multi-page formats we can read
+TIFF_EXTENSIONS = (".tif", ".tiff")
+PDF_EXTENSIONS = (".pdf",)
+DOCUMENT_EXTENSIONS = TIFF_EXTENSIONS + PDF_EXTENSIONS
+# resolution PDF pages are rendered at, in dots per inch
+PDF_DPI = 300
+
+
+class Page(NamedTuple):
+    """ A single page of an input file, numbered from 1 """
+
+    path: str
+    number: int = 1
+    count: int = 1
+
+    def __str__(self) -> str:
+        if self.count > 1:
+            return f"{self.path} [page {self.number}/{self.count}]"
+        return self.path
+
+    @property
+    def suffix(self) -> str:
+        """ added to output file names to keep the page number, empty for
+        single page files """
+        return f"_page{self.number}" if self.count > 1 else ""
+
+
+def is_document(path: str) -> bool:
+    """ whether a file is one of the multi-page formats read by read_page
+
+    Args:
+        path (str): file location
+
+    Returns:
+        bool: True for TIFF and PDF files
+    """
+    return path.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def _pdf_tool(name: str) -> str:
+    """ find a poppler command line tool, raising an ImportError if neither it
+    nor PyMuPDF is available """
+    tool = shutil.which(name)
+    if tool is None:
+        raise ImportError(
+            "reading PDF files needs PyMuPDF (pip install pymupdf) or poppler's "
+            f"{name} on the PATH"
+        )
+    return tool
+
+
+def page_count(path: str) -> int:
+    """ count the pages of a file without decoding them
+
+    Args:
+        path (str): file location
+
+    Returns:
+        int: number of pages, 1 for ordinary image files
+    """
+    lower = path.lower()
+    if lower.endswith(TIFF_EXTENSIONS):
+        return _count_tiff_pages(path)
+    if lower.endswith(PDF_EXTENSIONS):
+        try:
+            # optional dependency so only import when reading a PDF
+            import fitz
+        except ImportError:
+            info = subprocess.run(
+                [_pdf_tool("pdfinfo"), path],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            for line in info.splitlines():
+                if line.startswith("Pages:"):
+                    return int(line.split(":")[1])
+            raise IOError(f"unable to count the pages of {path}")
+        with fitz.open(path) as document:
+            return document.page_count
+    return 1
+
+
+def iter_pages(paths: Iterable[str]) -> Iterator[Page]:
+    """ lazily expand files into their pages. Pages are counted as each file is
+    reached, so the first page is available straight away. A file that can not
+    be counted, eg a corrupt PDF, gives a single page with a count of 0, so
+    the error is raised again by read_page for that page alone rather than
+    stopping the batch consuming these pages
+
+    Args:
+        paths (iterable(str)): image, TIFF or PDF files
+
+    Yields:
+        Page: every page of every file in turn
+    """
+    for path in paths:
+        try:
+            count = page_count(path) if is_document(path) else 1
+        except Exception:  # pylint: disable=broad-except
+            count = 0
+        for number in range(1, max(count, 1) + 1):
+            yield Page(path, number, count)
+
+
+def read_page(page: Page) -> np.array:
+    """ decode a single page
+
+    Args:
+        page (Page): the page to read
+
+    Returns:
+        np.array: BGR image of the page
+
+    Raises:
+        IOError: if the page cannot be read
+    """
+    lower = page.path.lower()
+    if lower.endswith(TIFF_EXTENSIONS):
+        image = _read_tiff_page(page.path, page.number)
+    elif lower.endswith(PDF_EXTENSIONS):
+        image = _render_pdf_page(page.path, page.number)
+    else:
+        image = cv2.imread(page.path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"unable to read {page}")
+    return image
+
+
+def _count_tiff_pages(path: str) -> int:
+    """ count the pages of a TIFF, decoding them all on OpenCV releases
+    without cv2.imcount """
+    if hasattr(cv2, "imcount"):
+        return cv2.imcount(path)
+    ok, images = cv2.imreadmulti(path)
+    return len(images) if ok else 0
+
+
+def _read_tiff_page(path: str, number: int) -> np.array:
+    """ decode one page of a TIFF, None if it can not be read. Only the page
+    asked for is decoded, except on OpenCV releases whose imreadmulti takes no
+    page range, where every page is decoded and the rest dropped """
+    try:
+        ok, images = cv2.imreadmulti(
+            path, start=number - 1, count=1, flags=cv2.IMREAD_COLOR
+        )
+    except (TypeError, cv2.error):
+        ok, images = cv2.imreadmulti(path, flags=cv2.IMREAD_COLOR)
+        images = images[number - 1 : number] if ok else []
+    return images[0] if ok and images else None
+
+
+def _render_pdf_page(path: str, number: int) -> np.array:
+    """ rasterise a PDF page at PDF_DPI with PyMuPDF, or poppler's pdftoppm if
+    PyMuPDF is not installed
+
+    Args:
+        path (str): PDF file
+        number (int): page number, from 1
+
+    Returns:
+        np.array: BGR image of the page, None if it could not be rendered
+    """
+    try:
+        import fitz
+    except ImportError:
+        rendered = subprocess.run(
+            [
+                _pdf_tool("pdftoppm"),
+                "-f",
+                str(number),
+                "-l",
+                str(number),
+                "-r",
+                str(PDF_DPI),
+                "-png",
+                "-singlefile",
+                path,
+            ],
+            capture_output=True,
+            check=True,
+        ).stdout
+        return cv2.imdecode(np.frombuffer(rendered, np.uint8), cv2.IMREAD_COLOR)
+    with fitz.open(path) as document:
+        pixmap = document[number - 1].get_pixmap(dpi=PDF_DPI, alpha=False)
+        image = np.frombuffer(pixmap.samples, np.uint8).reshape(
+            (pixmap.height, pixmap.width, pixmap.n)
+        )
+        code = cv2.COLOR_GRAY2BGR if pixmap.n == 1 else cv2.COLOR_RGB2BGR
+        return cv2.cvtColor(image, code)
@@ -0,0 +1,430 @@
+""" Searching the detection and levelling parameters against labelled samples.
+Every trial is a full pipeline run, so each sample's stage outputs are kept
+and shared between trials that only differ in later stages: the scaled image
+is made once, the edge mask once per blur, Canny and kernel setting, and a
+page is only OCRed again when its corners or levelling change. Samples are
+spread over worker processes and the trials are reported as a Pareto front of
+accuracy against processing time """
+# pylint: disable=E1101 no-member
+# this pylint disable is needed due to poor behaviour inside cv2
+import dataclasses
+import functools
+import itertools
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+from ocrcode import batch
+from ocrcode import engines
+from ocrcode import ocr
+from ocrcode.pipeline import DocumentPipeline, PipelineConfig
+
+# the values tried for each parameter, the jmocr.py constants that usually
+# need tuning by hand. Blurs must be odd
+SEARCH_SPACE = {
+    "processing_blur": (3, 5, 7, 9),
+    "threshold_high": (100, 150, 200, 250),
+    "threshold_low": (50, 100, 150, 200),
+    "kernel_size": (3, 5, 7, 9),
+    "min_area": (5000, 10000, 20000),
+    "epsilon": (0.01, 0.02, 0.04),
+    "contrast": (1.0, 1.3, 1.6),
+    "brightness": (0, 10, 20),
+}
+# the parameters each cached stage depends on, in pipeline order
+PREPROCESS_PARAMETERS = (
+    "processing_blur",
+    "threshold_high",
+    "threshold_low",
+    "kernel_size",
+)
+CONTOUR_PARAMETERS = ("min_area", "epsilon")
+LEVEL_PARAMETERS = ("contrast", "brightness")
+# trials tried when no count is given
+DEFAULT_TRIALS = 200
+
+
+class Sample(NamedTuple):
+    """ An image and what the pipeline should find in it, either or both of
+    the text and the corners of the page """
+
+    path: str
+    text: str = None
+    # 4x2 corners of the page in the image, in any order
+    corners: np.array = None
+
+
+class Trial(NamedTuple):
+    """ The outcome of one set of parameters over every sample """
+
+    parameters: Dict[str, Any]
+    # mean score from 0 to 1, see score_sample
+    accuracy: float
+    # mean seconds per sample of the stages the trial ran, as if nothing was
+    # cached. Pages are only straightened and OCRed for samples with text
+    seconds: float
+
+
+def load_samples(paths: Iterable[str]) -> List[Sample]:
+    """ find the labels of some images. The text of image.jpg is read from
+    image.txt, and image.json may hold "corners", a list of four [x, y]
+    pairs, and "text". Images with neither are skipped
+
+    Args:
+        paths (iterable(str)): image files
+
+    Returns:
+        list(Sample): the labelled images
+
+    Raises:
+        ValueError: if no image has a label, or corners are not four points
+    """
+    samples = []
+    for path in paths:
+        stem = os.path.splitext(path)[0]
+        text, corners = None, None
+        if os.path.isfile(stem + ".json"):
+            with open(stem + ".json") as label_file:
+                label = json.load(label_file)
+            text = label.get("text")
+            if label.get("corners") is not None:
+                corners = np.float32(label["corners"])
+                if corners.shape != (4, 2):
+                    raise ValueError(f"{stem}.json corners must be four [x, y]")
+        if os.path.isfile(stem + ".txt"):
+            with open(stem + ".txt", encoding="utf-8") as text_file:
+                text = text_file.read()
+        if text is not None or corners is not None:
+            samples.append(Sample(path, text, corners))
+    if not samples:
+        raise ValueError("no labelled samples, add .txt or .json labels")
+    return samples
+
+
+def make_trials(
+    space: Dict[str, Tuple] = None,
+    count: int = DEFAULT_TRIALS,
+    seed: int = 0,
+    base: PipelineConfig = None,
+) -> List[Dict[str, Any]]:
+    """ choose the parameter sets to try: every combination when there are no
+    more than count, otherwise count distinct ones drawn at random. The base
+    config's own values always come first, to compare against
+
+    Args:
+        space (dict, optional): values to try for each parameter. Defaults to
+            SEARCH_SPACE
+        count (int, optional): most trials, None for every combination.
+            Defaults to DEFAULT_TRIALS
+        seed (int, optional): seeds the random draw. Defaults to 0
+        base (PipelineConfig, optional): the current config. Defaults to the
+            PipelineConfig defaults
+
+    Returns:
+        list(dict): parameter names to values for each trial
+
+    Raises:
+        ValueError: if count is less than 1
+    """
+    if count is not None and count < 1:
+        raise ValueError(f"count must be at least 1, not {count}")
+    space = space if space is not None else SEARCH_SPACE
+    base = base if base is not None else PipelineConfig()
+    names = list(space)
+    baseline = tuple(getattr(base, name) for name in names)
+    total = int(np.prod([len(space[name]) for name in names]))
+    if count is None or count >= total:
+        combinations = list(itertools.product(*(space[name] for name in names)))
+    else:
+        rng = random.Random(seed)
+        # draw indices into the grid so the combinations are distinct
+        combinations = []
+        for index in rng.sample(range(total), count):
+            values = []
+            for name in reversed(names):
+                index, position = divmod(index, len(space[name]))
+                values.append(space[name][position])
+            combinations.append(tuple(reversed(values)))
+    if baseline in combinations:
+        combinations.remove(baseline)
+    elif count is not None and len(combinations) == count:
+        # keep to count trials including the baseline
+        combinations.pop()
+    return [dict(zip(names, values)) for values in [baseline] + combinations]
+
+
+def character_accuracy(text: str, truth: str) -> float:
+    """ one minus the character error rate, the edit distance over the length
+    of the truth, ignoring differences in whitespace
+
+    Args:
+        text (str): the OCRed text
+        truth (str): the expected text
+
+    Returns:
+        float: from 0, far more wrong than right, to 1 for an exact match
+    """
+    text, truth = " ".join(text.split()), " ".join(truth.split())
+    if not truth:
+        return 1.0 if not text else 0.0
+    # Levenshtein distance a row at a time
+    previous = list(range(len(truth) + 1))
+    for row, character in enumerate(text, 1):
+        current = [row]
+        for column, expected in enumerate(truth, 1):
+            current.append(
+                min(
+                    previous[column] + 1,
+                    current[column - 1] + 1,
+                    previous[column - 1] + (character != expected),
+                )
+            )
+        previous = current
+    return max(0.0, 1.0 - previous[-1] / len(truth))
+
+
+def quad_overlap(quad: np.array, corners: np.array) -> float:
+    """ intersection over union of a found page and the labelled one
+
+    Args:
+        quad (np.array): ordered corners found by the pipeline
+        corners (np.array): labelled corners, in any order
+
+    Returns:
+        float: from 0 for no overlap to 1 for the same page
+    """
+    found = np.float32(ocr.order_quadrilateral(quad)).reshape((4, 2))[[0, 1, 3, 2]]
+    expected = np.float32(ocr.order_quadrilateral(corners.reshape((4, 1, 2))))
+    expected = expected.reshape((4, 2))[[0, 1, 3, 2]]
+    intersection, _ = cv2.intersectConvexConvex(found, expected)
+    union = cv2.contourArea(found) + cv2.contourArea(expected) - intersection
+    return float(intersection / union) if union > 0 else 0.0
+
+
+def score_sample(sample: Sample, text: str, quad: np.array) -> float:
+    """ how well a run did on a sample, the mean of the character accuracy
+    and the page overlap, of those it is labelled with
+
+    Args:
+        sample (Sample): the labelled sample
+        text (str): the OCRed text, None if it was not OCRed
+        quad (np.array): corners of the page found, in the sample's image
+
+    Returns:
+        float: from 0 to 1
+    """
+    scores = []
+    if sample.text is not None:
+        scores.append(character_accuracy(text, sample.text))
+    if sample.corners is not None:
+        scores.append(quad_overlap(quad, sample.corners))
+    return float(np.mean(scores))
+
+
+class StageCache:
+    """ Stage outputs for one image keyed by the parameters they depend on,
+    with the seconds each took to make the first time """
+
+    def __init__(self):
+        self._values: Dict[Tuple, Tuple[Any, float]] = {}
+
+    def get(self, key: Tuple, make: Callable[[], Any]) -> Tuple[Any, float]:
+        """ the stage output for key, made now if it is not cached
+
+        Args:
+            key (tuple): the stage name and the parameters it depends on
+            make (callable): makes the output
+
+        Returns:
+            tuple(any, float): the output and the seconds it took to make
+        """
+        if key not in self._values:
+            start = time.perf_counter()
+            value = make()
+            self._values[key] = (value, time.perf_counter() - start)
+        return self._values[key]
+
+
+def evaluate_sample(
+    sample: Sample,
+    trials: List[Dict[str, Any]],
+    config: PipelineConfig = None,
+    engine=None,
+) -> List[Tuple[float, float]]:
+    """ run every trial on one sample, sharing stage outputs between trials.
+    Only samples labelled with text are unwarped and OCRed. Defined at module
+    level so it can be sent to worker processes
+
+    Args:
+        sample (Sample): the labelled sample
+        trials (list(dict)): parameter values for each trial
+        config (PipelineConfig, optional): the parameters not being tuned.
+            Defaults to the PipelineConfig defaults
+        engine (optional): OCR engine, None for the one named in config.
+            Defaults to None
+
+    Returns:
+        list(tuple(float, float)): the score and the seconds of the stages
+            run, as if nothing was cached, for each trial
+    """
+    config = config if config is not None else PipelineConfig()
+    image = cv2.imread(sample.path)
+    if image is None:
+        raise IOError(f"unable to read image {sample.path}")
+    if sample.text is not None and engine is None:
+        engine = engines.get_engine(
+            config.engine, lang=config.lang, tesseract_cmd=config.tesseract_cmd
+        )
+    detection_size = config.detection_size or config.processing_size
+
+    def scale():
+        scaled_image = ocr.scale_longest_axis(image, new_size=detection_size)
+        if config.fused_rectification:
+            return scaled_image, cv2.cvtColor(scaled_image, cv2.COLOR_BGR2GRAY)
+        return scaled_image, scaled_image
+
+    def run(trial, cache, read=True):
+        trial_config = dataclasses.replace(config, **trial)
+        (scaled_image, search_image), seconds = cache.get(("scale",), scale)
+        preprocess_key = tuple(
+            getattr(trial_config, name) for name in PREPROCESS_PARAMETERS
+        )
+        mask, elapsed = cache.get(
+            ("preprocess",) + preprocess_key,
+            lambda: ocr.preprocess_image(
+                search_image,
+                blur=trial_config.processing_blur,
+                threshold_high=trial_config.threshold_high,
+                threshold_low=trial_config.threshold_low,
+                kernel_size=trial_config.kernel_size,
+            ),
+        )
+        seconds += elapsed
+        contour_key = preprocess_key + tuple(
+            getattr(trial_config, name) for name in CONTOUR_PARAMETERS
+        )
+        # keep the minimum page area in proportion to the image we search
+        min_area = int(
+            trial_config.min_area * (detection_size / trial_config.processing_size) ** 2
+        )
+        quad, elapsed = cache.get(
+            ("contour",) + contour_key,
+            lambda: ocr.order_quadrilateral(
+                ocr.get_contour_from_mask(
+                    mask,
+                    min_area=min_area,
+                    epsilon=trial_config.epsilon,
+                    verbose=False,
+                    fallback=trial_config.contour_fallback,
+                )
+            ),
+        )
+        seconds += elapsed
+        if not read:
+            return None, seconds
+        scale_factor = max(image.shape[:2]) / max(scaled_image.shape[:2])
+        text = None
+        if sample.text is not None and cv2.contourArea(quad[[0, 1, 3, 2]]) < min_area:
+            # nothing was found, only the placeholder quad
+            text = ""
+        elif sample.text is not None:
+            # pages with the same corners and levelling read the same
+            level_key = tuple(getattr(trial_config, name) for name in LEVEL_PARAMETERS)
+            pipeline = DocumentPipeline(trial_config, engine=engine)
+            if trial_config.full_resolution_unwarp:
+                source = image
+                page_quad = ocr.scale_quadrilateral(quad, scale_factor)
+            else:
+                source, page_quad = scaled_image, quad
+            text, elapsed = cache.get(
+                ("page", quad.tobytes()) + level_key,
+                lambda: pipeline.process_quad(source, page_quad).text,
+            )
+            seconds += elapsed
+        score = score_sample(sample, text, ocr.scale_quadrilateral(quad, scale_factor))
+        return score, seconds
+
+    # the first run of the search stages also pays for OpenCV's first calls,
+    # which would be charged to the first trial. The page is not read, as
+    # that is most of a trial's work
+    if trials:
+        run(trials[0], StageCache(), read=False)
+    cache = StageCache()
+    return [run(trial, cache) for trial in trials]
+
+
+def pareto_front(trials: Iterable[Trial]) -> List[Trial]:
+    """ the trials no other trial beats on both accuracy and time
+
+    Args:
+        trials (iterable(Trial)): the evaluated trials
+
+    Returns:
+        list(Trial): the front, fastest first, each more accurate than the
+            one before
+    """
+    front = []
+    # fastest first, then most accurate, so each trial need only beat the
+    # accuracy of the front so far
+    for trial in sorted(trials, key=lambda trial: (trial.seconds, -trial.accuracy)):
+        if not front or trial.accuracy > front[-1].accuracy:
+            front.append(trial)
+    return front
+
+
+def choose_trial(front: List[Trial], max_seconds: float = None) -> Trial:
+    """ the most accurate trial on the front within a time budget
+
+    Args:
+        front (list(Trial)): see pareto_front
+        max_seconds (float, optional): most seconds per sample, None for no
+            limit. Defaults to None
+
+    Returns:
+        Trial: the chosen trial, the fastest if none is within the budget
+    """
+    within = [
+        trial for trial in front if max_seconds is None or trial.seconds <= max_seconds
+    ]
+    return within[-1] if within else front[0]
+
+
+def tune(
+    samples: List[Sample],
+    trials: List[Dict[str, Any]],
+    config: PipelineConfig = None,
+    workers: int = 1,
+) -> List[Trial]:
+    """ evaluate every trial on every sample, the samples in parallel
+
+    Args:
+        samples (list(Sample)): labelled samples
+        trials (list(dict)): parameter values for each trial, see make_trials
+        config (PipelineConfig, optional): the parameters not being tuned.
+            Defaults to the PipelineConfig defaults
+        workers (int, optional): worker processes. Defaults to 1
+
+    Returns:
+        list(Trial): each trial's mean accuracy and seconds per sample, in
+            the order of trials
+
+    Raises:
+        RuntimeError: if a sample could not be evaluated
+    """
+    evaluate = functools.partial(evaluate_sample, trials=trials, config=config)
+    outcomes = []
+    for result in batch.run_batch(evaluate, samples, workers=workers):
+        if result.error is not None:
+            raise RuntimeError(f"failed to evaluate {result.item.path}: {result.error}")
+        outcomes.append(result.value)
+    # samples by trials by (score, seconds)
+    means = np.mean(np.array(outcomes, np.float64), axis=0)
+    return [
+        Trial(parameters, float(accuracy), float(seconds))
+        for parameters, (accuracy, seconds) in zip(trials, means)
+    ]
@@ -3,6 +3,7 @@
 from mock import patch
 import pytest
 from ocrcode import arguments
+from ocrcode.quality import QualityPolicy
 
 
 class TestArgumentParser:
@@ -125,6 +126,36 @@ class TestPathsToFiles:
             arguments.paths_to_files(["dir/"])
 
 
+class TestIterImageFiles:
+    """ Test class for arguments.iter_image_files """
+
+    def test_yields_images_from_files_and_dirs(self, tmp_path):
+        for name in ["a.jpg", "b.PNG", "c.txt"]:
+            (tmp_path / name).write_text("")
+        (tmp_path / "sub.jpg").mkdir()
+        single = tmp_path / "single.gif"
+        files = list(arguments.iter_image_files([str(tmp_path)]))
+        assert sorted(files) == [str(tmp_path / "a.jpg"), str(tmp_path / "b.PNG")]
+        single.write_text("")
+        assert list(arguments.iter_image_files([str(single)])) == [str(single)]
+
+    def test_yields_multi_page_documents(self, tmp_path):
+        for name in ["a.tif", "b.TIFF", "c.pdf"]:
+            (tmp_path / name).write_text("")
+        files = list(arguments.iter_image_files([str(tmp_path)]))
+        assert len(files) == 3
+
+    def test_is_lazy(self, tmp_path):
+        (tmp_path / "a.jpg").write_text("")
+        files = arguments.iter_image_files([str(tmp_path), "missing.jpg"])
+        assert next(files) == str(tmp_path / "a.jpg")
+
+    def test_raises_error_if_no_images(self, tmp_path):
+        (tmp_path / "a.txt").write_text("")
+        with pytest.raises(FileNotFoundError):
+            list(arguments.iter_image_files([str(tmp_path), "missing.jpg"]))
+
+
 class TestValidateSave:
     """ Test class for arguments.validate_save """
 
@@ -173,6 +204,13 @@ class TestValidateTesseract:
         expected = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
         assert arguments.validate_tesseract(input) == expected
 
+    @patch("os.path.isfile")
+    def test_returns_tesseract_without_extension(self, mock_isfile):
+        mock_isfile.return_value = True
+        assert (
+            arguments.validate_tesseract("/usr/bin/tesseract") == "/usr/bin/tesseract"
+        )
+
     @patch("os.path.isfile")
     def test_raises_error_for_invalid_path(self, mock_isfile):
         mock_isfile.return_value = False
@@ -184,3 +222,107 @@ class TestValidateTesseract:
         mock_isfile.return_value = True
         with pytest.raises(FileNotFoundError):
             arguments.validate_tesseract("C:\\Program Files\\other.exe")
+
+
+class TestParseOptions:
+    """ Test class for arguments.parse_options """
+
+    @pytest.mark.parametrize(
+        "params_in, expected",
+        [
+            (["file.jpg"], 1),
+            (["file.jpg", "-w", "4"], 4),
+            (["file.jpg", "--workers", "0"], 0),
+        ],
+    )
+    def test_workers_flag_returns_workers(self, params_in, expected):
+        assert arguments.parse_options(params_in).workers == expected
+
+
+class TestParseServeOptions:
+    """ Test class for arguments.parse_serve_options """
+
+    @pytest.mark.parametrize(
+        "flag", ["--workers", "--ocr-concurrency", "--max-pending"]
+    )
+    @pytest.mark.parametrize("value", ["0", "-1", "many"])
+    def test_bad_counts_exit(self, flag, value):
+        with pytest.raises(SystemExit):
+            arguments.parse_serve_options([flag, value])
+
+
+class TestParseCaptureOptions:
+    """ Test class for arguments.parse_capture_options """
+
+    @pytest.mark.parametrize("value", ["0", "-1", "many"])
+    def test_bad_worker_counts_exit(self, value):
+        with pytest.raises(SystemExit):
+            arguments.parse_capture_options(["0", "--workers", value])
+
+    def test_workers(self):
+        assert arguments.parse_capture_options(["0", "-w", "3"]).workers == 3
+
+
+class TestValidateWorkers:
+    """ Test class for arguments.validate_workers """
+
+    def test_returns_requested_workers(self):
+        assert arguments.validate_workers(4) == 4
+
+    @patch("os.cpu_count")
+    def test_zero_uses_all_cores(self, mock_cpu_count):
+        mock_cpu_count.return_value = 32
+        assert arguments.validate_workers(0) == 32
+
+    def test_verbose_runs_serially(self):
+        assert arguments.validate_workers(4, verbose=True) == 1
+
+    def test_raises_error_for_negative_workers(self):
+        with pytest.raises(ValueError):
+            arguments.validate_workers(-1)
+
+
+class TestSettingsOverrides:
+    """ Test class for arguments.settings_overrides """
+
+    def test_only_given_options_override(self):
+        options = arguments.parse_options(["file.jpg", "-w", "1", "-d"])
+        assert arguments.settings_overrides(options) == {
+            "workers": 1,
+            "text_detection": True,
+        }
+
+    def test_nothing_given(self):
+        options = arguments.parse_options(["file.jpg", "-c", "run.toml"])
+        assert arguments.settings_overrides(options) == {}
+        assert options.workers == 1 and options.config == "run.toml"
+
+    def test_quality_gate_uses_the_default_policy(self):
+        options = arguments.parse_options(["file.jpg", "-q"])
+        assert arguments.settings_overrides(options) == {
+            "quality_gate": QualityPolicy()
+        }
+
+    def test_set_overrides_come_last(self):
+        options = arguments.parse_options(
+            ["file.jpg", "--set", "workers=3", "-w", "2", "--set", "epsilon=0.03"]
+        )
+        assert arguments.settings_overrides(options) == {
+            "workers": 3,
+            "epsilon": 0.03,
+        }
+
+    def test_names_limit_the_options(self):
+        options = arguments.parse_tune_options(["a.jpg", "-o", "x.json", "-e", "auto"])
+        assert arguments.settings_overrides(options, arguments.PIPELINE_OPTIONS) == {
+            "engine": "auto"
+        }
+
+    @pytest.mark.parametrize("trials", ["0", "-2", "many"])
+    def test_bad_trial_counts_exit(self, trials):
+        with pytest.raises(SystemExit):
+            arguments.parse_tune_options(["a.jpg", "--trials", trials])
+
+    def test_bad_set_exits(self):
+        with pytest.raises(SystemExit):
+            arguments.parse_options(["file.jpg", "--set", "workers"])
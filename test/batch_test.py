@@ -0,0 +1,86 @@
+"""Test suite for batch.py"""
+import numpy as np
+import pytest
+from ocrcode import batch
+
+
+def _square(value):
+    """ picklable helper for the process pool tests """
+    if value < 0:
+        raise ValueError("negative")
+    return value * value
+
+
+def _limited_data_limit(max_bytes):
+    """ picklable helper limiting the heap of a worker, then reporting it """
+    import resource
+
+    batch.limit_memory(max_bytes)
+    return resource.getrlimit(resource.RLIMIT_DATA)[0]
+
+
+class TestRunBatch:
+    """ Test class for batch.run_batch """
+
+    @pytest.mark.parametrize("workers, threads", [(1, 1), (2, 1), (1, 3)])
+    def test_results_in_input_order(self, workers, threads):
+        results = list(
+            batch.run_batch(_square, range(10), workers=workers, threads=threads)
+        )
+        assert [result.item for result in results] == list(range(10))
+        assert [result.value for result in results] == [i * i for i in range(10)]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_failures_are_isolated(self, workers):
+        results = list(batch.run_batch(_square, [2, -1, 3], workers=workers))
+        assert [result.value for result in results] == [4, None, 9]
+        assert results[1].error == "ValueError: negative"
+        assert results[0].error is None and results[2].error is None
+
+    def test_accepts_lazy_iterables(self):
+        items = (i for i in range(3))
+        assert [r.value for r in batch.run_batch(_square, items)] == [0, 1, 4]
+
+    def test_consumes_items_lazily(self):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        results = batch.run_batch(_square, items(), threads=2)
+        assert next(results).value == 0
+        # only a bounded window of items is read ahead of the first result
+        assert len(consumed) <= 2 * batch.QUEUE_DEPTH + 1
+
+
+class TestLimitMemory:
+    """ Test class for batch.limit_memory """
+
+    def test_limit_is_applied(self):
+        resource = pytest.importorskip("resource")
+        before = resource.getrlimit(resource.RLIMIT_DATA)
+        # in worker processes so the limit does not outlive the test
+        results = list(
+            batch.run_batch(_limited_data_limit, [2 * 1024 ** 3] * 2, workers=2)
+        )
+        assert [result.value for result in results] == [2 * 1024 ** 3] * 2
+        assert resource.getrlimit(resource.RLIMIT_DATA) == before
+
+
+class TestLimitMemoryGrowth:
+    """ Test class for batch.limit_memory_growth """
+
+    def test_growth_is_limited_then_restored(self):
+        resource = pytest.importorskip("resource")
+        if batch.heap_size() is None:
+            pytest.skip("heap size is not reported on this platform")
+        before = resource.getrlimit(resource.RLIMIT_DATA)
+        with batch.limit_memory_growth(64 * 1024 ** 2) as applied:
+            assert applied
+            # the limit allows for what the process already holds
+            assert np.ones(16 * 1024 ** 2, np.uint8).sum() == 16 * 1024 ** 2
+            with pytest.raises(MemoryError):
+                np.ones(256 * 1024 ** 2, np.uint8)
+        assert resource.getrlimit(resource.RLIMIT_DATA) == before
@@ -0,0 +1,61 @@
+"""Test suite for the benchmark package"""
+import numpy as np
+from benchmark import contours
+from benchmark import run_benchmarks
+from benchmark import synthetic
+from ocrcode import ocr
+
+
+class TestMakeDocument:
+    """ Test class for synthetic.make_document """
+
+    def test_same_seed_gives_same_image(self):
+        first, first_corners = synthetic.make_document(0.1, seed=3)
+        second, second_corners = synthetic.make_document(0.1, seed=3)
+        assert (first == second).all() and (first_corners == second_corners).all()
+
+    def test_different_seeds_give_different_images(self):
+        first, _ = synthetic.make_document(0.1, seed=1)
+        second, _ = synthetic.make_document(0.1, seed=2)
+        assert not (first == second).all()
+
+    def test_requested_size(self):
+        image, corners = synthetic.make_document(0.3)
+        assert abs(image.shape[0] * image.shape[1] - 300000) < 2000
+        assert corners.shape == (4, 2)
+
+
+class TestFindRegressions:
+    """ Test class for run_benchmarks.find_regressions """
+
+    def test_reports_only_slow_stages(self):
+        baseline = {"1MP": {"scale": 10.0, "ocr": 10.0, "images_per_second": 50}}
+        results = {"1MP": {"scale": 13.0, "ocr": 11.0, "images_per_second": 1}}
+        regressions = run_benchmarks.find_regressions(results, baseline, 0.25)
+        assert len(regressions) == 1 and regressions[0].startswith("1MP scale")
+
+    def test_ignores_stages_missing_from_baseline(self):
+        results = {"1MP": {"new_stage": 13.0}, "4MP": {"scale": 1.0}}
+        assert run_benchmarks.find_regressions(results, {"1MP": {}}, 0.0) == []
+
+
+class TestContourBenchmark:
+    """ Test class for the contours benchmark """
+
+    def test_reports_contours_per_second(self):
+        masks = contours.make_masks(1, 256, contours.PipelineConfig())
+        report = contours.time_search(lambda entry: None, masks, repeats=2)
+        assert report["contours_per_second"] > 0
+
+    def test_search_matches_legacy(self):
+        config = contours.PipelineConfig()
+        for entry in contours.make_masks(2, 512, config):
+            legacy = contours.legacy_get_contour_from_mask(
+                entry["mask"], config.min_area, config.epsilon, np.copy(entry["image"])
+            )
+            current = ocr.get_contour_from_mask(
+                entry["mask"], config.min_area, config.epsilon, verbose=False
+            )
+            assert np.array_equal(
+                ocr.order_quadrilateral(legacy), ocr.order_quadrilateral(current)
+            )
@@ -0,0 +1,31 @@
+"""Test suite for buffers.py"""
+import numpy as np
+from ocrcode.buffers import BufferPool
+
+
+class TestBufferPool:
+    """ Test class for buffers.BufferPool """
+
+    def test_buffers_have_the_requested_shape(self):
+        buffers = BufferPool()
+        array = buffers.get("a", (3, 4), np.float32)
+        assert array.shape == (3, 4) and array.dtype == np.float32
+        assert array.flags["C_CONTIGUOUS"]
+
+    def test_memory_is_reused(self):
+        buffers = BufferPool()
+        first = buffers.get("a", (10, 10))
+        first[:] = 7
+        # a smaller request shares the memory of the larger one
+        second = buffers.get("a", (5, 5))
+        assert np.shares_memory(first, second)
+        assert buffers.nbytes == 100
+
+    def test_buffers_grow_and_names_are_independent(self):
+        buffers = BufferPool()
+        small = buffers.get("a", (2, 2))
+        large = buffers.get("a", (20, 20))
+        other = buffers.get("b", (2, 2))
+        assert not np.shares_memory(small, large)
+        assert not np.shares_memory(large, other)
+        assert buffers.nbytes == 404
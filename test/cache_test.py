@@ -0,0 +1,156 @@
+"""Test suite for cache.py"""
+import dataclasses
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ocrcode import cache
+from ocrcode.engines import Word
+from ocrcode.pipeline import DocumentPipeline, PipelineConfig, Result
+from ocrcode.quality import QualityPolicy, QualityReport
+from test.pipeline_test import FakeDataEngine, make_document_image
+
+
+def make_result(text="text"):
+    quad = np.array([[[0, 0]], [[10, 0]], [[0, 10]], [[10, 10]]], np.int32)
+    return Result(text=text, quad=quad, image=np.full((20, 30, 3), 128, np.uint8))
+
+
+def size_on_disk(cache_dir):
+    """ bytes of every file in a cache directory """
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(cache_dir)
+        for name in names
+    )
+
+
+class TestParametersHash:
+    """ Test class for cache.parameters_hash """
+
+    def test_changes_with_parameters(self):
+        config = PipelineConfig()
+        changed = dataclasses.replace(config, threshold_high=100)
+        assert cache.parameters_hash(config, "5") != cache.parameters_hash(changed, "5")
+
+    def test_changes_with_engine_version(self):
+        config = PipelineConfig()
+        assert cache.parameters_hash(config, "4") != cache.parameters_hash(config, "5")
+
+    def test_changes_with_quality_policy(self):
+        config = PipelineConfig(quality_gate=QualityPolicy())
+        stricter = PipelineConfig(quality_gate=QualityPolicy(min_sharpness=100))
+        assert cache.parameters_hash(config, "5") != cache.parameters_hash(
+            stricter, "5"
+        )
+
+    def test_ignores_tesseract_location(self):
+        config = PipelineConfig()
+        moved = dataclasses.replace(config, tesseract_cmd="/usr/bin/tesseract")
+        assert cache.parameters_hash(config, "5") == cache.parameters_hash(moved, "5")
+
+    def test_ignores_worker_counts(self):
+        config = PipelineConfig()
+        threaded = dataclasses.replace(
+            config, document_workers=4, text_detection_workers=3
+        )
+        assert cache.parameters_hash(config, "5") == cache.parameters_hash(
+            threaded, "5"
+        )
+
+
+class TestResultCache:
+    """ Test class for cache.ResultCache """
+
+    def test_miss_then_hit(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        key = result_cache.key(b"image", "parameters")
+        assert result_cache.get(key) is None
+        result_cache.put(key, make_result())
+        cached = result_cache.get(key)
+        assert cached.text == "text" and cached.cached
+        assert (cached.quad == make_result().quad).all()
+        assert (result_cache.hits, result_cache.misses) == (1, 1)
+
+    def test_words_are_kept(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        result = make_result()
+        result.confidence = 90.0
+        result.words = [
+            Word("text", 90.0, (1, 2, 3, 4), np.array([[1, 2], [4, 2], [1, 6], [4, 6]]))
+        ]
+        result_cache.put("ab", result)
+        cached = result_cache.get("ab")
+        assert cached.confidence == 90.0
+        (word,) = cached.words
+        assert word[:3] == ("text", 90.0, (1, 2, 3, 4))
+        assert np.array_equal(word.quad, result.words[0].quad)
+        result_cache.put("cd", make_result())
+        assert result_cache.get("cd").words is None
+
+    def test_rejected_pages_are_kept_without_an_image(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        result = make_result("")
+        result.image = None
+        result.quality = QualityReport(5.0, 0.0, 0.0, 0.5, True, 88, 92, ["blurred"])
+        result_cache.put("ab", result, with_image=True)
+        cached = result_cache.get("ab", with_image=True)
+        assert cached.rejected and cached.quality == result.quality
+
+    def test_key_depends_on_content_and_parameters(self):
+        key = cache.ResultCache.key(b"image", "parameters")
+        assert key != cache.ResultCache.key(b"image2", "parameters")
+        assert key != cache.ResultCache.key(b"image", "parameters2")
+
+    def test_image_is_optional(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        result_cache.put("ab", make_result())
+        assert result_cache.get("ab", with_image=True) is None
+        result_cache.put("cd", make_result(), with_image=True)
+        assert result_cache.get("cd", with_image=True).image.shape == (20, 30, 3)
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        result_cache.put("aa", make_result("a" * 100))
+        result_cache.put("bb", make_result("b" * 100))
+        # make aa the most recently used entry
+        os.utime(result_cache._path("bb", ".json"), (1, 1))
+        result_cache.get("aa")
+        result_cache.max_bytes = result_cache._total - 1
+        result_cache.put("cc", make_result("c"))
+        assert result_cache.get("bb") is None
+        assert result_cache.get("aa") is not None
+
+    def test_persists_between_instances(self, tmp_path):
+        cache.ResultCache(str(tmp_path)).put("ab", make_result())
+        assert cache.ResultCache(str(tmp_path)).get("ab").text == "text"
+
+    def test_hits_match_misses(self, tmp_path):
+        config = PipelineConfig(threshold="auto", adaptive_magnification=True)
+        result = DocumentPipeline(config, engine=FakeDataEngine()).process(
+            make_document_image()
+        )
+        result_cache = cache.ResultCache(str(tmp_path))
+        result_cache.put("ab", result)
+        cached = result_cache.get("ab")
+        assert cached.magnification == result.magnification
+        assert cached.threshold == result.threshold == "simple"
+        assert np.allclose(cached.page_transform, result.page_transform)
+        assert np.array_equal(cached.words[0].quad, result.words[0].quad)
+
+    def test_replacing_an_entry_replaces_its_size(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        result_cache.put("ab", make_result("a" * 100), with_image=True)
+        result_cache.put("ab", make_result("a"))
+        result_cache.put("ab", make_result("a" * 50))
+        # the image stored first is still there
+        assert result_cache.get("ab", with_image=True) is not None
+        assert result_cache._total == size_on_disk(str(tmp_path))
+
+    def test_threads_share_a_cache(self, tmp_path):
+        result_cache = cache.ResultCache(str(tmp_path))
+        keys = [f"{index:02x}" for index in range(200)]
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda key: result_cache.put(key, make_result(key)), keys))
+            list(pool.map(result_cache.get, keys))
+        assert result_cache._total == size_on_disk(str(tmp_path))
+        assert len(result_cache._entries) == 200 and result_cache.hits == 200
@@ -0,0 +1,127 @@
+"""Test suite for capture.py"""
+import cv2
+import numpy as np
+import pytest
+from ocrcode import capture
+from ocrcode.pipeline import DocumentPipeline
+from test.pipeline_test import FakeEngine, make_document_image
+
+
+def make_page():
+    """ the test document with enough text inside the page to track """
+    image = make_document_image()
+    for row in range(150, 460, 30):
+        cv2.putText(
+            image, "lorem ipsum", (200, row), cv2.FONT_HERSHEY_SIMPLEX, 0.6, 0, 1
+        )
+    return image
+
+
+def make_frames(still=20, moving=10, blur=False):
+    """ frames of the page sliding into place and then holding still """
+    page = make_page()
+    if blur:
+        page = cv2.GaussianBlur(page, (15, 15), 0)
+    frames = []
+    for index in range(moving + still):
+        shift = max(moving - index, 0) * 4
+        frames.append(
+            cv2.warpAffine(
+                page,
+                np.float32([[1, 0, shift], [0, 1, 0]]),
+                (page.shape[1], page.shape[0]),
+                borderValue=(40, 40, 40),
+            )
+        )
+    return frames
+
+
+def write_video(path, frames):
+    """ save frames as a video file """
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (width, height))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+class FailingEngine(FakeEngine):
+    """ an engine that fails on its first page """
+
+    def image_to_string(self, image):
+        if not self.images:
+            self.images.append(image)
+            raise RuntimeError("engine failed")
+        return super().image_to_string(image)
+
+
+class TestPageTracker:
+    """ Test class for capture.PageTracker """
+
+    def test_captures_once_the_page_settles(self):
+        tracker = capture.PageTracker(stable_frames=5)
+        triggers = [tracker.update(frame) for frame in make_frames(moving=10)]
+        # once, five still frames after the page stops moving
+        assert triggers.count(True) == 1
+        assert triggers.index(True) == 15
+        top_left = tracker.frame_quad()[0][0]
+        assert abs(top_left[0] - 150) < 10 and abs(top_left[1] - 100) < 10
+
+    def test_blurred_pages_are_not_captured(self):
+        tracker = capture.PageTracker(stable_frames=5, min_sharpness=50)
+        assert not any(tracker.update(frame) for frame in make_frames(blur=True))
+
+    def test_a_new_page_is_captured_again(self):
+        tracker = capture.PageTracker(stable_frames=5)
+        empty = np.full_like(make_page(), 40)
+        frames = make_frames(still=10) + [empty] * 3 + make_frames(still=10)
+        triggers = [tracker.update(frame) for frame in frames]
+        assert triggers.count(True) == 2
+        assert tracker.quad is not None
+
+    def test_tracks_between_detections(self):
+        tracker = capture.PageTracker(redetect_interval=100)
+        for frame in make_frames(moving=10, still=0):
+            tracker.update(frame)
+        # the page slid 36 pixels left after it was found
+        top_left = tracker.frame_quad()[0][0]
+        assert abs(top_left[0] - 150) < 10
+
+
+class TestCapture:
+    """ Test class for capture.capture """
+
+    def test_ocrs_each_settled_page(self, tmp_path):
+        path = str(tmp_path / "scan.avi")
+        write_video(path, make_frames(moving=10))
+        engine = FakeEngine()
+        results = list(
+            capture.capture(
+                DocumentPipeline(engine=engine),
+                path,
+                workers=2,
+                tracker=capture.PageTracker(stable_frames=5),
+            )
+        )
+        assert [result.item for result in results] == [15]
+        assert results[0].value.text == "text" and len(engine.images) == 1
+
+    def test_failed_pages_do_not_end_the_capture(self, tmp_path):
+        path = str(tmp_path / "scan.avi")
+        empty = np.full_like(make_page(), 40)
+        write_video(path, make_frames(still=10) + [empty] * 3 + make_frames(still=10))
+        results = list(
+            capture.capture(
+                DocumentPipeline(engine=FailingEngine()),
+                path,
+                tracker=capture.PageTracker(stable_frames=5),
+            )
+        )
+        assert len(results) == 2
+        assert results[0].value is None
+        assert results[0].error == "RuntimeError: engine failed"
+        assert results[1].error is None and results[1].value.text == "text"
+
+    def test_unreadable_source_raises(self, tmp_path):
+        with pytest.raises(IOError):
+            capture.open_video(str(tmp_path / "missing.avi"))
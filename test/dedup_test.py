@@ -0,0 +1,191 @@
+"""Test suite for dedup.py"""
+import sqlite3
+import cv2
+import numpy as np
+import pytest
+from ocrcode import dedup
+from ocrcode.pipeline import DocumentPipeline
+from test.pipeline_test import FakeDataEngine, ink_box, make_document_image
+
+
+def shifted(image, x, y):
+    """ the image moved, as if photographed again """
+    return cv2.warpAffine(
+        image,
+        np.float32([[1, 0, x], [0, 1, y]]),
+        (image.shape[1], image.shape[0]),
+        borderValue=(40, 40, 40),
+    )
+
+
+def make_other_document_image():
+    """ a page the same shape as make_document_image with different text """
+    image = np.full((600, 800, 3), 40, np.uint8)
+    page = np.array([[150, 100], [650, 120], [630, 500], [170, 480]], np.int32)
+    cv2.fillPoly(image, [page], (230, 230, 230))
+    for row in range(160, 460, 40):
+        cv2.putText(image, "lorem", (200, row), cv2.FONT_HERSHEY_SIMPLEX, 1, 0, 2)
+    return image
+
+
+class TestImageHash:
+    """ Test class for dedup.image_hash """
+
+    @pytest.mark.parametrize("method", dedup.HASH_METHODS)
+    def test_near_copies_are_close(self, method):
+        image = make_document_image()
+        brighter = cv2.convertScaleAbs(image, alpha=1.1, beta=10)
+        page_hash = dedup.image_hash(image, method)
+        assert 0 <= page_hash < 2 ** 64
+        assert dedup.image_hash(image, method) == page_hash
+        assert (
+            dedup.hamming_distances(page_hash, [dedup.image_hash(brighter, method)])[0]
+            <= dedup.DEFAULT_MAX_DISTANCE
+        )
+
+    @pytest.mark.parametrize("method", dedup.HASH_METHODS)
+    def test_different_pages_are_far(self, method):
+        distance = dedup.hamming_distances(
+            dedup.image_hash(make_document_image(), method),
+            [dedup.image_hash(make_other_document_image(), method)],
+        )[0]
+        assert distance > dedup.DEFAULT_MAX_DISTANCE
+
+    def test_unknown_method_raises(self):
+        with pytest.raises(ValueError):
+            dedup.image_hash(make_document_image(), "ahash")
+
+
+class TestHammingDistances:
+    """ Test class for dedup.hamming_distances """
+
+    def test_counts_differing_bits(self):
+        hashes = [0, 1, 0b1011, 2 ** 64 - 1]
+        assert dedup.hamming_distances(0, hashes).tolist() == [0, 1, 3, 64]
+
+
+class TestDuplicateIndex:
+    """ Test class for dedup.DuplicateIndex """
+
+    def recognise(self, index, pipeline, name, image):
+        clean_image, result = pipeline.rectify(image)
+        return index.recognise(pipeline, name, clean_image, result)
+
+    def test_duplicates_reuse_the_first_result(self, tmp_path):
+        engine = FakeDataEngine()
+        pipeline = DocumentPipeline(engine=engine)
+        index = dedup.DuplicateIndex(str(tmp_path / "index.db"))
+        image = make_document_image()
+        first = self.recognise(index, pipeline, "a.png", image)
+        again = self.recognise(index, pipeline, "b.png", shifted(image, 12, 8))
+        assert len(engine.images) == 1
+        assert first.duplicate_of is None and again.duplicate_of == "a.png"
+        assert again.duplicate_distance <= dedup.DEFAULT_MAX_DISTANCE
+        assert again.text == first.text and again.confidence == first.confidence
+        assert "dedup" in again.timings and "ocr" not in again.timings
+        # the reused word is placed on the shifted image
+        x, y, width, height = ink_box(shifted(image, 12, 8))
+        (word,) = again.words
+        assert abs(word.quad[0][0] - x) < 10 and abs(word.quad[0][1] - y) < 10
+        assert abs(word.quad[3][0] - (x + width)) < 10
+
+    def test_different_pages_are_ocred(self, tmp_path):
+        engine = FakeDataEngine()
+        pipeline = DocumentPipeline(engine=engine)
+        index = dedup.DuplicateIndex(str(tmp_path / "index.db"))
+        self.recognise(index, pipeline, "a.png", make_document_image())
+        other = self.recognise(index, pipeline, "b.png", make_other_document_image())
+        assert other.duplicate_of is None and len(engine.images) == 2
+        assert len(index) == 2
+
+    def test_persists_between_runs(self, tmp_path):
+        path = str(tmp_path / "index.db")
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        earlier = dedup.DuplicateIndex(path)
+        self.recognise(earlier, pipeline, "a.png", make_document_image())
+        earlier.close()
+        later = dedup.DuplicateIndex(path)
+        result = self.recognise(later, pipeline, "b.png", make_document_image())
+        assert result.duplicate_of == "a.png" and result.duplicate_distance == 0
+
+    def test_sees_pages_added_by_other_processes(self, tmp_path):
+        path = str(tmp_path / "index.db")
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        reader, writer = dedup.DuplicateIndex(path), dedup.DuplicateIndex(path)
+        assert len(reader) == 0
+        self.recognise(writer, pipeline, "a.png", make_document_image())
+        result = self.recognise(reader, pipeline, "b.png", make_document_image())
+        assert result.duplicate_of == "a.png"
+
+    def test_methods_are_kept_apart(self, tmp_path):
+        path = str(tmp_path / "index.db")
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        dhashes = dedup.DuplicateIndex(path, method="dhash")
+        self.recognise(dhashes, pipeline, "a.png", make_document_image())
+        assert len(dedup.DuplicateIndex(path, method="phash")) == 0
+
+    def test_parameters_are_kept_apart(self, tmp_path):
+        path = str(tmp_path / "index.db")
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        earlier = dedup.DuplicateIndex(path, parameters="fast")
+        self.recognise(earlier, pipeline, "a.png", make_document_image())
+        later = dedup.DuplicateIndex(path, parameters="accurate")
+        result = self.recognise(later, pipeline, "b.png", make_document_image())
+        assert result.duplicate_of is None
+        assert len(later) == 1 and len(earlier) == 1
+
+    def test_older_index_pages_are_not_matched(self, tmp_path):
+        path = str(tmp_path / "index.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE pages (name TEXT, method TEXT, hash TEXT, text TEXT, "
+                "confidence REAL, words TEXT, height INTEGER, width INTEGER)"
+            )
+            connection.execute(
+                "INSERT INTO pages VALUES ('a.png', 'dhash', '0', 'old', 90, "
+                "NULL, 10, 10)"
+            )
+        connection.close()
+        index = dedup.DuplicateIndex(path)
+        assert len(index) == 0 and index.find(0) is None
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        self.recognise(index, pipeline, "b.png", make_document_image())
+        assert len(index) == 1
+
+    @pytest.mark.parametrize("max_distance, found", [(0, False), (1, True)])
+    def test_max_distance(self, max_distance, found):
+        pipeline = DocumentPipeline(engine=FakeDataEngine())
+        index = dedup.DuplicateIndex(":memory:", max_distance=max_distance)
+        clean_image, result = pipeline.rectify(make_document_image())
+        index.add("a.png", 0b1010, pipeline.recognise(clean_image, result), (10, 10))
+        assert index.find(0b1010).distance == 0
+        duplicate = index.find(0b1011)
+        assert (duplicate is not None) == found
+        if found:
+            assert duplicate.name == "a.png" and duplicate.text == "text\n"
+
+    def test_unknown_method_raises(self):
+        with pytest.raises(ValueError):
+            dedup.DuplicateIndex(":memory:", method="ahash")
+
+
+class TestDuplicateClusters:
+    """ Test class for dedup.duplicate_clusters """
+
+    def test_groups_by_original(self):
+        clusters = dedup.duplicate_clusters(
+            [("b", "a", 3), ("d", "c", 0), ("e", "c", 5)]
+        )
+        assert clusters == [
+            {
+                "original": "c",
+                "duplicates": [
+                    {"name": "d", "distance": 0},
+                    {"name": "e", "distance": 5},
+                ],
+            },
+            {"original": "a", "duplicates": [{"name": "b", "distance": 3}]},
+        ]
+
+    def test_no_duplicates(self):
+        assert dedup.duplicate_clusters([]) == []
@@ -0,0 +1,217 @@
+"""Test suite for engines.py"""
+import sys
+import types
+from mock import patch
+import numpy as np
+import pytest
+from ocrcode import engines
+
+
+class TestPytesseractEngine:
+    """ Test class for engines.PytesseractEngine """
+
+    @patch("pytesseract.image_to_string")
+    def test_passes_language_to_pytesseract(self, mock_image_to_string):
+        mock_image_to_string.return_value = "text"
+        engine = engines.PytesseractEngine(lang="deu")
+        image = np.zeros((10, 10), np.uint8)
+        assert engine.image_to_string(image) == "text"
+        assert mock_image_to_string.call_args[1]["lang"] == "deu"
+
+    @patch("pytesseract.image_to_data")
+    def test_data_comes_from_one_call(self, mock_image_to_data):
+        mock_image_to_data.return_value = make_data()
+        engine = engines.PytesseractEngine(lang="deu")
+        text, words = engine.image_to_data(np.zeros((10, 10), np.uint8))
+        assert mock_image_to_data.call_count == 1
+        assert mock_image_to_data.call_args[1]["lang"] == "deu"
+        assert text == "Hello world\nagain\n\nbye\n"
+        assert [word.text for word in words] == ["Hello", "world", "again", "bye"]
+
+
+def make_data():
+    """ tesseract data output for three lines in two paragraphs """
+    rows = [
+        # level, block, paragraph, line, left, top, width, height, conf, text
+        (1, 0, 0, 0, 0, 0, 100, 100, -1, ""),
+        (5, 1, 1, 1, 10, 10, 20, 8, 96, "Hello"),
+        (5, 1, 1, 1, 35, 10, 20, 8, 91.5, "world"),
+        (5, 1, 1, 2, 10, 20, 20, 8, 88, "again"),
+        (5, 1, 1, 2, 35, 20, 20, 8, 95, " "),
+        (5, 2, 1, 1, 10, 50, 20, 8, 70, "bye"),
+    ]
+    keys = "level block_num par_num line_num left top width height conf text".split()
+    return {key: [row[index] for row in rows] for index, key in enumerate(keys)}
+
+
+class TestWordsFromData:
+    """ Test class for engines.words_from_data """
+
+    def test_words_keep_their_boxes_and_confidences(self):
+        _, words = engines.words_from_data(make_data())
+        assert words[1] == engines.Word("world", 91.5, (35, 10, 20, 8))
+
+    def test_no_words_gives_no_text(self):
+        data = {key: value[:1] for key, value in make_data().items()}
+        assert engines.words_from_data(data) == ("", [])
+
+
+class FakeWord:
+    """ a word from the fake tesserocr iterator """
+
+    def __init__(self, text, confidence, corners):
+        self.text = text
+        self.confidence = confidence
+        self.corners = corners
+
+    def GetUTF8Text(self, level):
+        return self.text
+
+    def BoundingBox(self, level):
+        return self.corners
+
+    def Confidence(self, level):
+        return self.confidence
+
+
+class FakeAPI:
+    """ stands in for tesserocr.PyTessBaseAPI, recording how it is used """
+
+    # words found on every image, including a blank and an unplaced one
+    WORDS = [
+        FakeWord("Hello", 96, (10, 10, 30, 18)),
+        FakeWord(" ", 80, (35, 10, 40, 18)),
+        FakeWord("world", 91.5, None),
+    ]
+
+    def __init__(self, lang="eng"):
+        self.lang = lang
+        # the engine's pool, to see what is left in it while this is in use
+        self.pool = None
+        self.images = []
+        self.fail = False
+        self.ended = False
+
+    def SetImageBytes(self, data, width, height, bytes_per_pixel, stride):
+
+        if self.fail:
+            raise RuntimeError("tesseract failed")
+        self.images.append((width, height, bytes_per_pixel, self.pool.qsize()))
+
+    def Recognize(self):
+        pass
+
+    def GetUTF8Text(self):
+        return "Hello world\n"
+
+    def GetIterator(self):
+        return list(self.WORDS)
+
+    def End(self):
+        self.ended = True
+
+
+def make_tesserocr(apis):
+    """ a tesserocr module whose APIs are added to apis as they are made """
+    module = types.ModuleType("tesserocr")
+    module.RIL = types.SimpleNamespace(WORD=3)
+    module.iterate_level = lambda iterator, level: iter(iterator)
+    module.tesseract_version = lambda: "tesseract 5.3.0"
+
+    def make_api(lang="eng"):
+        apis.append(FakeAPI(lang))
+        return apis[-1]
+
+    module.PyTessBaseAPI = make_api
+    return module
+
+
+class TestTesserocrEngine:
+    """ Test class for engines.TesserocrEngine """
+
+    def make_engine(self, size=1):
+        """ an engine on the fake tesserocr, the APIs it made and the module """
+        apis = []
+        module = make_tesserocr(apis)
+        with patch.dict(sys.modules, {"tesserocr": module}):
+            engine = engines.TesserocrEngine(lang="deu", size=size)
+        for api in apis:
+            api.pool = engine._apis
+        return engine, apis, module
+
+    def test_pool_checks_out_and_returns_apis(self):
+        engine, apis, module = self.make_engine(size=2)
+        assert len(apis) == 2 and all(api.lang == "deu" for api in apis)
+        with patch.dict(sys.modules, {"tesserocr": module}):
+            for _ in range(3):
+                assert engine.image_to_string(np.zeros((10, 20), np.uint8)) == (
+                    "Hello world\n"
+                )
+        # each call took one API, leaving the other free, then put it back
+        used = [image for api in apis for image in api.images]
+        assert len(used) == 3 and all(image[3] == 1 for image in used)
+        assert engine._apis.qsize() == 2
+
+    def test_colour_images_are_handed_over_as_rgb(self):
+        engine, apis, _ = self.make_engine()
+        engine.image_to_string(np.zeros((10, 20, 3), np.uint8))
+        assert apis[0].images[0][:3] == (20, 10, 3)
+
+    def test_data_reads_words_from_the_iterator(self):
+        engine, _, module = self.make_engine()
+        with patch.dict(sys.modules, {"tesserocr": module}):
+            text, words = engine.image_to_data(np.zeros((10, 20), np.uint8))
+        assert text == "Hello world\n"
+        # blank words and words without a box are dropped
+        assert words == [engines.Word("Hello", 96.0, (10, 10, 20, 8))]
+        assert engine._apis.qsize() == 1
+
+    @pytest.mark.parametrize("method", ["image_to_string", "image_to_data"])
+    def test_api_is_returned_after_an_error(self, method):
+        engine, apis, module = self.make_engine()
+        apis[0].fail = True
+        with patch.dict(sys.modules, {"tesserocr": module}):
+            with pytest.raises(RuntimeError):
+                getattr(engine, method)(np.zeros((10, 20), np.uint8))
+        assert engine._apis.qsize() == 1
+
+    def test_version_and_close(self):
+        engine, apis, module = self.make_engine(size=2)
+        with patch.dict(sys.modules, {"tesserocr": module}):
+            assert engine.version() == "tesserocr tesseract 5.3.0 deu"
+        engine.close()
+        assert all(api.ended for api in apis)
+
+
+class TestCreateEngine:
+    """ Test class for engines.create_engine """
+
+    def test_raises_error_for_unknown_engine(self):
+        with pytest.raises(ValueError):
+            engines.create_engine("unknown")
+
+    @patch.dict(sys.modules, {"tesserocr": None})
+    def test_auto_falls_back_to_pytesseract(self):
+        engine = engines.create_engine("auto")
+        assert isinstance(engine, engines.PytesseractEngine)
+
+    @pytest.mark.parametrize("name", ["auto", "tesserocr"])
+    def test_prefers_tesserocr_when_installed(self, name):
+        with patch.dict(sys.modules, {"tesserocr": make_tesserocr([])}):
+            engine = engines.create_engine(name, size=0)
+        assert isinstance(engine, engines.TesserocrEngine)
+
+    @patch.dict(sys.modules, {"tesserocr": None})
+    def test_tesserocr_raises_error_when_not_installed(self):
+        with pytest.raises(ImportError):
+            engines.create_engine("tesserocr")
+
+
+class TestGetEngine:
+    """ Test class for engines.get_engine """
+
+    @patch.dict(sys.modules, {"tesserocr": None})
+    def test_reuses_engine_with_same_settings(self):
+        first = engines.get_engine("pytesseract", lang="eng")
+        assert engines.get_engine("pytesseract", lang="eng") is first
+        assert engines.get_engine("pytesseract", lang="fra") is not first
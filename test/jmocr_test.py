@@ -0,0 +1,52 @@
+"""Test suite for jmocr.py"""
+import os
+import stat
+import subprocess
+import sys
+import cv2
+import pytest
+from test.pipeline_test import make_document_image
+
+# the repository root, where jmocr.py lives
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# a stand in for tesseract, answering the calls pytesseract makes
+FAKE_TESSERACT = """#!/bin/sh
+if [ "$1" = "--version" ]; then echo "tesseract 5.0.0"; exit 0; fi
+printf 'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\t' > "$2.tsv"
+printf 'width\theight\tconf\ttext\n5\t1\t1\t1\t1\t1\t0\t0\t9\t9\t90\ttext\n' >> "$2.tsv"
+"""
+
+
+def run_jmocr(*args):
+    """ run jmocr.py, returning its stderr """
+    completed = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "jmocr.py"), *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return completed.stderr
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the fake tesseract is sh")
+class TestMain:
+    """ Test class for the jmocr.py batch command """
+
+    def test_cache_is_shared_across_worker_counts(self, tmp_path):
+        tesseract = tmp_path / "tesseract"
+        tesseract.write_text(FAKE_TESSERACT)
+        tesseract.chmod(tesseract.stat().st_mode | stat.S_IEXEC)
+        image = str(tmp_path / "page.png")
+        cv2.imwrite(image, make_document_image())
+        options = [image, "-t", str(tesseract), "-e", "pytesseract"]
+        options += ["--cache-dir", str(tmp_path / "cache")]
+        assert "cache hits: 0, misses: 1" in run_jmocr(*options, "-w", "1")
+        # the worker count changes how pages are shared out, not the result
+        assert "cache hits: 1, misses: 0" in run_jmocr(*options, "-w", "2")
+
+    def test_large_rejects_multi_page_documents(self, tmp_path):
+        document = str(tmp_path / "pages.tiff")
+        cv2.imwritemulti(document, [make_document_image()] * 2)
+        errors = run_jmocr(document, "-l", "-e", "pytesseract")
+        assert "is a multi-page document, which -l can not read" in errors
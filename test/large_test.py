@@ -0,0 +1,146 @@
+"""Test suite for large.py"""
+import cv2
+import numpy as np
+import pytest
+from ocrcode import batch
+from ocrcode import large
+from ocrcode import ocr
+from ocrcode.pipeline import DocumentPipeline
+from test.pipeline_test import FakeDataEngine, FakeEngine, ink_box, make_document_image
+
+
+class TestReadReduced:
+    """ Test class for large.read_reduced """
+
+    @pytest.mark.parametrize("detection_size, factor", [(90, 8), (150, 4), (800, 1)])
+    def test_smallest_sufficient_reduction(self, tmp_path, detection_size, factor):
+        path = str(tmp_path / "image.png")
+        cv2.imwrite(path, np.zeros((600, 800, 3), np.uint8))
+        image, chosen = large.read_reduced(path, detection_size)
+        assert chosen == factor
+        assert image.shape[1] == 800 // factor
+
+    def test_unreadable_file_raises(self, tmp_path):
+        path = tmp_path / "image.png"
+        path.write_bytes(b"not an image")
+        with pytest.raises(IOError):
+            large.read_reduced(str(path), 100)
+
+
+class TestOpenSource:
+    """ Test class for large.open_source """
+
+    @pytest.mark.parametrize("cached", [False, True])
+    def test_maps_the_full_image(self, tmp_path, cached):
+        path = str(tmp_path / "image.png")
+        image = make_document_image()
+        cv2.imwrite(path, image)
+        cache_dir = str(tmp_path / "raw") if cached else None
+        source = large.open_source(path, cache_dir)
+        assert isinstance(source, np.memmap)
+        assert np.array_equal(source, image)
+        if cached:
+            # a second open maps the raw copy without decoding again
+            assert len(list((tmp_path / "raw").iterdir())) == 1
+            assert np.array_equal(large.open_source(path, cache_dir), image)
+
+
+class TestUnwarpTiles:
+    """ Test class for large.unwarp_tiles """
+
+    @pytest.mark.parametrize("memory_limit", [10 ** 4, 10 ** 8])
+    def test_matches_whole_page_unwarp(self, memory_limit):
+        image = make_document_image()
+        quad = ocr.order_quadrilateral(
+            np.array([[150, 100], [650, 120], [170, 480], [630, 500]])
+        )
+        lut = ocr.level_lut(1.3, 10)
+        page, row_ink = large.unwarp_tiles(image, quad, 10, lut, memory_limit)
+        expected = ocr.unwarp_and_level(
+            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), quad, margin=10, lut=lut
+        )
+        assert np.array_equal(page, expected)
+        assert np.allclose(row_ink, np.mean(expected < 128, axis=1))
+
+
+class TestFindStripBreaks:
+    """ Test class for large.find_strip_breaks """
+
+    def test_cuts_through_blank_rows(self):
+        # lines of text 20 rows tall separated by 10 blank rows
+        row_ink = np.tile(np.r_[np.full(20, 0.2), np.zeros(10)], 10)
+        breaks = large.find_strip_breaks(row_ink, max_rows=100)
+        assert breaks[0] == 0 and breaks[-1] == 300
+        assert all(0 < b - a <= 100 for a, b in zip(breaks, breaks[1:]))
+        assert all(row_ink[b] == 0 for b in breaks[1:-1])
+
+    def test_short_pages_are_one_strip(self):
+        assert large.find_strip_breaks(np.ones(50), max_rows=100) == [0, 50]
+
+    def test_pages_without_gaps_are_still_split(self):
+        breaks = large.find_strip_breaks(np.ones(250), max_rows=100)
+        assert all(0 < b - a <= 100 for a, b in zip(breaks, breaks[1:]))
+
+
+class TestProcessLargeImage:
+    """ Test class for large.process_large_image """
+
+    def test_ocrs_the_page_in_strips(self, tmp_path):
+        path = str(tmp_path / "image.png")
+        image = make_document_image()
+        cv2.imwrite(path, image)
+        engine = FakeEngine()
+        result = large.process_large_image(
+            DocumentPipeline(engine=engine), path, memory_limit=2 * 10 ** 6
+        )
+        assert result.text == "text"
+        assert result.magnification == 1
+        top_left = result.quad[0][0]
+        assert abs(top_left[0] - 150) < 10 and abs(top_left[1] - 100) < 10
+        assert {"decode", "source", "unwarp", "ocr"} <= set(result.timings)
+        # blank strips are skipped and every OCRed strip is full width
+        assert all(crop.shape[1] == result.image.shape[1] for crop in engine.images)
+
+    def test_words_are_placed_on_the_original_image(self, tmp_path):
+        path = str(tmp_path / "image.png")
+        image = make_document_image()
+        cv2.imwrite(path, image)
+        result = large.process_large_image(
+            DocumentPipeline(engine=FakeDataEngine()), path, memory_limit=2 * 10 ** 6
+        )
+        x, y, width, height = ink_box(image)
+        top_left = min(result.words, key=lambda word: word.box[1]).quad[0]
+        assert np.abs(top_left - [x, y]).max() < 8
+        assert result.confidence == 90.0
+
+    def test_decode_is_outside_the_limit(self, tmp_path):
+        resource = pytest.importorskip("resource")
+        if batch.heap_size() is None:
+            pytest.skip("heap size is not reported on this platform")
+        path = str(tmp_path / "image.png")
+        # a 13MB decode under a 4MB limit
+        cv2.imwrite(path, cv2.resize(make_document_image(), (2400, 1800)))
+        limits = []
+
+        class LimitEngine(FakeEngine):
+            """ records the heap limit in force during OCR """
+
+            def image_to_string(self, image):
+                limits.append(resource.getrlimit(resource.RLIMIT_DATA)[0])
+                return super().image_to_string(image)
+
+        before = resource.getrlimit(resource.RLIMIT_DATA)
+        result = large.process_large_image(
+            DocumentPipeline(engine=LimitEngine()), path, memory_limit=4 * 10 ** 6
+        )
+        assert result.text == "text"
+        assert limits and all(limit != before[0] for limit in limits)
+        assert resource.getrlimit(resource.RLIMIT_DATA) == before
+
+    def test_too_small_a_limit_raises(self, tmp_path):
+        path = str(tmp_path / "image.png")
+        cv2.imwrite(path, make_document_image())
+        with pytest.raises(MemoryError):
+            large.process_large_image(
+                DocumentPipeline(engine=FakeEngine()), path, memory_limit=10 ** 4
+            )
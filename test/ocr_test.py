@@ -8,6 +8,7 @@ implementation
 """
 import pytest
 from ocrcode import ocr
+from ocrcode.buffers import BufferPool
 import cv2
 import numpy as np
 
@@ -54,9 +55,96 @@ class TestPreprocessImage:
 
 
 class TestGetContourFromMask:
-    """Test class for ocr.get_contour_from_mask (no tests for reason 3 above)"""
+    """Test class for ocr.get_contour_from_mask"""
 
-    pass
+    @staticmethod
+    def make_mask():
+        # a large and a small quad plus a large blob that is not a quad
+        mask = np.zeros((400, 400), np.uint8)
+        cv2.rectangle(mask, (20, 20), (120, 120), 255, -1)
+        cv2.fillPoly(
+            mask, [np.array([[150, 30], [380, 40], [370, 250], [160, 240]])], 255
+        )
+        cv2.circle(mask, (100, 320), 70, 255, -1)
+        return mask
+
+    def test_largest_quadrilateral_is_found(self):
+        quad = ocr.get_contour_from_mask(self.make_mask(), 1000, 0.02, verbose=False)
+        assert quad.shape == (4, 1, 2)
+        assert sorted(quad.reshape((4, 2))[:, 0]) == [150, 160, 370, 380]
+
+    def test_small_contours_are_ignored(self):
+        quad = ocr.get_contour_from_mask(self.make_mask(), 100000, 0.02, verbose=False)
+        assert quad.max() == 10
+
+    def test_contour_check_only_drawn_when_verbose(self):
+        contour_check = np.zeros((400, 400, 3), np.uint8)
+        ocr.get_contour_from_mask(
+            self.make_mask(), 1000, 0.02, contour_check=contour_check, verbose=False
+        )
+        assert not contour_check.any()
+
+    @pytest.mark.parametrize("fallback", ["hull", "rect"])
+    def test_fallback_recovers_an_obscured_corner(self, fallback):
+        # a page with a notch bitten out of one edge is not a quad
+        mask = np.zeros((400, 400), np.uint8)
+        cv2.rectangle(mask, (50, 50), (350, 300), 255, -1)
+        cv2.rectangle(mask, (150, 250), (250, 300), 0, -1)
+        assert ocr.get_contour_from_mask(mask, 1000, 0.01, verbose=False).max() == 10
+        quad = ocr.get_contour_from_mask(
+            mask, 1000, 0.01, verbose=False, fallback=fallback
+        )
+        corners = ocr.order_quadrilateral(quad).reshape((4, 2))
+        assert np.abs(corners - [[50, 50], [350, 50], [50, 300], [350, 300]]).max() <= 1
+
+    def test_unknown_fallback_raises(self):
+        with pytest.raises(ValueError):
+            ocr.get_contour_from_mask(self.make_mask(), 1000, 0.02, fallback="x")
+
+
+class TestGetQuadrilateralsFromMask:
+    """Test class for ocr.get_quadrilaterals_from_mask"""
+
+    @staticmethod
+    def make_mask():
+        # three separate cards of different sizes
+        mask = np.zeros((400, 600), np.uint8)
+        cv2.rectangle(mask, (20, 20), (120, 120), 255, -1)
+        cv2.rectangle(mask, (200, 30), (560, 330), 255, -1)
+        cv2.rectangle(mask, (20, 200), (170, 380), 255, -1)
+        return mask
+
+    def test_every_quadrilateral_is_found_largest_first(self):
+        quads = ocr.get_quadrilaterals_from_mask(
+            self.make_mask(), 1000, 0.02, verbose=False
+        )
+        left_edges = [quad.reshape((4, 2))[:, 0].min() for quad in quads]
+        assert left_edges == [200, 20, 20]
+        assert [quad.reshape((4, 2))[:, 1].min() for quad in quads][1:] == [200, 20]
+
+    def test_max_count_limits_the_results(self):
+        quads = ocr.get_quadrilaterals_from_mask(
+            self.make_mask(), 1000, 0.02, max_count=2, verbose=False
+        )
+        assert len(quads) == 2
+
+    def test_overlapping_quadrilaterals_are_dropped(self):
+        # a card sitting in a notch bitten out of a larger page
+        mask = np.zeros((400, 400), np.uint8)
+        cv2.rectangle(mask, (50, 50), (350, 300), 255, -1)
+        cv2.rectangle(mask, (150, 200), (250, 300), 0, -1)
+        cv2.rectangle(mask, (170, 225), (230, 290), 255, -1)
+        exact = ocr.get_quadrilaterals_from_mask(mask, 1000, 0.01, verbose=False)
+        assert len(exact) == 1 and exact[0].reshape((4, 2))[:, 0].min() == 170
+        # the hull of the page covers the card so only the page is kept
+        hulls = ocr.get_quadrilaterals_from_mask(
+            mask, 1000, 0.01, verbose=False, fallback="hull"
+        )
+        assert len(hulls) == 1 and hulls[0].reshape((4, 2))[:, 0].min() == 50
+
+    def test_nothing_found_gives_an_empty_list(self):
+        mask = np.zeros((100, 100), np.uint8)
+        assert ocr.get_quadrilaterals_from_mask(mask, 1000, 0.02) == []
 
 
 class TestOrderQuadrilateral:
@@ -87,6 +175,16 @@ class TestOrderQuadrilateral:
         assert (expected_quad == ocr.order_quadrilateral(quad=quad_in)).all()
 
 
+class TestScaleQuadrilateral:
+    """Test class for ocr.scale_quadrilateral"""
+
+    def test_correct_scaling(self):
+        quad = np.array([[[0, 0]], [[10, 0]], [[0, 5]], [[10, 5]]], np.int32)
+        expected = np.array([[[0, 0]], [[25, 0]], [[0, 12]], [[25, 12]]])
+        scaled = ocr.scale_quadrilateral(quad, 2.5)
+        assert scaled.shape == quad.shape and (scaled == expected).all()
+
+
 class TestGetParallelogramDimensions:
     """Test class for ocr.get_parallelogram_dimensions"""
 
@@ -118,13 +216,286 @@ class TestGetParallelogramDimensions:
         assert expected_width == width and expected_height == height
 
 
+class TestOrderQuadrilaterals:
+    """Test class for ocr.order_quadrilaterals"""
+
+    def test_matches_order_quadrilateral(self):
+        quads = np.random.default_rng(0).integers(0, 1000, (50, 4, 1, 2))
+        expected = [ocr.order_quadrilateral(quad) for quad in quads]
+        assert np.array_equal(ocr.order_quadrilaterals(quads), expected)
+
+    def test_empty_batch(self):
+        assert ocr.order_quadrilaterals(np.array([])).shape == (0, 4, 1, 2)
+
+
+class TestGetQuadrilateralDimensions:
+    """Test class for ocr.get_quadrilateral_dimensions"""
+
+    def test_rectangles_match_get_parallelogram_dimensions(self):
+        quads = np.array(
+            [
+                [[0, 0], [300, 0], [0, 100], [300, 100]],
+                [[5, 5], [105, 5], [5, 405], [105, 405]],
+            ]
+        )
+        heights, widths = ocr.get_quadrilateral_dimensions(quads)
+        expected = [ocr.get_parallelogram_dimensions(quad) for quad in quads]
+        assert list(zip(heights, widths)) == expected
+
+    def test_longest_opposite_edges_are_used(self):
+        # a page seen at an angle, its bottom and right edges are the longest
+        quad = np.array([[[0, 0], [100, 10], [0, 200], [150, 230]]])
+        heights, widths = ocr.get_quadrilateral_dimensions(quad)
+        assert heights[0] == int(np.hypot(50, 220))
+        assert widths[0] == int(np.hypot(150, 30))
+
+
+class TestUnwarpTransforms:
+    """Test class for ocr.unwarp_transforms"""
+
+    def test_matches_get_perspective_transform(self):
+        quads = np.array([[[10, 20], [300, 40], [30, 400], [320, 380]]]) + np.arange(
+            0, 30, 10
+        ).reshape((3, 1, 1))
+        transforms, heights, widths = ocr.unwarp_transforms(quads, margin=5)
+        for transform, quad, height, width in zip(transforms, quads, heights, widths):
+            target = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+            expected = cv2.getPerspectiveTransform(np.float32(quad), target - 5)
+            assert np.allclose(transform, expected)
+
+    def test_degenerate_quads_do_not_fail_the_batch(self):
+        quads = np.array(
+            [[[0, 0], [0, 0], [0, 10], [10, 10]], [[0, 0], [10, 0], [0, 10], [10, 10]]]
+        )
+        transforms, _, _ = ocr.unwarp_transforms(quads)
+        assert np.isfinite(transforms).all()
+        assert np.allclose(transforms[1], np.eye(3))
+
+
 class TestUnwarpQuadrilateral:
-    """Test class for ocr.unwarp_quadrilateral (no tests for reason 2 above)"""
+    """Test class for ocr.unwarp_quadrilateral (only the batch logic is tested,
+    for reason 2 above)"""
 
-    pass
+    def test_batch_matches_single_quads(self):
+        image = np.random.default_rng(0).integers(0, 256, (200, 300), np.uint8)
+        quads = np.array(
+            [[[[10, 10]], [[110, 10]], [[10, 60]], [[110, 60]]]]
+        ) + np.array([0, 50, 100]).reshape((3, 1, 1, 1))
+        pages = ocr.unwarp_quadrilateral(image, quads, margin=2)
+        assert len(pages) == 3
+        for page, quad in zip(pages, quads):
+            assert np.array_equal(page, ocr.unwarp_quadrilateral(image, quad, 2))
+
+    def test_single_quad_is_sized_as_in_a_batch(self):
+        image = np.zeros((300, 300, 3), np.uint8)
+        # a page seen at an angle, its edges differ in length
+        quad = np.array([[[10, 10]], [[170, 10]], [[10, 240]], [[170, 245]]])
+        single = ocr.unwarp_quadrilateral(image, quad, margin=0)
+        (batched,) = ocr.unwarp_quadrilateral(image, quad[None], margin=0)
+        assert single.shape == batched.shape == (235, 160, 3)
+
+    @pytest.mark.parametrize("batch", [False, True])
+    def test_no_margin_keeps_the_whole_page(self, batch):
+        image = np.zeros((100, 100), np.uint8)
+        quad = np.array([[[0, 0]], [[50, 0]], [[0, 40]], [[50, 40]]])
+        page = ocr.unwarp_quadrilateral(image, quad[None] if batch else quad, 0)
+        assert (page[0] if batch else page).shape == (40, 50)
+
+
+class TestPageTransform:
+    """ Test class for ocr.page_transform """
+
+    quad = np.array([[[20, 10]], [[220, 30]], [[10, 110]], [[210, 130]]])
+
+    @pytest.mark.parametrize("magnification, scale", [(1, 1), (2, 1), (2, 3)])
+    def test_page_corners_map_onto_the_quad(self, magnification, scale):
+        height, width = ocr.get_parallelogram_dimensions(self.quad.reshape((4, 2)))
+        page_shape = (height, width)
+        ocr_shape = (height * magnification, width * magnification)
+        transform = ocr.page_transform(self.quad, 0, page_shape, ocr_shape, scale)
+        corners = ocr.map_boxes([(0, 0, ocr_shape[1], ocr_shape[0])], transform)
+        assert np.abs(corners[0] - self.quad.reshape((4, 2)) * scale).max() <= 1
+
+    def test_margin_is_added_back(self):
+        page_shape = (80, 180)
+        transform = ocr.page_transform(self.quad, 5, page_shape, page_shape)
+        inside = ocr.map_boxes([(0, 0, 1, 1)], transform)[0][0]
+        outside = ocr.map_boxes([(-5, -5, 1, 1)], transform)[0][0]
+        assert np.array_equal(outside, [20, 10])
+        assert (inside > outside).all()
+
+
+class TestMapBoxes:
+    """ Test class for ocr.map_boxes """
+
+    def test_identity_gives_box_corners(self):
+        corners = ocr.map_boxes([(1, 2, 3, 4)], np.eye(3))
+        assert corners.tolist() == [[[1, 2], [4, 2], [1, 6], [4, 6]]]
+
+    def test_no_boxes(self):
+        assert ocr.map_boxes([], np.eye(3)).shape == (0, 4, 2)
+
+
+class TestLevelLut:
+    """Test class for ocr.level_lut"""
+
+    @pytest.mark.parametrize("contrast, brightness", [(1.3, 10), (0.5, -20), (1, 0)])
+    def test_matches_add_weighted(self, contrast, brightness):
+        image = np.arange(256, dtype=np.uint8).reshape((16, 16))
+        expected = cv2.addWeighted(image, contrast, image, 0, brightness)
+        lut = ocr.level_lut(contrast, brightness)
+        assert np.array_equal(cv2.LUT(image, lut), expected)
+
+
+class TestUnwarpAndLevel:
+    """Test class for ocr.unwarp_and_level"""
+
+    def test_matches_separate_stages(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+        quad = np.array([[[50, 40]], [[350, 60]], [[40, 260]], [[360, 250]]])
+        unwarped = ocr.unwarp_quadrilateral(image, quad, margin=5)
+        grey = cv2.cvtColor(unwarped, cv2.COLOR_BGR2GRAY)
+        expected = cv2.addWeighted(grey, 1.3, grey, 0, 10)
+        output = ocr.unwarp_and_level(
+            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
+            quad,
+            margin=5,
+            lut=ocr.level_lut(1.3, 10),
+        )
+        assert output.shape == expected.shape
+        # greyscaling before rather than after interpolating changes rounding
+        assert np.abs(output.astype(int) - expected).max() <= 3
+
+
+class TestEstimateTextHeight:
+    """Test class for ocr.estimate_text_height"""
+
+    @pytest.mark.parametrize("font_scale", [0.5, 1, 2])
+    def test_height_grows_with_text_size(self, font_scale):
+        image = np.full((400, 800), 240, np.uint8)
+        cv2.putText(
+            image, "Hello world", (10, 200), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 0, 2
+        )
+        # the capitals of this font are roughly 22 pixels tall at scale 1
+        height = ocr.estimate_text_height(image)
+        assert 10 * font_scale < height < 40 * font_scale
+
+    def test_blank_page_has_no_text(self):
+        assert ocr.estimate_text_height(np.full((100, 100), 240, np.uint8)) == 0
+
+
+class TestChooseMagnification:
+    """Test class for ocr.choose_magnification"""
+
+    @pytest.mark.parametrize(
+        "text_height, expected",
+        [
+            # small text is magnified up to the target
+            (10, 3),
+            # large text is left alone
+            (60, 1),
+            # tiny text is capped
+            (2, 4),
+            # no text found is not magnified
+            (0, 1),
+        ],
+    )
+    def test_correct_magnification(self, text_height, expected):
+        assert ocr.choose_magnification(text_height, target_height=30) == expected
+
+    def test_no_text_uses_fallback(self):
+        assert ocr.choose_magnification(0, fallback=2.0) == 2.0
+        # the fallback is only for pages without text
+        assert ocr.choose_magnification(10, fallback=2.0) == 3
+
+
+def make_text_page(paper=230, ink=0, shading=0):
+    """ a greyscale page of text, optionally shaded from left to right """
+    page = np.full((600, 800), paper, np.float32)
+    page += np.linspace(0, shading, 800)[None, :]
+    page = np.clip(page, 0, 255).astype(np.uint8)
+    for row in range(60, 560, 40):
+        cv2.putText(page, "HELLO WORLD", (30, row), cv2.FONT_HERSHEY_SIMPLEX, 1, ink, 2)
+    return cv2.GaussianBlur(page, (3, 3), 0)
+
+
+class TestChooseThreshold:
+    """Test class for ocr.choose_threshold"""
+
+    @pytest.mark.parametrize(
+        "paper, ink, shading, expected",
+        [
+            # clean page
+            (230, 0, 0, "simple"),
+            # slight vignetting
+            (230, 0, -30, "simple"),
+            # under and over exposed
+            (100, 20, 0, "otsu"),
+            (250, 200, 0, "otsu"),
+            # shadow across the page
+            (250, 0, -160, "adaptive"),
+            # blank page
+            (230, 230, 0, "simple"),
+        ],
+    )
+    def test_correct_method(self, paper, ink, shading, expected):
+        assert ocr.choose_threshold(make_text_page(paper, ink, shading)) == expected
+
+    def test_mostly_dark_page_is_adaptive(self):
+        page = make_text_page()
+        page[:, :500] = 30
+        assert ocr.choose_threshold(cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)) == (
+            "adaptive"
+        )
 
 
 class TestImproveImageQuality:
-    """Test class for ocr.improve_image_quality (no tests for reason 3 above)"""
+    """Test class for ocr.improve_image_quality"""
 
-    pass
+    @pytest.mark.parametrize("scale", [1, 2, 1.5])
+    def test_output_is_scaled(self, scale):
+        image = np.full((100, 200, 3), 200, np.uint8)
+        output = ocr.improve_image_quality(image, verbose=False, scale=scale)
+        assert output.shape == (int(100 * scale), int(200 * scale))
+
+    def test_buffers_are_reused(self):
+        image = np.random.default_rng(0).integers(0, 256, (100, 200), np.uint8)
+        buffers = BufferPool()
+        first = ocr.improve_image_quality(image, verbose=False, buffers=buffers)
+        held = buffers.nbytes
+        second = ocr.improve_image_quality(image, verbose=False, buffers=buffers)
+        assert buffers.nbytes == held
+        # the outputs are never the scratch buffers
+        assert first is not second and np.array_equal(first, second)
+        assert np.array_equal(first, ocr.improve_image_quality(image, verbose=False))
+
+    def test_auto_uses_the_chosen_method(self):
+        page = make_text_page(100, 20)
+        auto = ocr.improve_image_quality(page, "auto", verbose=False, scale=1)
+        otsu = ocr.improve_image_quality(page, "otsu", verbose=False, scale=1)
+        assert np.array_equal(auto, otsu)
+
+
+class TestDetectTextRegions:
+    """Test class for ocr.detect_text_regions"""
+
+    def test_finds_blocks_in_reading_order(self):
+        image = np.full((1000, 800), 255, np.uint8)
+        for text, origin in [
+            ("lower block", (50, 500)),
+            ("top block", (50, 100)),
+            ("more lower", (50, 550)),
+        ]:
+            cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+        regions = ocr.detect_text_regions(image)
+        # the two lower lines are close enough to form a single block
+        assert len(regions) == 2
+        assert regions[0][1] < 100 < regions[0][1] + regions[0][3]
+        assert regions[1][1] < 500 and 550 < regions[1][1] + regions[1][3]
+
+    def test_ignores_blank_pages_and_solid_areas(self):
+        image = np.full((500, 500), 255, np.uint8)
+        assert ocr.detect_text_regions(image) == []
+        cv2.rectangle(image, (100, 100), (300, 300), 0, -1)
+        assert ocr.detect_text_regions(image) == []
@@ -0,0 +1,318 @@
+"""Test suite for pipeline.py"""
+import dataclasses
+import cv2
+import numpy as np
+import pytest
+from ocrcode import engines
+from ocrcode import pipeline
+from ocrcode import quality
+
+
+class FakeEngine:
+    """ stands in for tesseract so the pipeline can be tested without it """
+
+    def __init__(self):
+        self.images = []
+
+    def image_to_string(self, image):
+        self.images.append(image)
+        return "text"
+
+
+class FakeDataEngine(FakeEngine):
+    """ a fake engine that also reports a single word covering the ink """
+
+    def image_to_data(self, image):
+        self.images.append(image)
+        ink = cv2.findNonZero(np.uint8(image < 128))
+        if ink is None:
+            return "", []
+        return "text\n", [engines.Word("text", 90.0, cv2.boundingRect(ink))]
+
+
+class DoubtfulEngine(FakeDataEngine):
+    """ a fake engine that is only confident after the first read """
+
+    def image_to_data(self, image):
+        text, words = super().image_to_data(image)
+        confidence = 40.0 if len(self.images) == 1 else 80.0
+        return text, [word._replace(confidence=confidence) for word in words]
+
+
+def ink_box(image):
+    """ x, y, width, height of the "text" drawn by make_document_image """
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.boundingRect(cv2.findNonZero(np.uint8(grey < 20)))
+
+
+def make_document_image():
+    """ a light page with a dark line of "text" on a dark background """
+    image = np.full((600, 800, 3), 40, np.uint8)
+    page = np.array([[150, 100], [650, 120], [630, 500], [170, 480]], np.int32)
+    cv2.fillPoly(image, [page], (230, 230, 230))
+    cv2.putText(image, "HELLO", (250, 300), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+    return image
+
+
+class TestPipelineConfig:
+    """ Test class for pipeline.PipelineConfig """
+
+    def test_config_is_hashable(self):
+        config = pipeline.PipelineConfig()
+        assert hash(config) == hash(pipeline.PipelineConfig())
+
+    def test_config_is_immutable(self):
+        config = pipeline.PipelineConfig()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            config.processing_size = 10
+
+    def test_dict_round_trip(self):
+        config = pipeline.PipelineConfig(
+            processing_blur=3, quality_gate=quality.QualityPolicy(min_sharpness=10)
+        )
+        values = config.to_dict()
+        assert values["quality_gate"]["min_sharpness"] == 10
+        assert pipeline.PipelineConfig.from_dict(values) == config
+
+    def test_from_dict_keeps_defaults(self):
+        config = pipeline.PipelineConfig.from_dict({"epsilon": 0.04})
+        assert config == pipeline.PipelineConfig(epsilon=0.04)
+
+    def test_from_dict_rejects_unknown_fields(self):
+        with pytest.raises(ValueError):
+            pipeline.PipelineConfig.from_dict({"blur": 3})
+
+
+class TestDocumentPipeline:
+    """ Test class for pipeline.DocumentPipeline """
+
+    def test_process_returns_structured_result(self):
+        engine = FakeEngine()
+        document_pipeline = pipeline.DocumentPipeline(engine=engine)
+        result = document_pipeline.process(make_document_image())
+        assert result.text == "text"
+        assert result.quad.shape == (4, 1, 2)
+        assert result.image.ndim == 3
+        assert set(result.timings) == {
+            "scale",
+            "preprocess",
+            "contour",
+            "unwarp",
+            "level",
+            "improve",
+            "ocr",
+        }
+
+    def test_hooks_receive_every_stage(self):
+        received = []
+        document_pipeline = pipeline.DocumentPipeline(
+            engine=FakeEngine(), hooks=[received.append]
+        )
+        result = document_pipeline.process(make_document_image())
+        assert received == result.metrics
+        assert [metrics.stage for metrics in received] == list(result.timings)
+
+    def test_process_finds_the_page(self):
+        document_pipeline = pipeline.DocumentPipeline(engine=FakeEngine())
+        result = document_pipeline.process(make_document_image())
+        # the page corners are scaled from 800 to 1024 pixels wide
+        top_left = result.quad[0][0]
+        assert abs(top_left[0] - 150 * 1.28) < 10
+        assert abs(top_left[1] - 100 * 1.28) < 10
+
+    def test_full_resolution_unwarp_uses_original_coordinates(self):
+        config = pipeline.PipelineConfig(
+            detection_size=512, full_resolution_unwarp=True
+        )
+        engine = FakeEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        top_left = result.quad[0][0]
+        assert abs(top_left[0] - 150) < 10 and abs(top_left[1] - 100) < 10
+        # the page is not magnified as it is already at full resolution
+        assert result.magnification == 1
+        assert engine.images[0].shape == result.image.shape[:2]
+
+    @pytest.mark.parametrize("full_resolution", [False, True])
+    def test_fused_rectification_matches_separate_stages(self, full_resolution):
+        image = make_document_image()
+        separate = pipeline.DocumentPipeline(
+            pipeline.PipelineConfig(full_resolution_unwarp=full_resolution),
+            engine=FakeEngine(),
+        ).process(image)
+        fused = pipeline.DocumentPipeline(
+            pipeline.PipelineConfig(
+                full_resolution_unwarp=full_resolution, fused_rectification=True
+            ),
+            engine=FakeEngine(),
+        ).process(image)
+        assert np.array_equal(fused.quad, separate.quad)
+        # the fused page is greyscale and has no separate level stage
+        assert fused.image.ndim == 2
+        assert "level" not in fused.timings
+        grey = cv2.cvtColor(separate.image, cv2.COLOR_BGR2GRAY)
+        assert fused.image.shape == grey.shape
+        assert np.abs(fused.image.astype(int) - grey).mean() < 2
+
+    def test_adaptive_magnification_is_reported(self):
+        config = pipeline.PipelineConfig(adaptive_magnification=True)
+        engine = FakeEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        assert 1 <= result.magnification <= config.max_magnification
+        assert "magnification" in result.timings
+        # the OCR input is the page scaled by the chosen magnification
+        assert engine.images[0].shape[0] == int(
+            result.image.shape[0] * result.magnification
+        )
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_text_detection_ocrs_only_text_blocks(self, workers):
+        config = pipeline.PipelineConfig(
+            text_detection=True, text_detection_workers=workers
+        )
+        engine = FakeEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        assert len(result.text_regions) == len(engine.images) == 1
+        assert engine.images[0].size < result.image.size
+        assert result.text == "text"
+
+    def test_text_detection_skips_blank_pages(self):
+        config = pipeline.PipelineConfig(text_detection=True)
+        engine = FakeEngine()
+        blank = make_document_image()
+        blank[blank == 0] = 230
+        result = pipeline.DocumentPipeline(config, engine=engine).process(blank)
+        assert result.text == "" and result.text_regions == []
+        assert engine.images == []
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_process_all_finds_every_document(self, workers):
+        image = np.full((600, 1000, 3), 40, np.uint8)
+        for left, width in ((60, 480), (620, 320)):
+            cv2.rectangle(image, (left, 100), (left + width, 500), (230, 230, 230), -1)
+            cv2.putText(
+                image, "HI", (left + 50, 300), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4
+            )
+        config = pipeline.PipelineConfig(document_workers=workers)
+        engine = FakeEngine()
+        results = pipeline.DocumentPipeline(config, engine=engine).process_all(image)
+        assert [result.text for result in results] == ["text", "text"]
+        assert len(engine.images) == 2
+        # largest first, and only the first carries the shared search stages
+        assert results[0].image.shape[1] > results[1].image.shape[1]
+        assert "scale" in results[0].timings and "scale" not in results[1].timings
+        assert "unwarp" in results[1].timings
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {},
+            {"detection_size": 512, "full_resolution_unwarp": True},
+            {"fused_rectification": True, "adaptive_magnification": True},
+            {"text_detection": True},
+        ],
+    )
+    def test_words_are_placed_on_the_original_image(self, options):
+        image = make_document_image()
+        engine = FakeDataEngine()
+        result = pipeline.DocumentPipeline(
+            pipeline.PipelineConfig(**options), engine=engine
+        ).process(image)
+        assert len(engine.images) == 1
+        assert result.confidence == 90.0
+        (word,) = result.words
+        assert word.text == "text" and word.quad.shape == (4, 2)
+        x, y, width, height = ink_box(image)
+        expected = [[x, y], [x + width, y], [x, y + height], [x + width, y + height]]
+        assert np.abs(word.quad - expected).max() < 8
+
+    def test_engines_without_data_give_no_words(self):
+        result = pipeline.DocumentPipeline(engine=FakeEngine()).process(
+            make_document_image()
+        )
+        assert result.words is None and result.confidence is None
+        assert result.page_transform.shape == (3, 3)
+
+    def test_auto_threshold_is_chosen_before_ocr(self):
+        config = pipeline.PipelineConfig(threshold="auto")
+        engine = FakeDataEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        assert result.threshold == "simple"
+        assert "threshold" in result.timings and len(engine.images) == 1
+
+    @pytest.mark.parametrize(
+        "retry_confidence, reads, threshold", [(None, 1, "simple"), (60, 2, "adaptive")]
+    )
+    def test_low_confidence_retries(self, retry_confidence, reads, threshold):
+        config = pipeline.PipelineConfig(retry_confidence=retry_confidence)
+        engine = DoubtfulEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        assert len(engine.images) == reads
+        assert result.threshold == threshold
+        assert ("retry" in result.timings) == (reads > 1)
+        assert result.confidence == (40.0 if reads == 1 else 80.0)
+
+    def test_retries_keep_the_most_confident_read(self):
+        config = pipeline.PipelineConfig(retry_confidence=90)
+        engine = DoubtfulEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        # no read is confident enough so every method is tried
+        assert len(engine.images) == 3
+        assert result.threshold == "adaptive" and result.confidence == 80.0
+
+    @pytest.mark.parametrize(
+        "options", [{}, {"full_resolution_unwarp": True}, {"fused_rectification": True}]
+    )
+    def test_quality_gate_passes_good_pages(self, options):
+        config = pipeline.PipelineConfig(
+            quality_gate=quality.QualityPolicy(), **options
+        )
+        engine = FakeEngine()
+        result = pipeline.DocumentPipeline(config, engine=engine).process(
+            make_document_image()
+        )
+        assert not result.rejected and result.text == "text"
+        assert "quality" in result.timings and result.quality.sharpness > 0
+
+    def test_quality_gate_short_circuits_bad_pages(self):
+        config = pipeline.PipelineConfig(quality_gate=quality.QualityPolicy())
+        engine = FakeEngine()
+        blurred = cv2.GaussianBlur(make_document_image(), (9, 9), 0)
+        result = pipeline.DocumentPipeline(config, engine=engine).process(blurred)
+        assert result.rejected and result.quality.reasons == [quality.BLURRED]
+        # nothing after the gate ran
+        assert engine.images == [] and result.image is None and result.text == ""
+        assert "unwarp" not in result.timings and "ocr" not in result.timings
+
+    def test_quality_gate_rejects_missing_pages(self):
+        config = pipeline.PipelineConfig(quality_gate=quality.QualityPolicy())
+        engine = FakeEngine()
+        image = np.full((600, 800, 3), 40, np.uint8)
+        result = pipeline.DocumentPipeline(config, engine=engine).process(image)
+        assert quality.NO_PAGE in result.quality.reasons and engine.images == []
+
+    def test_process_all_with_no_documents(self):
+        image = np.full((600, 800, 3), 40, np.uint8)
+        document_pipeline = pipeline.DocumentPipeline(engine=FakeEngine())
+        assert document_pipeline.process_all(image) == []
+
+    def test_process_many_is_lazy(self):
+        engine = FakeEngine()
+        document_pipeline = pipeline.DocumentPipeline(engine=engine)
+        results = document_pipeline.process_many(
+            make_document_image() for _ in range(3)
+        )
+        next(results)
+        assert len(engine.images) == 1
+        assert len(list(results)) == 2
@@ -0,0 +1,54 @@
+"""Test suite for profiling.py"""
+import json
+import numpy as np
+from ocrcode import profiling
+
+
+class TestStageProfiler:
+    """ Test class for profiling.StageProfiler """
+
+    def test_lap_records_stages_in_order(self):
+        profiler = profiling.StageProfiler()
+        profiler.lap("first")
+        profiler.lap("second")
+        assert [metrics.stage for metrics in profiler.metrics] == ["first", "second"]
+        assert set(profiler.timings) == {"first", "second"}
+
+    def test_lap_records_largest_array(self):
+        profiler = profiling.StageProfiler()
+        metrics = profiler.lap("stage", np.zeros(10, np.uint8), np.zeros(100, np.uint8))
+        assert metrics.output_bytes == 100
+
+    def test_hooks_receive_metrics(self):
+        received = []
+        profiler = profiling.StageProfiler(hooks=[received.append])
+        metrics = profiler.lap("stage")
+        assert received == [metrics]
+
+
+class TestSummarise:
+    """ Test class for profiling.summarise """
+
+    def test_percentiles_per_stage(self):
+        records = [
+            [profiling.StageMetrics("ocr", wall, 0.0, 0)] for wall in range(1, 101)
+        ]
+        summary = profiling.summarise(records)
+        assert summary["ocr"]["count"] == 100
+        assert summary["ocr"]["wall_p50"] == 50.5
+        assert summary["ocr"]["wall_p99"] > summary["ocr"]["wall_p95"]
+
+
+class TestProfileWriter:
+    """ Test class for profiling.ProfileWriter """
+
+    def test_writes_image_lines_then_summary(self, tmp_path):
+        path = str(tmp_path / "profile.jsonl")
+        writer = profiling.ProfileWriter(path)
+        writer.write("a.jpg", [profiling.StageMetrics("ocr", 1.0, 0.5, 10)])
+        writer.close()
+        with open(path) as profile_file:
+            lines = [json.loads(line) for line in profile_file]
+        assert [line["type"] for line in lines] == ["image", "summary"]
+        assert lines[0]["stages"][0]["cpu"] == 0.5
+        assert lines[1]["stages"]["ocr"]["count"] == 1
@@ -0,0 +1,91 @@
+"""Test suite for quality.py"""
+import cv2
+import numpy as np
+import pytest
+from ocrcode import quality
+from test.pipeline_test import make_document_image
+
+# the page drawn by make_document_image, ordered tl, tr, bl, br
+PAGE = np.array([[[150, 100]], [[650, 120]], [[170, 480]], [[630, 500]]])
+
+
+class TestMeasureSharpness:
+    """ Test class for quality.measure_sharpness """
+
+    def test_blur_lowers_sharpness(self):
+        grey = cv2.cvtColor(make_document_image(), cv2.COLOR_BGR2GRAY)
+        blurred = cv2.GaussianBlur(grey, (15, 15), 0)
+        assert quality.measure_sharpness(blurred, PAGE) < quality.measure_sharpness(
+            grey, PAGE
+        )
+
+    def test_page_outside_the_image(self):
+        grey = np.zeros((100, 100), np.uint8)
+        quad = np.array([[200, 200], [300, 200], [200, 300], [300, 300]])
+        assert quality.measure_sharpness(grey, quad) == 0
+
+
+class TestCornerAngles:
+    """ Test class for quality.corner_angles """
+
+    def test_rectangle(self):
+        quad = np.array([[0, 0], [100, 0], [0, 50], [100, 50]])
+        assert np.allclose(quality.corner_angles(quad), 90)
+
+    def test_angles_sum_to_a_full_turn(self):
+        assert quality.corner_angles(PAGE).sum() == pytest.approx(360)
+
+
+class TestAssessQuality:
+    """ Test class for quality.assess_quality """
+
+    def test_good_page_passes(self):
+        report = quality.assess_quality(make_document_image(), PAGE)
+        assert report.passed and report.reasons == []
+        assert report.convex
+        assert 80 < report.min_corner_angle <= report.max_corner_angle < 100
+        assert report.area_fraction == pytest.approx(0.38, abs=0.01)
+
+    def test_accepts_greyscale(self):
+        grey = cv2.cvtColor(make_document_image(), cv2.COLOR_BGR2GRAY)
+        assert quality.assess_quality(grey, PAGE).passed
+
+    def test_no_page(self):
+        report = quality.assess_quality(
+            make_document_image(), quality.PLACEHOLDER_QUAD.reshape((4, 1, 2))
+        )
+        assert quality.NO_PAGE in report.reasons
+        assert quality.SMALL_PAGE in report.reasons
+        assert not report.passed
+
+    def test_blurred(self):
+        blurred = cv2.GaussianBlur(make_document_image(), (31, 31), 0)
+        assert quality.assess_quality(blurred, PAGE).reasons == [quality.BLURRED]
+
+    @pytest.mark.parametrize(
+        "level, reason", [(0, quality.UNDEREXPOSED), (255, quality.OVEREXPOSED)]
+    )
+    def test_clipped(self, level, reason):
+        image = make_document_image()
+        image[150:450, 200:600] = level
+        cv2.putText(image, "HELLO", (250, 300), cv2.FONT_HERSHEY_SIMPLEX, 2, 128, 4)
+        report = quality.assess_quality(image, PAGE)
+        assert report.reasons == [reason]
+
+    def test_bow_tie_is_not_convex(self):
+        # top right and bottom right swapped
+        quad = PAGE[[0, 3, 2, 1]]
+        report = quality.assess_quality(make_document_image(), quad)
+        assert quality.NOT_CONVEX in report.reasons
+        assert not report.convex
+
+    def test_skewed_corners(self):
+        quad = np.array([[[150, 100]], [[650, 100]], [[550, 400]], [[750, 400]]])
+        report = quality.assess_quality(make_document_image(), quad)
+        assert quality.SKEWED_CORNERS in report.reasons
+        assert report.min_corner_angle < 45
+
+    def test_policy_is_configurable(self):
+        policy = quality.QualityPolicy(min_sharpness=1e9)
+        report = quality.assess_quality(make_document_image(), PAGE, policy)
+        assert report.reasons == [quality.BLURRED]
@@ -0,0 +1,142 @@
+"""Test suite for server.py"""
+import asyncio
+import json
+import threading
+import cv2
+import pytest
+from ocrcode import server
+from ocrcode.pipeline import DocumentPipeline
+from test.pipeline_test import FakeEngine, make_document_image
+
+
+class SlowEngine(FakeEngine):
+    """ an engine that blocks until released, to fill up the server """
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def image_to_string(self, image):
+        self.release.wait(5)
+        return super().image_to_string(image)
+
+
+async def request(port, method, path, body=b""):
+    """ send a request to the test server and parse the response """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def run_with_server(ocr_server, client):
+    """ start the server on a free port and run the client coroutine on it """
+
+    async def run():
+        listener = await ocr_server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            return await client(port)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        ocr_server.close()
+
+
+def encoded_document():
+    return cv2.imencode(".png", make_document_image())[1].tobytes()
+
+
+class TestOCRServer:
+    """ Test class for server.OCRServer """
+
+    def test_ocr_returns_text_and_quad(self):
+        ocr_server = server.OCRServer(DocumentPipeline(engine=FakeEngine()))
+        status, payload = run_with_server(
+            ocr_server, lambda port: request(port, "POST", "/ocr", encoded_document())
+        )
+        assert status == 200
+        assert payload["text"] == "text" and len(payload["quad"]) == 4
+        assert ocr_server.counters["completed"] == 1
+
+    @pytest.mark.parametrize(
+        "method, path, body, expected",
+        [
+            ("GET", "/health", b"", 200),
+            ("GET", "/metrics", b"", 200),
+            ("GET", "/missing", b"", 404),
+            ("GET", "/ocr", b"", 405),
+            ("POST", "/ocr", b"not an image", 415),
+        ],
+    )
+    def test_status_codes(self, method, path, body, expected):
+        ocr_server = server.OCRServer(DocumentPipeline(engine=FakeEngine()))
+        status, _ = run_with_server(
+            ocr_server, lambda port: request(port, method, path, body)
+        )
+        assert status == expected
+
+    def test_rejects_requests_beyond_max_pending(self):
+        engine = SlowEngine()
+        ocr_server = server.OCRServer(DocumentPipeline(engine=engine), max_pending=1)
+
+        async def client(port):
+            first = asyncio.ensure_future(
+                request(port, "POST", "/ocr", encoded_document())
+            )
+            while ocr_server.pending == 0:
+                await asyncio.sleep(0.01)
+            second = await request(port, "POST", "/ocr", encoded_document())
+            engine.release.set()
+            return await first, second
+
+        first, second = run_with_server(ocr_server, client)
+        assert first[0] == 200 and second[0] == 503
+        assert ocr_server.counters["rejected"] == 1
+
+    def test_times_out_slow_requests(self):
+        engine = SlowEngine()
+        ocr_server = server.OCRServer(DocumentPipeline(engine=engine), timeout=0.2)
+
+        async def client(port):
+            response = await request(port, "POST", "/ocr", encoded_document())
+            engine.release.set()
+            return response
+
+        status, _ = run_with_server(ocr_server, client)
+        assert status == 504 and ocr_server.counters["timeouts"] == 1
+
+    def test_timed_out_requests_hold_their_slot_until_ocr_ends(self):
+        engine = SlowEngine()
+        ocr_server = server.OCRServer(
+            DocumentPipeline(engine=engine), max_pending=1, timeout=0.2
+        )
+
+        async def client(port):
+            timed_out = await request(port, "POST", "/ocr", encoded_document())
+            # tesseract is still running on the timed out image
+            busy = await request(port, "POST", "/ocr", encoded_document())
+            engine.release.set()
+            while ocr_server.pending:
+                await asyncio.sleep(0.01)
+            served = await request(port, "POST", "/ocr", encoded_document())
+            return timed_out[0], busy[0], served[0]
+
+        assert run_with_server(ocr_server, client) == (504, 503, 200)
+        assert ocr_server.counters["rejected"] == 1
+
+    def test_rejects_large_uploads(self):
+        ocr_server = server.OCRServer(
+            DocumentPipeline(engine=FakeEngine()), max_body=10
+        )
+        status, _ = run_with_server(
+            ocr_server, lambda port: request(port, "POST", "/ocr", b"x" * 11)
+        )
+        assert status == 413
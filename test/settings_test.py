@@ -0,0 +1,225 @@
+"""Test suite for settings.py"""
+import json
+import pytest
+from ocrcode import settings
+from ocrcode.pipeline import PipelineConfig
+from ocrcode.quality import QualityPolicy
+
+
+def write_settings(tmp_path, name, text):
+    """ write a settings file, returning its path """
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+class TestSettings:
+    """ Test class for settings.Settings """
+
+    def test_dict_is_flat_and_round_trips(self):
+        values = settings.Settings(
+            pipeline=PipelineConfig(processing_size=512), workers=4
+        ).to_dict()
+        assert values["processing_size"] == 512 and values["workers"] == 4
+        assert "pipeline" not in values
+        assert settings.Settings.from_dict(values) == settings.Settings(
+            pipeline=PipelineConfig(processing_size=512), workers=4
+        )
+
+    def test_unknown_names_raise(self):
+        with pytest.raises(ValueError):
+            settings.Settings.from_dict({"blur": 3})
+
+
+class TestReadSettingsFile:
+    """ Test class for settings.read_settings_file """
+
+    @pytest.mark.parametrize(
+        "name, text",
+        [
+            (
+                "run.toml",
+                'preset = "fast"\nworkers = 4\n[quality_gate]\nmin_sharpness = 20\n',
+            ),
+            (
+                "run.yaml",
+                "preset: fast\nworkers: 4\nquality_gate:\n  min_sharpness: 20\n",
+            ),
+            (
+                "run.json",
+                json.dumps(
+                    {
+                        "preset": "fast",
+                        "workers": 4,
+                        "quality_gate": {"min_sharpness": 20},
+                    }
+                ),
+            ),
+        ],
+    )
+    def test_formats(self, tmp_path, name, text):
+        if name.endswith(".yaml"):
+            pytest.importorskip("yaml")
+        values = settings.read_settings_file(write_settings(tmp_path, name, text))
+        assert values == {
+            "preset": "fast",
+            "workers": 4,
+            "quality_gate": {"min_sharpness": 20},
+        }
+
+    def test_empty_yaml(self, tmp_path):
+        pytest.importorskip("yaml")
+        assert settings.read_settings_file(write_settings(tmp_path, "a.yml", "")) == {}
+
+    @pytest.mark.parametrize("name, text", [("run.ini", "a=1"), ("run.json", "[1]")])
+    def test_bad_files_raise(self, tmp_path, name, text):
+        with pytest.raises(ValueError):
+            settings.read_settings_file(write_settings(tmp_path, name, text))
+
+
+class TestParseOverride:
+    """ Test class for settings.parse_override """
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            ("processing_size=768", ("processing_size", 768)),
+            ("epsilon=0.03", ("epsilon", 0.03)),
+            ("fused_rectification=true", ("fused_rectification", True)),
+            ("retry_confidence=null", ("retry_confidence", None)),
+            ("threshold=otsu", ("threshold", "otsu")),
+            (" cache_dir = a=b", ("cache_dir", " a=b")),
+        ],
+    )
+    def test_values(self, text, expected):
+        assert settings.parse_override(text) == expected
+
+    @pytest.mark.parametrize("text", ["processing_size", "=3"])
+    def test_missing_name_or_value_raises(self, text):
+        with pytest.raises(ValueError):
+            settings.parse_override(text)
+
+
+class TestValidateSettings:
+    """ Test class for settings.validate_settings """
+
+    def test_defaults_are_valid(self):
+        default = settings.Settings()
+        assert settings.validate_settings(default) is default
+
+    @pytest.mark.parametrize(
+        "values",
+        [
+            {"processing_blur": 4},
+            {"processing_size": 0},
+            {"processing_size": "1024"},
+            {"processing_size": 512.0},
+            {"text_detection": 1},
+            {"epsilon": 1.5},
+            {"threshold": "mean"},
+            {"engine": "easyocr"},
+            {"contour_fallback": "box"},
+            {"retry_confidence": 120},
+            {"contrast": None},
+            {"workers": -1},
+            {"batch_size": True},
+            {"output_format": "csv"},
+            {"dedup_distance": 65},
+        ],
+    )
+    def test_invalid_values_raise(self, values):
+        with pytest.raises(ValueError, match=list(values)[0]):
+            settings.validate_settings(settings.Settings.from_dict(values))
+
+    def test_every_problem_is_reported(self):
+        invalid = settings.Settings.from_dict({"kernel_size": 0, "workers": -1})
+        with pytest.raises(ValueError, match="workers.*; kernel_size"):
+            settings.validate_settings(invalid)
+
+    @pytest.mark.parametrize(
+        "values",
+        [
+            # ints are accepted for floats
+            {"contrast": 2, "retry_confidence": 50},
+            {"max_documents": None, "detection_size": 512},
+            {"contour_fallback": "hull", "output_format": "sqlite"},
+            {"quality_gate": {"min_sharpness": 10}},
+        ],
+    )
+    def test_valid_values(self, values):
+        settings.validate_settings(settings.Settings.from_dict(values))
+
+    @pytest.mark.parametrize("preset", list(settings.PRESETS))
+    def test_presets_are_valid(self, preset):
+        settings.load_settings(preset=preset)
+
+
+class TestLoadSettings:
+    """ Test class for settings.load_settings """
+
+    def test_defaults(self):
+        assert settings.load_settings() == settings.Settings()
+
+    def test_base(self):
+        base = settings.Settings(pipeline=PipelineConfig(contrast=1.5), workers=3)
+        assert settings.load_settings(base=base) == base
+
+    def test_layers(self, tmp_path):
+        path = write_settings(
+            tmp_path,
+            "run.toml",
+            'preset = "fast"\nthreshold = "otsu"\nworkers = 2\nepsilon = 0.03\n',
+        )
+        loaded = settings.load_settings(
+            path, overrides={"workers": 4, "quality_gate": QualityPolicy()}
+        )
+        # the preset, then the file, then the overrides
+        assert (
+            loaded.pipeline.processing_size
+            == settings.PRESETS["fast"]["processing_size"]
+        )
+        assert loaded.pipeline.threshold == "otsu"
+        assert loaded.pipeline.epsilon == 0.03
+        assert loaded.workers == 4
+        assert loaded.pipeline.quality_gate == QualityPolicy()
+
+    def test_preset_argument_replaces_the_files(self, tmp_path):
+        path = write_settings(tmp_path, "run.json", '{"preset": "fast"}')
+        loaded = settings.load_settings(path, preset="accurate")
+        assert loaded.pipeline.threshold == "auto"
+        assert loaded.pipeline.processing_size == PipelineConfig().processing_size
+
+    def test_file_quality_gate(self, tmp_path):
+        path = write_settings(
+            tmp_path, "run.toml", "[quality_gate]\nmin_sharpness = 20\n"
+        )
+        loaded = settings.load_settings(path)
+        assert loaded.pipeline.quality_gate == QualityPolicy(min_sharpness=20)
+
+    def test_unknown_preset_raises(self):
+        with pytest.raises(ValueError):
+            settings.load_settings(preset="slow")
+
+    def test_invalid_file_raises(self, tmp_path):
+        path = write_settings(tmp_path, "run.toml", "processing_blur = 4\n")
+        with pytest.raises(ValueError):
+            settings.load_settings(path)
+
+
+class TestDefaultTesseract:
+    """ Test class for settings.default_tesseract """
+
+    @pytest.mark.parametrize(
+        "on_path, installed, expected",
+        [
+            (True, True, None),
+            (False, True, settings.WINDOWS_TESSERACT),
+            (False, False, None),
+        ],
+    )
+    def test_location(self, monkeypatch, on_path, installed, expected):
+        monkeypatch.setattr(
+            settings.shutil, "which", lambda name: "/bin/tesseract" if on_path else None
+        )
+        monkeypatch.setattr(settings.os.path, "isfile", lambda path: installed)
+        assert settings.default_tesseract() == expected
@@ -0,0 +1,153 @@
+"""Test suite for sinks.py"""
+import base64
+import json
+import sqlite3
+import cv2
+import numpy as np
+import pytest
+from ocrcode import sinks
+from ocrcode.engines import Word
+from ocrcode.pipeline import Result
+from ocrcode.quality import QualityReport
+
+
+def make_result(text="text"):
+    """ a small result with an image """
+    return Result(
+        text=text,
+        quad=np.array([[[0, 0]], [[10, 0]], [[0, 10]], [[10, 10]]], np.int32),
+        image=np.full((8, 8), 200, np.uint8),
+        timings={"ocr": 0.5},
+        magnification=2.0,
+    )
+
+
+class TestMakeRecord:
+    """ Test class for sinks.make_record """
+
+    def test_record_fields(self):
+        record = sinks.make_record("a.png", make_result())
+        assert record["quad"] == [[0, 0], [10, 0], [0, 10], [10, 10]]
+        assert record["timings"] == {"ocr": 0.5} and record["image"] is None
+        assert record["duplicate_of"] is None
+        json.dumps(record)
+
+    def test_words_have_their_corners(self):
+        result = make_result()
+        assert sinks.make_record("a.png", result)["words"] is None
+        result.words = [
+            Word("text", 90.0, (1, 2, 3, 4), np.array([[1, 2], [4, 2], [1, 6], [4, 6]]))
+        ]
+        (word,) = sinks.make_record("a.png", result)["words"]
+        assert word == {
+            "text": "text",
+            "confidence": 90.0,
+            "quad": [[1, 2], [4, 2], [1, 6], [4, 6]],
+        }
+
+    def test_quality_report_is_kept(self):
+        result = make_result()
+        assert sinks.make_record("a.png", result)["quality"] is None
+        result.quality = QualityReport(5.0, 0.0, 0.0, 0.5, True, 88, 92, ["blurred"])
+        record = sinks.make_record("a.png", result)
+        assert record["quality"]["sharpness"] == 5.0
+        assert json.loads(json.dumps(record))["quality"]["reasons"] == ["blurred"]
+
+    def test_image_is_png_encoded(self):
+        record = sinks.make_record("a.png", make_result(), images=True)
+        image = cv2.imdecode(np.frombuffer(record["image"], np.uint8), 0)
+        assert image.shape == (8, 8) and image.mean() == 200
+
+
+class TestSink:
+    """ Test class for sinks.Sink """
+
+    def test_subclasses_must_write_and_close(self):
+        class WriteOnlySink(sinks.Sink):
+            """ a sink that forgot _close """
+
+            def _write_batch(self, records):
+                pass
+
+        with pytest.raises(TypeError):
+            WriteOnlySink()
+        with pytest.raises(TypeError):
+            sinks.Sink()
+
+
+class TestJsonlSink:
+    """ Test class for sinks.JsonlSink """
+
+    def test_records_are_written_in_batches(self, tmp_path):
+        path = tmp_path / "out.jsonl"
+        sink = sinks.JsonlSink(str(path), batch_size=2)
+        sink.write("a", make_result("a"))
+        assert path.read_text() == ""
+        sink.write("b", make_result("b"))
+        assert len(path.read_text().splitlines()) == 2
+        sink.write("c", make_result("c"))
+        sink.close()
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["text"] for line in lines] == ["a", "b", "c"]
+        assert "image" not in lines[0]
+
+    def test_images_are_base64_encoded(self, tmp_path):
+        path = tmp_path / "out.jsonl"
+        with sinks.JsonlSink(str(path), images=True) as sink:
+            sink.write("a", make_result())
+        record = json.loads(path.read_text())
+        assert base64.b64decode(record["image"]).startswith(b"\x89PNG")
+
+
+class TestSqliteSink:
+    """ Test class for sinks.SqliteSink """
+
+    def test_rows_are_committed_per_batch(self, tmp_path):
+        path = str(tmp_path / "out.db")
+        sink = sinks.SqliteSink(path, batch_size=2, images=True)
+        for name in "abc":
+            sink.write(name, make_result(name))
+        # a second connection only sees committed batches
+        rows = sqlite3.connect(path).execute("SELECT name FROM results").fetchall()
+        assert rows == [("a",), ("b",)]
+        sink.close()
+        rows = sqlite3.connect(path).execute("SELECT * FROM results").fetchall()
+        assert [row[0] for row in rows] == ["a", "b", "c"]
+        assert json.loads(rows[0][2])[3] == [10, 10]
+        assert rows[0][10].startswith(b"\x89PNG")
+
+
+class TestParquetSink:
+    """ Test class for sinks.ParquetSink """
+
+    def test_one_row_group_per_batch(self, tmp_path):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        path = str(tmp_path / "out.parquet")
+        with sinks.ParquetSink(path, batch_size=2) as sink:
+            for name in "abc":
+                sink.write(name, make_result(name))
+        parquet_file = parquet.ParquetFile(path)
+        assert parquet_file.num_row_groups == 2
+        assert parquet_file.read().column("name").to_pylist() == ["a", "b", "c"]
+
+
+class TestOpenSink:
+    """ Test class for sinks.open_sink """
+
+    @pytest.mark.parametrize(
+        "name, expected", [("out.jsonl", sinks.JsonlSink), ("out.db", sinks.SqliteSink)]
+    )
+    def test_format_from_extension(self, tmp_path, name, expected):
+        sink = sinks.open_sink(str(tmp_path / name))
+        assert isinstance(sink, expected)
+        sink.close()
+
+    def test_explicit_format_wins(self, tmp_path):
+        sink = sinks.open_sink(str(tmp_path / "out.txt"), "jsonl")
+        assert isinstance(sink, sinks.JsonlSink)
+        sink.close()
+
+    @pytest.mark.parametrize("name, sink", [("out.txt", None), ("out.db", "csv")])
+    def test_unknown_format_raises(self, tmp_path, name, sink):
+        with pytest.raises(ValueError):
+            sinks.open_sink(str(tmp_path / name), sink)
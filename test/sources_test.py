@@ -0,0 +1,135 @@
+"""Test suite for sources.py"""
+import subprocess
+import sys
+import cv2
+import numpy as np
+import pytest
+from mock import patch
+from ocrcode import batch
+from ocrcode import sources
+
+
+def make_pages(count):
+    """ pages of different greys so they can be told apart """
+    return [np.full((40, 60, 3), 50 * number, np.uint8) for number in range(count)]
+
+
+class TestPage:
+    """ Test class for sources.Page """
+
+    def test_single_pages_keep_their_names(self):
+        page = sources.Page("a.png")
+        assert str(page) == "a.png" and page.suffix == ""
+
+    def test_pages_of_documents_are_numbered(self):
+        page = sources.Page("a.tif", 2, 5)
+        assert str(page) == "a.tif [page 2/5]" and page.suffix == "_page2"
+
+
+class TestIsDocument:
+    """ Test class for sources.is_document """
+
+    @pytest.mark.parametrize(
+        "path, expected",
+        [("a.tif", True), ("a.TIFF", True), ("a.pdf", True), ("a.png", False)],
+    )
+    def test_multi_page_formats(self, path, expected):
+        assert sources.is_document(path) == expected
+
+
+class TestIterPages:
+    """ Test class for sources.iter_pages """
+
+    def test_documents_are_split_into_pages(self, tmp_path):
+        tiff = str(tmp_path / "a.tif")
+        cv2.imwritemulti(tiff, make_pages(3))
+        pages = list(sources.iter_pages([tiff, "b.png"]))
+        assert pages == [
+            sources.Page(tiff, 1, 3),
+            sources.Page(tiff, 2, 3),
+            sources.Page(tiff, 3, 3),
+            sources.Page("b.png", 1, 1),
+        ]
+
+    def test_pages_are_counted_lazily(self):
+        with patch("ocrcode.sources.page_count", return_value=2) as mock_count:
+            pages = sources.iter_pages(["a.tif", "b.tif"])
+            next(pages)
+            assert mock_count.call_count == 1
+
+    @patch.dict(sys.modules, {"fitz": None})
+    @patch("shutil.which", return_value="/usr/bin/pdfinfo")
+    @patch(
+        "subprocess.run",
+        side_effect=subprocess.CalledProcessError(1, ["pdfinfo", "bad.pdf"]),
+    )
+    def test_uncountable_documents_give_one_page(self, *_):
+        pages = list(sources.iter_pages(["bad.pdf", "b.png"]))
+        assert pages == [sources.Page("bad.pdf", 1, 0), sources.Page("b.png", 1, 1)]
+
+    @pytest.mark.parametrize("which", [None, "/usr/bin/pdfinfo"])
+    def test_bad_documents_do_not_stop_a_batch(self, tmp_path, which):
+        bad = tmp_path / "bad.pdf"
+        bad.write_bytes(b"not a pdf")
+        tiff = str(tmp_path / "a.tif")
+        cv2.imwritemulti(tiff, make_pages(2))
+        with patch.dict(sys.modules, {"fitz": None}), patch(
+            "shutil.which", return_value=which
+        ), patch(
+            "subprocess.run",
+            side_effect=subprocess.CalledProcessError(1, ["pdfinfo", str(bad)]),
+        ):
+            results = list(
+                batch.run_batch(sources.read_page, sources.iter_pages([str(bad), tiff]))
+            )
+        assert [result.error is None for result in results] == [False, True, True]
+        assert results[1].value.mean() == 0 and results[2].value.mean() == 50
+
+
+class TestReadPage:
+    """ Test class for sources.read_page """
+
+    def test_reads_the_requested_tiff_page(self, tmp_path):
+        tiff = str(tmp_path / "a.tif")
+        cv2.imwritemulti(tiff, make_pages(3))
+        image = sources.read_page(sources.Page(tiff, 3, 3))
+        assert image.shape == (40, 60, 3) and image.mean() == 100
+
+    def test_older_opencv_without_page_ranges(self, tmp_path, monkeypatch):
+        tiff = str(tmp_path / "a.tif")
+        cv2.imwritemulti(tiff, make_pages(3))
+        read_all = cv2.imreadmulti
+
+        def imreadmulti(path, flags=cv2.IMREAD_ANYCOLOR, **range_arguments):
+            if range_arguments:
+                raise TypeError("imreadmulti() takes no start or count")
+            return read_all(path, flags=flags)
+
+        monkeypatch.delattr(sources.cv2, "imcount", raising=False)
+        monkeypatch.setattr(sources.cv2, "imreadmulti", imreadmulti)
+        assert sources.page_count(tiff) == 3
+        image = sources.read_page(sources.Page(tiff, 2, 3))
+        assert image.shape == (40, 60, 3) and image.mean() == 50
+
+    def test_missing_page_raises(self, tmp_path):
+        tiff = str(tmp_path / "a.tif")
+        cv2.imwritemulti(tiff, make_pages(1))
+        with pytest.raises(IOError):
+            sources.read_page(sources.Page(tiff, 2, 2))
+
+    @patch.dict(sys.modules, {"fitz": None})
+    @patch("shutil.which", return_value="/usr/bin/pdftoppm")
+    @patch("subprocess.run")
+    def test_pdf_pages_fall_back_to_pdftoppm(self, mock_run, _):
+        png = cv2.imencode(".png", make_pages(2)[1])[1].tobytes()
+        mock_run.return_value = subprocess.CompletedProcess([], 0, stdout=png)
+        image = sources.read_page(sources.Page("a.pdf", 4, 9))
+        assert image.mean() == 50
+        command = mock_run.call_args[0][0]
+        assert command[command.index("-f") + 1] == "4"
+
+    @patch.dict(sys.modules, {"fitz": None})
+    @patch("shutil.which", return_value=None)
+    def test_pdf_without_a_rasteriser_raises(self, _):
+        with pytest.raises(ImportError):
+            sources.read_page(sources.Page("a.pdf", 1, 1))
@@ -0,0 +1,183 @@
+"""Test suite for tuning.py"""
+import json
+import cv2
+import numpy as np
+import pytest
+from ocrcode import tuning
+from ocrcode.pipeline import PipelineConfig
+from test.pipeline_test import FakeDataEngine, make_document_image
+
+# the page drawn by make_document_image
+PAGE = [[150, 100], [650, 120], [630, 500], [170, 480]]
+
+
+def write_sample(tmp_path, name="page", text=None, corners=None):
+    """ save the test document with its labels, returning the image path """
+    path = str(tmp_path / f"{name}.png")
+    cv2.imwrite(path, make_document_image())
+    if text is not None:
+        (tmp_path / f"{name}.txt").write_text(text)
+    if corners is not None:
+        (tmp_path / f"{name}.json").write_text(json.dumps({"corners": corners}))
+    return path
+
+
+class TestLoadSamples:
+    """ Test class for tuning.load_samples """
+
+    def test_reads_text_and_corners(self, tmp_path):
+        path = write_sample(tmp_path, text="text\n", corners=PAGE)
+        (sample,) = tuning.load_samples([path])
+        assert sample.path == path and sample.text == "text\n"
+        assert sample.corners.shape == (4, 2)
+
+    def test_unlabelled_images_are_skipped(self, tmp_path):
+        labelled = write_sample(tmp_path, "a", text="text")
+        unlabelled = write_sample(tmp_path, "b")
+        assert [
+            sample.path for sample in tuning.load_samples([labelled, unlabelled])
+        ] == [labelled]
+
+    def test_no_labels_raises(self, tmp_path):
+        with pytest.raises(ValueError):
+            tuning.load_samples([write_sample(tmp_path)])
+
+    def test_bad_corners_raise(self, tmp_path):
+        with pytest.raises(ValueError):
+            tuning.load_samples([write_sample(tmp_path, corners=PAGE[:3])])
+
+
+class TestMakeTrials:
+    """ Test class for tuning.make_trials """
+
+    def test_baseline_comes_first(self):
+        base = PipelineConfig()
+        trials = tuning.make_trials(count=20, base=base)
+        assert len(trials) == 20
+        assert trials[0] == {name: getattr(base, name) for name in tuning.SEARCH_SPACE}
+        assert len({tuple(trial.values()) for trial in trials}) == 20
+
+    def test_same_seed_same_trials(self):
+        assert tuning.make_trials(count=10, seed=1) == tuning.make_trials(
+            count=10, seed=1
+        )
+
+    @pytest.mark.parametrize("count", [0, -1])
+    def test_counts_below_one_raise(self, count):
+        with pytest.raises(ValueError):
+            tuning.make_trials(count=count)
+
+    @pytest.mark.parametrize("count", [None, 100])
+    def test_small_spaces_are_tried_in_full(self, count):
+        space = {"processing_blur": (3, 5, 7), "epsilon": (0.01, 0.02)}
+        trials = tuning.make_trials(space, count=count)
+        assert len(trials) == 6
+        assert trials[0] == {"processing_blur": 5, "epsilon": 0.02}
+
+
+class TestCharacterAccuracy:
+    """ Test class for tuning.character_accuracy """
+
+    @pytest.mark.parametrize(
+        "text, truth, accuracy",
+        [
+            ("hello world", "hello world", 1.0),
+            ("hello\n world \n", "hello world", 1.0),
+            ("hallo world", "hello world", 1 - 1 / 11),
+            ("", "hello", 0.0),
+            ("far too much text", "hi", 0.0),
+            ("", "", 1.0),
+        ],
+    )
+    def test_accuracy(self, text, truth, accuracy):
+        assert tuning.character_accuracy(text, truth) == pytest.approx(accuracy)
+
+
+class TestQuadOverlap:
+    """ Test class for tuning.quad_overlap """
+
+    def test_same_page_in_any_order(self):
+        corners = np.float32(PAGE)
+        quad = corners[[1, 3, 0, 2]].reshape((4, 1, 2))
+        assert tuning.quad_overlap(quad, corners) == pytest.approx(1)
+
+    def test_half_overlap(self):
+        quad = np.float32([[0, 0], [100, 0], [0, 100], [100, 100]]).reshape((4, 1, 2))
+        corners = np.float32([[0, 0], [100, 0], [100, 50], [0, 50]])
+        assert tuning.quad_overlap(quad, corners) == pytest.approx(0.5)
+
+
+class TestParetoFront:
+    """ Test class for tuning.pareto_front and tuning.choose_trial """
+
+    TRIALS = [
+        tuning.Trial({"name": "slow"}, 0.9, 2.0),
+        tuning.Trial({"name": "fast"}, 0.5, 1.0),
+        tuning.Trial({"name": "beaten"}, 0.4, 1.5),
+        tuning.Trial({"name": "best"}, 1.0, 3.0),
+    ]
+
+    def test_front(self):
+        front = tuning.pareto_front(self.TRIALS)
+        assert [trial.parameters["name"] for trial in front] == [
+            "fast",
+            "slow",
+            "best",
+        ]
+
+    @pytest.mark.parametrize(
+        "max_seconds, name", [(None, "best"), (2.5, "slow"), (0.5, "fast")]
+    )
+    def test_choose_within_budget(self, max_seconds, name):
+        front = tuning.pareto_front(self.TRIALS)
+        assert tuning.choose_trial(front, max_seconds).parameters["name"] == name
+
+
+class TestEvaluateSample:
+    """ Test class for tuning.evaluate_sample """
+
+    def test_scores_each_trial(self, tmp_path):
+        path = write_sample(tmp_path, text="text", corners=PAGE)
+        (sample,) = tuning.load_samples([path])
+        trials = [
+            {"contrast": 1.0, "epsilon": 0.02},
+            {"contrast": 1.3, "epsilon": 0.02},
+            # a minimum area larger than the image finds no page
+            {"contrast": 1.0, "min_area": 10 ** 7},
+        ]
+        engine = FakeDataEngine()
+        outcomes = tuning.evaluate_sample(sample, trials, engine=engine)
+        assert outcomes[0][0] > 0.95 and outcomes[1][0] > 0.95
+        assert outcomes[2][0] < 0.5
+        assert all(seconds > 0 for _, seconds in outcomes)
+        # one read per levelling of the page found, the warm up reads nothing
+        assert len(engine.images) == 2
+
+    def test_corners_only_samples_are_not_ocred(self, tmp_path):
+        (sample,) = tuning.load_samples([write_sample(tmp_path, corners=PAGE)])
+        engine = FakeDataEngine()
+        (outcome,) = tuning.evaluate_sample(sample, [{}], engine=engine)
+        assert outcome[0] > 0.95 and engine.images == []
+
+
+class TestTune:
+    """ Test class for tuning.tune """
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_averages_over_samples(self, tmp_path, workers):
+        samples = tuning.load_samples(
+            [
+                write_sample(tmp_path, "a", corners=PAGE),
+                write_sample(tmp_path, "b", corners=[[0, 0], [1, 0], [1, 1], [0, 1]]),
+            ]
+        )
+        trials = tuning.make_trials({"epsilon": (0.01, 0.02)}, count=None)
+        results = tuning.tune(samples, trials, workers=workers)
+        assert [result.parameters for result in results] == trials
+        # one sample matches the page found, the other cannot
+        assert all(0.45 < result.accuracy < 0.55 for result in results)
+
+    def test_unreadable_sample_raises(self, tmp_path):
+        sample = tuning.Sample(str(tmp_path / "missing.png"), text="text")
+        with pytest.raises(RuntimeError):
+            tuning.tune([sample], [{}], PipelineConfig())